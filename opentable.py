@@ -0,0 +1,290 @@
+"""
+OpenTable Command Line
+======================
+Single entry point for the scrapers, parser and store
+Each subcommand imports only what it needs, so short jobs such as parsing
+one saved page start without loading curl-cffi, requests or BeautifulSoup
+Usage: python opentable.py fetch https://www.opentable.ca/toronto-ontario-restaurants [-o page.html] [--archive archive/]
+       python opentable.py crawl --max 50 [--advanced [--parse-cache parse-cache/] | --stream] [-o toronto_restaurants.csv] [--db restaurants.db] [--archive archive/]
+       python opentable.py crawl --advanced --pipeline [--stage parse=4:process ...] --max 500
+       python opentable.py crawl --max 5000 --memory-limit 512 [--trace-memory]
+       python opentable.py parse opentable_response.html [-o parsed.csv] [--db restaurants.db] [--parse-cache parse-cache/]
+       python opentable.py parse --archive archive/ [-o parsed.csv] [--parse-cache parse-cache/]
+       python opentable.py photos opentable_response.html [--archive archive/] --dir photos/ [--size medium ...] [--workers 8]
+       python opentable.py export --db restaurants.db -o restaurants.csv [--cuisine Italian]
+       python opentable.py recrawl --state recrawl.db --budget 600 [--seed URL ...] [--duration 3600] [--uniform]
+"""
+
+import argparse
+import sys
+
+
+def make_parse_cache(args):
+    """ParseCache for --parse-cache, or None"""
+    if not getattr(args, 'parse_cache', None):
+        return None
+    from opentable_parsecache import ParseCache
+    return ParseCache(args.parse_cache)
+
+
+def make_scraper(args):
+    """Basic or curl-cffi scraper, archiving responses when --archive was given"""
+    archive = None
+    if args.archive:
+        from opentable_archive import ArchiveWriter
+        archive = ArchiveWriter(args.archive)
+    
+    watchdog = None
+    if getattr(args, 'memory_limit', None) or getattr(args, 'trace_memory', False):
+        from opentable_memory import MemoryWatchdog
+        watchdog = MemoryWatchdog(rss_limit_mb=args.memory_limit, trace=args.trace_memory)
+    
+    if args.advanced:
+        from opentable_advanced_scraper import AdvancedOpenTableScraper
+        return AdvancedOpenTableScraper(archive=archive, parse_cache=make_parse_cache(args), watchdog=watchdog)
+    from opentable_scraper import OpenTableScraper
+    return OpenTableScraper(archive=archive, streaming=getattr(args, 'stream', False), watchdog=watchdog)
+
+
+def cmd_fetch(args):
+    """Download one page to a file"""
+    scraper = make_scraper(args)
+    try:
+        response = scraper.fetch_page(args.url)
+    finally:
+        if scraper.archive is not None:
+            scraper.archive.close()
+    
+    if args.output:
+        with open(args.output, 'wb') as file:
+            file.write(response.content)
+        print(f"Saved {len(response.content):,} bytes to {args.output}")
+
+
+def cmd_crawl(args):
+    """Crawl Toronto listings into a CSV file and optionally the store"""
+    scraper = make_scraper(args)
+    pipelined = args.pipeline
+    if scraper.watchdog is not None:
+        scraper.watchdog.start()
+    try:
+        if pipelined:
+            # The write stage streams rows to the CSV while the crawl runs
+            scraper.scrape_toronto_restaurants_pipelined(max_restaurants=args.max, output=args.output,
+                                                         stages=args.stages)
+        elif args.advanced:
+            scraper.scrape_toronto_restaurants(max_restaurants=args.max)
+        else:
+            scraper.scrape_restaurants(max_restaurants=args.max)
+    finally:
+        if scraper.archive is not None:
+            scraper.archive.close()
+        if scraper.watchdog is not None:
+            if args.trace_memory:
+                print("Top allocation sites since the crawl started:")
+                scraper.watchdog.report()
+            scraper.watchdog.stop()
+    
+    if not pipelined:
+        scraper.save_to_csv(args.output)
+    save_to_store(args.db, scraper.restaurants)
+    scraper.print_summary()
+
+
+def check_crawl_options(parser, args):
+    """Reject crawl options that only one of the scrapers understands, instead of silently ignoring them"""
+    if args.advanced:
+        if args.stream:
+            parser.error("crawl: --stream is only supported by the basic scraper, not with --advanced")
+    else:
+        for option, given in (('--pipeline', args.pipeline), ('--parse-cache', args.parse_cache),
+                              ('--stage', args.stage)):
+            if given:
+                parser.error(f"crawl: {option} requires --advanced")
+    if args.stage and not args.pipeline:
+        parser.error("crawl: --stage requires --pipeline")
+    args.stages = parse_stages(parser, args.stage) if args.stage else {}
+
+
+def parse_stages(parser, specs):
+    """{'parse': (4, 'process')} from --stage values such as 'parse=4:process' or 'enrich=8'"""
+    from opentable_advanced_scraper import PIPELINE_EXECUTORS, PIPELINE_STAGES
+    
+    stages = {}
+    for spec in specs or ():
+        name, _, setting = spec.partition('=')
+        workers, _, executor = setting.partition(':')
+        if name not in PIPELINE_STAGES or not workers.isdigit() or int(workers) < 1:
+            parser.error(f"crawl: --stage expects NAME=WORKERS[:EXECUTOR] with NAME one of "
+                         f"{', '.join(PIPELINE_STAGES)}, got {spec!r}")
+        executor = executor or PIPELINE_STAGES[name][1]
+        if executor not in PIPELINE_EXECUTORS[name]:
+            parser.error(f"crawl: the {name} stage runs under {' or '.join(PIPELINE_EXECUTORS[name])}, "
+                         f"not {executor!r}")
+        stages[name] = (int(workers), executor)
+    return stages
+
+
+def cmd_parse(args):
+    """Parse a saved listing page or archive into a CSV file and optionally the store"""
+    from opentable_parser import OpenTableDocumentParser
+    
+    parser = OpenTableDocumentParser(cache=make_parse_cache(args))
+    if args.archive:
+        parser.parse_archive(args.archive)
+    else:
+        parser.parse_html_file(args.file)
+    if args.output:
+        parser.save_to_csv(args.output)
+    save_to_store(args.db, parser.restaurants)
+    if not args.quiet:
+        parser.print_summary()
+
+
+def cmd_photos(args):
+    """Download the photos of the restaurants on saved listing pages"""
+    from opentable_media import PhotoHarvester
+    from opentable_parser import OpenTableDocumentParser
+    
+    parser = OpenTableDocumentParser()
+    if args.archive:
+        parser.parse_archive(args.archive)
+    else:
+        parser.parse_html_file(args.file)
+    
+    with PhotoHarvester(args.dir, sizes=args.size or ['medium'], workers=args.workers) as harvester:
+        harvester.harvest(parser.restaurants)
+        print(f"Photos: {harvester.summary()}")
+
+
+def cmd_export(args):
+    """Write stored restaurants to CSV"""
+    import csv
+    from opentable_storage import RestaurantStore
+    
+    with RestaurantStore(args.db) as store:
+        if args.cuisine or args.metro:
+            restaurants = store.find(cuisine=args.cuisine, metro_id=args.metro, limit=-1)
+        else:
+            restaurants = store.iter_all()
+        
+        count = 0
+        with open(args.output, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['name', 'url', 'phone', 'cuisine'], extrasaction='ignore')
+            writer.writeheader()
+            for restaurant in restaurants:
+                writer.writerow(restaurant)
+                count += 1
+    
+    print(f"Exported {count} restaurants to {args.output}")
+
+
+def cmd_recrawl(args):
+    """Keep seed listings and the restaurants they link to fresh within a request budget"""
+    from opentable_recrawl import RecrawlDaemon, RevisitScheduler, url_kind
+    
+    policy = 'uniform' if args.uniform else 'adaptive'
+    with RevisitScheduler(args.state, requests_per_hour=args.budget, policy=policy) as scheduler:
+        for url in args.seed:
+            scheduler.add(url, url_kind(url))
+        print(f"Tracking {len(scheduler)} URLs at up to {args.budget} requests/hour ({policy})")
+        try:
+            RecrawlDaemon(scheduler).run(duration=args.duration)
+        finally:
+            print(scheduler.summary())
+
+
+def save_to_store(db_path, restaurants):
+    """Upsert restaurants into the SQLite store when a --db path was given"""
+    if not db_path or not restaurants:
+        return
+    from opentable_storage import RestaurantStore
+    with RestaurantStore(db_path) as store:
+        store.upsert_many(restaurants)
+        print(f"Store {db_path} now holds {store.count()} restaurants")
+
+
+def build_parser():
+    """Argument parser for all subcommands"""
+    parser = argparse.ArgumentParser(prog='opentable', description="OpenTable restaurant scraping tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    fetch_parser = subparsers.add_parser('fetch', help="Download a single page")
+    fetch_parser.add_argument('url')
+    fetch_parser.add_argument('-o', '--output', help="File to save the body to")
+    fetch_parser.add_argument('--advanced', action='store_true', help="Use the curl-cffi scraper")
+    fetch_parser.add_argument('--archive', help="Append the response to this archive directory")
+    fetch_parser.set_defaults(handler=cmd_fetch)
+    
+    crawl_parser = subparsers.add_parser('crawl', help="Scrape Toronto restaurants")
+    crawl_parser.add_argument('--max', type=int, default=50, help="Maximum restaurants to scrape")
+    crawl_parser.add_argument('--advanced', action='store_true', help="Use the curl-cffi scraper")
+    crawl_parser.add_argument('-o', '--output', default='toronto_restaurants.csv')
+    crawl_parser.add_argument('--stream', action='store_true',
+                              help="Read listing JSON while pages download and stop once it has arrived (basic scraper only)")
+    crawl_parser.add_argument('--db', help="Also upsert into this SQLite store")
+    crawl_parser.add_argument('--archive', help="Append every fetched response to this archive directory")
+    crawl_parser.add_argument('--parse-cache', help="Reuse listing parse results cached in this directory (--advanced only)")
+    crawl_parser.add_argument('--pipeline', action='store_true',
+                              help="Run fetch, parse, enrich and write as concurrent stages (--advanced only)")
+    crawl_parser.add_argument('--stage', action='append', metavar='NAME=WORKERS[:EXECUTOR]',
+                              help="Workers and executor (thread, process, async) for one pipeline stage (--pipeline only)")
+    crawl_parser.add_argument('--memory-limit', type=int, metavar='MB',
+                              help="Pause listing fetches while resident memory is above this")
+    crawl_parser.add_argument('--trace-memory', action='store_true',
+                              help="Trace allocations with tracemalloc and report the top sites")
+    crawl_parser.set_defaults(handler=cmd_crawl)
+    
+    parse_parser = subparsers.add_parser('parse', help="Parse a saved listing page")
+    parse_parser.add_argument('file', nargs='?', default='opentable_response.html')
+    parse_parser.add_argument('--archive', help="Parse every page in this archive directory instead")
+    parse_parser.add_argument('-o', '--output', help="CSV file to write")
+    parse_parser.add_argument('--db', help="Also upsert into this SQLite store")
+    parse_parser.add_argument('--parse-cache', help="Reuse parse results cached in this directory")
+    parse_parser.add_argument('-q', '--quiet', action='store_true', help="Skip the summary")
+    parse_parser.set_defaults(handler=cmd_parse)
+    
+    photos_parser = subparsers.add_parser('photos', help="Download restaurant photos from saved listing pages")
+    photos_parser.add_argument('file', nargs='?', default='opentable_response.html')
+    photos_parser.add_argument('--archive', help="Take restaurants from every page in this archive directory instead")
+    photos_parser.add_argument('--dir', default='photos', help="Photo store directory, holding manifest.json")
+    photos_parser.add_argument('--size', action='append', metavar='SIZE',
+                               help="Thumbnail size to fetch (xsmall, small, legacy, medium, wideMedium); repeatable")
+    photos_parser.add_argument('--workers', type=int, default=8, help="Concurrent downloads")
+    photos_parser.set_defaults(handler=cmd_photos)
+    
+    export_parser = subparsers.add_parser('export', help="Export the store to CSV")
+    export_parser.add_argument('--db', default='restaurants.db', help="SQLite database path")
+    export_parser.add_argument('-o', '--output', default='restaurants.csv')
+    export_parser.add_argument('--cuisine')
+    export_parser.add_argument('--metro', type=int)
+    export_parser.set_defaults(handler=cmd_export)
+    
+    recrawl_parser = subparsers.add_parser('recrawl', help="Revisit pages continuously as they change")
+    recrawl_parser.add_argument('--state', default='recrawl.db', help="SQLite file holding per-URL change history")
+    recrawl_parser.add_argument('--budget', type=int, default=600, help="Requests per hour")
+    recrawl_parser.add_argument('--seed', nargs='+', default=['https://www.opentable.ca/toronto-ontario-restaurants'],
+                                help="Listing or restaurant URLs to start tracking")
+    recrawl_parser.add_argument('--duration', type=float, help="Stop after this many seconds")
+    recrawl_parser.add_argument('--uniform', action='store_true', help="Revisit every URL equally often")
+    recrawl_parser.set_defaults(handler=cmd_recrawl)
+    
+    return parser
+
+
+def main(argv=None):
+    """Dispatch to a subcommand"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'crawl':
+        check_crawl_options(parser, args)
+    try:
+        args.handler(args)
+    except KeyboardInterrupt:
+        print("\nInterrupted by user.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,26 +7,211 @@ Extracts: Name, URL, Phone, and Cuisine
 Outputs: CSV file with the restaurant data
 """
 
-try:
-    from curl_cffi import requests
-    print("Using curl-cffi for enhanced scraping...")
-except ImportError:
-    import requests
-    print("curl-cffi not available, falling back to regular requests...")
-    print("Install curl-cffi with: pip install curl-cffi")
-
-from bs4 import BeautifulSoup
+from opentable_memory import parsed_html
+from opentable_phone import extract_phone
+from opentable_retry import CircuitOpenError, FetchError, Retrier
+from opentable_singleflight import SingleFlight, canonical_url
+import asyncio
 import csv
+import threading
 import re
 import time
 import random
+from functools import lru_cache, partial
 from urllib.parse import urljoin, urlparse
 import json
 
+# Bump whenever extract_restaurants_from_page output changes, so cached parse results are not reused
+PARSER_VERSION = 1
+
+# Stage name -> (workers, executor) for scrape_toronto_restaurants_pipelined
+PIPELINE_STAGES = {
+    'fetch': (4, 'async'),
+    'parse': (2, 'process'),
+    'enrich': (4, 'thread'),
+    'write': (1, 'thread'),
+}
+
+# Executors each stage's function can run under: only fetch has a coroutine
+# variant, and only parse is a picklable module-level function
+PIPELINE_EXECUTORS = {
+    'fetch': ('async', 'thread'),
+    'parse': ('process', 'thread'),
+    'enrich': ('thread',),
+    'write': ('thread',),
+}
+
+# Link extraction patterns, compiled once and applied cheapest-first
+RESTAURANT_HREF = re.compile(r'/r/[\w-]+')
+SKIP_LINK_TEXT = re.compile(
+    r'sign.?in|sign.?up|login|register|about|contact|privacy|terms|help|support|'
+    r'blog|careers|press|home|search|filter|sort|view|more',
+    re.I
+)
+RESTAURANT_WORDS = ('restaurant', 'cafe', 'bistro', 'grill', 'kitchen', 'house', 'bar')
+CUISINE_NEAR_LINK = re.compile(
+    r'(Italian|Chinese|Japanese|Mexican|Indian|French|Thai|Greek|American|Canadian|Korean|'
+    r'Vietnamese|Mediterranean|Steakhouse|Seafood|Pizza|Sushi|Burger|BBQ)',
+    re.I
+)
+
+
+@lru_cache(maxsize=None)
+def load_http_client():
+    """(requests-compatible module, is_curl_cffi), imported once on first use
+
+    curl-cffi takes longer to import than everything else in this module, so
+    jobs that never touch the network don't pay for it
+    """
+    try:
+        from curl_cffi import requests as cf_requests
+        print("Using curl-cffi for enhanced scraping...")
+        return cf_requests, True
+    except ImportError:
+        import requests
+        print("curl-cffi not available, falling back to regular requests...")
+        print("Install curl-cffi with: pip install curl-cffi")
+        return requests, False
+
+
+class PipelineCrawl:
+    """Progress shared by the stages of a pipelined crawl
+    
+    Restaurants are claimed as their page reaches the enrich stage. New
+    pages are only handed to the fetch stage while the pages still in
+    flight, at the largest page size seen so far, would not already fill
+    max_restaurants, so the crawl doesn't fetch far past what it needs.
+    Every page handed out must end in claim() or page_dropped(), including
+    pages whose stage raised, or wait_for_room() waits on it forever
+    """
+    
+    def __init__(self, max_restaurants=None, max_empty_pages=3):
+        self.max_restaurants = max_restaurants
+        self.max_empty_pages = max_empty_pages
+        self.condition = threading.Condition()
+        self.seen = set()
+        self.taken = 0
+        self.pending = 0
+        self.page_size = 0
+        self.empty_pages = {}
+    
+    def full(self):
+        with self.condition:
+            return self.max_restaurants is not None and self.taken >= self.max_restaurants
+    
+    def wait_for_room(self, base_url):
+        """Block until another page of base_url is worth fetching, then count it as pending
+        
+        Returns False once the crawl is full or base_url has had max_empty_pages empty pages
+        """
+        with self.condition:
+            while True:
+                if self.max_restaurants is not None and self.taken >= self.max_restaurants:
+                    return False
+                if self.empty_pages.get(base_url, 0) >= self.max_empty_pages:
+                    return False
+                # Until a page has been seen, any one page might hold everything still wanted
+                page_size = self.page_size or self.max_restaurants
+                if self.max_restaurants is None or self.taken + self.pending * page_size < self.max_restaurants:
+                    self.pending += 1
+                    return True
+                self.condition.wait()
+    
+    def give_up(self, base_url):
+        """Hand out no more pages of base_url"""
+        with self.condition:
+            self.empty_pages[base_url] = self.max_empty_pages
+            self.condition.notify_all()
+    
+    def page_dropped(self, item):
+        """A pending page that will never be claimed; a no-op for a page already settled"""
+        with self.condition:
+            if item['settled']:
+                return
+            item['settled'] = True
+            self.pending -= 1
+            self.condition.notify_all()
+    
+    def claim(self, item):
+        """New restaurants of a pending page, at most as many as are still wanted"""
+        base_url, restaurants = item['base_url'], item['restaurants']
+        with self.condition:
+            item['settled'] = True
+            self.pending -= 1
+            self.condition.notify_all()
+            if not restaurants:
+                self.empty_pages[base_url] = self.empty_pages.get(base_url, 0) + 1
+                return []
+            self.page_size = max(self.page_size, len(restaurants))
+            batch = []
+            for restaurant in restaurants:
+                key = (restaurant['name'], restaurant['url'])
+                if restaurant['name'] and key not in self.seen:
+                    self.seen.add(key)
+                    batch.append(restaurant)
+            if self.max_restaurants is not None:
+                batch = batch[:max(self.max_restaurants - self.taken, 0)]
+            self.taken += len(batch)
+            return batch
+
+
+# One scraper per site in each parse worker process, built on its first page
+_parse_scrapers = {}
+
+
+def parse_listing_item(base_url, item):
+    """Fill in item['restaurants'] from item['content']; the pipeline's parse stage, run in worker processes
+    
+    Items already answered from the parse cache pass through untouched, and
+    the body is dropped so it isn't shipped back to the parent process
+    """
+    if item['restaurants'] is None:
+        scraper = _parse_scrapers.get(base_url)
+        if scraper is None:
+            scraper = _parse_scrapers[base_url] = AdvancedOpenTableScraper()
+            scraper.base_url = base_url
+        try:
+            with parsed_html(item['content']) as soup:
+                item['restaurants'] = scraper.extract_restaurants_from_page(soup)
+            item['parsed'] = True
+        except Exception as e:
+            print(f"Error parsing page {item['page']}: {e}")
+            item['restaurants'] = []
+    item['content'] = None
+    return item
+
+
 class AdvancedOpenTableScraper:
-    def __init__(self):
+    def __init__(self, detail_client=None, archive=None, parse_cache=None, watchdog=None):
         self.base_url = "https://www.opentable.ca"
         self.restaurants = []
+        self.detail_delay = (1, 3)
+        self.page_delay = (3, 6)
+        self.session = None
+        self.async_session = None
+        self.use_cffi = False
+        
+        # Optional RestaurantDetailClient; when set, missing details are fetched
+        # in one batched request per listing page instead of one profile page each
+        self.detail_client = detail_client
+        
+        # Optional ArchiveWriter that keeps every fetched response for re-parsing
+        self.archive = archive
+        
+        # Concurrent fetches of the same page (after URL canonicalization) share one request
+        self.singleflight = SingleFlight()
+        
+        # Retries by failure class, with circuit breakers per URL family
+        self.retrier = Retrier()
+        
+        # Optional ParseCache; listing bodies seen before skip soup building and the strategies
+        self.parse_cache = parse_cache
+        
+        # Pipeline of the last scrape_toronto_restaurants_pipelined run, for its stage statistics
+        self.pipeline = None
+        
+        # Optional MemoryWatchdog; listing fetches pause while memory is over its limit
+        self.watchdog = watchdog
         
         # Enhanced headers based on your working example
         self.headers = {
@@ -48,73 +233,89 @@ class AdvancedOpenTableScraper:
     
     def create_session(self):
         """Create a session with appropriate configuration"""
-        try:
-            # Try to use curl-cffi if available
-            from curl_cffi import requests as cf_requests
-            session = cf_requests.Session()
-            self.use_cffi = True
-            print("Using curl-cffi session")
-        except ImportError:
-            session = requests.Session()
-            self.use_cffi = False
-            print("Using standard requests session")
-        
+        http, self.use_cffi = load_http_client()
+        session = http.Session()
         session.headers.update(self.headers)
         return session
     
-    def fetch_page(self, url, retries=3):
-        """Fetch a page with enhanced bot detection avoidance"""
-        session = self.create_session()
+    def fetch_page(self, url, retries=None):
+        """Fetch a page, sharing the request with concurrent callers for the same URL"""
+        return self.singleflight.do(canonical_url(url), self._fetch_page, url, retries)
+    
+    def _fetch_page(self, url, retries=None):
+        """Fetch a page with enhanced bot detection avoidance
+        
+        Failures are retried as self.retrier's policy for their class says;
+        retries caps the attempts for every class
+        """
+        response = self.retrier.call(url, self.send_request, attempts=retries)
+        print(f"Success! Status: {response.status_code}")
+        if self.archive is not None:
+            self.archive.add_response(response)
+        return response
+    
+    def send_request(self, url):
+        """One GET over the shared session, without raising on HTTP error statuses"""
+        # One session for the whole crawl so connections are reused between pages
+        if self.session is None:
+            self.session = self.create_session()
+        print(f"Fetching: {url}")
+        if self.use_cffi:
+            return self.session.get(
+                url,
+                impersonate="chrome",  # Important for curl-cffi
+                timeout=60,
+                allow_redirects=True,
+            )
+        return self.session.get(url, timeout=30, allow_redirects=True)
+    
+    def fetch_listing_page(self, url):
+        """Restaurants on a listing page, shared with concurrent callers for the same URL
         
-        for attempt in range(retries):
-            try:
-                print(f"Fetching: {url} (attempt {attempt + 1})")
-                
-                if self.use_cffi:
-                    response = session.get(
-                        url,
-                        impersonate="chrome",  # Important for curl-cffi
-                        timeout=60,
-                        allow_redirects=True,
-                    )
-                else:
-                    response = session.get(url, timeout=30, allow_redirects=True)
-                
-                response.raise_for_status()
-                print(f"Success! Status: {response.status_code}")
-                return response
-                
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt < retries - 1:
-                    wait_time = random.uniform(3, 8)
-                    print(f"Waiting {wait_time:.1f} seconds before retry...")
-                    time.sleep(wait_time)
-                else:
-                    raise
+        A page that parses to nothing is retried as an EMPTY failure. The key
+        is kept apart from fetch_page's, whose callers want the response
+        """
+        return self.singleflight.do(('listing', canonical_url(url)), self._fetch_listing_page, url)
+    
+    def _fetch_listing_page(self, url):
+        def accept(response):
+            if self.archive is not None:
+                self.archive.add_response(response)
+            return self.parse_listing_page(response.content)
+        
+        return self.retrier.call(url, self.send_request, accept=accept)
+    
+    async def fetch_page_async(self, url, retries=None):
+        """Fetch a page without blocking the event loop
+        
+        Uses curl-cffi's AsyncSession when it is installed; with plain
+        requests the blocking fetch_page runs on a worker thread instead
+        """
+        http, self.use_cffi = load_http_client()
+        if not self.use_cffi:
+            return await asyncio.to_thread(self.fetch_page, url, retries)
+        
+        if self.async_session is None:
+            self.async_session = http.AsyncSession(headers=self.headers, impersonate="chrome")
+        
+        async def send(url):
+            print(f"Fetching: {url}")
+            return await self.async_session.get(url, timeout=60, allow_redirects=True)
+        
+        response = await self.retrier.call_async(url, send, attempts=retries)
+        if self.archive is not None:
+            self.archive.add_response(response)
+        return response
+    
+    async def close_async_session(self):
+        """Close the AsyncSession opened by fetch_page_async, if any"""
+        if self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
     
     def extract_phone_from_text(self, text):
         """Extract phone number from text using regex"""
-        if not text:
-            return ""
-        
-        # Canadian phone number patterns
-        phone_patterns = [
-            r'\+?1?[-.\s]?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',
-            r'\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',
-            r'([0-9]{3})[-.]([0-9]{3})[-.]([0-9]{4})',
-            r'(\d{3})\s(\d{3})\s(\d{4})'
-        ]
-        
-        for pattern in phone_patterns:
-            match = re.search(pattern, text)
-            if match:
-                if len(match.groups()) == 3:
-                    return f"({match.group(1)}) {match.group(2)}-{match.group(3)}"
-                else:
-                    return match.group(0)
-        
-        return ""
+        return extract_phone(text)
     
     def clean_text(self, text):
         """Clean and normalize text"""
@@ -151,6 +352,22 @@ class AdvancedOpenTableScraper:
         
         return restaurants
     
+    def parse_listing_page(self, content):
+        """Restaurants on a listing page body, from the parse cache when this body was parsed before"""
+        if self.parse_cache is None:
+            with parsed_html(content) as soup:
+                return self.extract_restaurants_from_page(soup)
+        
+        key = self.parse_cache.key(content, f"advanced:{PARSER_VERSION}:{self.base_url}")
+        restaurants = self.parse_cache.get(key)
+        if restaurants is None:
+            with parsed_html(content) as soup:
+                restaurants = self.extract_restaurants_from_page(soup)
+            self.parse_cache.put(key, restaurants)
+        else:
+            print(f"Parse cache hit: {len(restaurants)} restaurants")
+        return restaurants
+    
     def strategy_restaurant_cards(self, soup):
         """Strategy 1: Look for restaurant cards/listings"""
         restaurants = []
@@ -180,33 +397,48 @@ class AdvancedOpenTableScraper:
         
         return restaurants
     
-    def strategy_links_and_scripts(self, soup):
+    def iter_links(self, soup):
+        """Yield (link, href) for every <a href> in document order, lazily"""
+        for element in soup.descendants:
+            if element.name == 'a':
+                href = element.get('href')
+                if href is not None:
+                    yield element, href
+    
+    def strategy_links_and_scripts(self, soup, limit=50):
         """Strategy 2: Look for restaurant links and JSON data"""
         restaurants = []
+        matched = 0
         
-        # Find restaurant links
-        restaurant_links = soup.find_all('a', href=re.compile(r'/r/[\w-]+'))
-        
-        for link in restaurant_links[:50]:  # Limit to avoid too many
+        for link, href in self.iter_links(soup):
+            # Filter on the href before touching the link text
+            if '/r/' not in href or not RESTAURANT_HREF.search(href):
+                continue
+            
+            matched += 1
+            if matched > limit:  # Limit to avoid too many
+                break
+            
             name = self.clean_text(link.get_text())
-            if name and len(name) > 2:  # Basic validation
-                restaurant = {
-                    'name': name,
-                    'url': urljoin(self.base_url, link.get('href', '')),
-                    'phone': '',
-                    'cuisine': ''
-                }
-                
-                # Try to find cuisine and other info near the link
-                parent = link.find_parent()
-                if parent:
-                    # Look for cuisine info
-                    cuisine_text = parent.get_text()
-                    cuisine_match = re.search(r'(Italian|Chinese|Japanese|Mexican|Indian|French|Thai|Greek|American|Canadian|Korean|Vietnamese|Mediterranean|Steakhouse|Seafood|Pizza|Sushi|Burger|BBQ)', cuisine_text, re.I)
-                    if cuisine_match:
-                        restaurant['cuisine'] = cuisine_match.group(1)
-                
-                restaurants.append(restaurant)
+            if not name or len(name) <= 2:  # Basic validation
+                continue
+            url = urljoin(self.base_url, href)
+            
+            restaurant = {
+                'name': name,
+                'url': url,
+                'phone': '',
+                'cuisine': ''
+            }
+            
+            # Try to find cuisine and other info near the link
+            parent = link.find_parent()
+            if parent:
+                cuisine_match = CUISINE_NEAR_LINK.search(parent.get_text())
+                if cuisine_match:
+                    restaurant['cuisine'] = cuisine_match.group(1)
+            
+            restaurants.append(restaurant)
         
         return restaurants
     
@@ -244,52 +476,41 @@ class AdvancedOpenTableScraper:
         
         return restaurants
     
-    def strategy_generic_links(self, soup):
+    def strategy_generic_links(self, soup, limit=50):
         """Strategy 4: Generic approach - find any promising links"""
         restaurants = []
+        seen_names = set()
         
-        # Find all links that might be restaurants
-        all_links = soup.find_all('a', href=True)
-        
-        for link in all_links:
-            href = link.get('href', '')
-            text = self.clean_text(link.get_text())
+        for link, href in self.iter_links(soup):
+            # Look for restaurant-like links; a profile href qualifies before the text is read
+            if '/r/' in href:
+                text = self.clean_text(link.get_text())
+            else:
+                raw_text = link.get_text()
+                lowered = raw_text.lower()
+                if not any(word in lowered for word in RESTAURANT_WORDS):
+                    continue
+                text = self.clean_text(raw_text)
             
-            # Skip if no text or text is too short
-            if not text or len(text) < 3:
+            # Skip if no text, text is too short or already seen
+            if not text or len(text) < 3 or text in seen_names:
                 continue
             
             # Skip navigation/utility links
-            skip_patterns = [
-                r'sign.?in', r'sign.?up', r'login', r'register', r'about', r'contact',
-                r'privacy', r'terms', r'help', r'support', r'blog', r'careers',
-                r'press', r'home', r'search', r'filter', r'sort', r'view', r'more'
-            ]
-            
-            if any(re.search(pattern, text, re.I) for pattern in skip_patterns):
+            if SKIP_LINK_TEXT.search(text):
                 continue
             
-            # Look for restaurant-like links
-            if (re.search(r'/r/', href) or 
-                any(word in text.lower() for word in ['restaurant', 'cafe', 'bistro', 'grill', 'kitchen', 'house', 'bar'])):
-                
-                restaurant = {
-                    'name': text,
-                    'url': urljoin(self.base_url, href) if href else '',
-                    'phone': '',
-                    'cuisine': ''
-                }
-                restaurants.append(restaurant)
-        
-        # Remove duplicates based on name
-        seen_names = set()
-        unique_restaurants = []
-        for restaurant in restaurants:
-            if restaurant['name'] not in seen_names:
-                seen_names.add(restaurant['name'])
-                unique_restaurants.append(restaurant)
+            seen_names.add(text)
+            restaurants.append({
+                'name': text,
+                'url': urljoin(self.base_url, href) if href else '',
+                'phone': '',
+                'cuisine': ''
+            })
+            if len(restaurants) >= limit:  # Limit results
+                break
         
-        return unique_restaurants[:50]  # Limit results
+        return restaurants
     
     def parse_restaurant_card(self, card):
         """Parse individual restaurant card/listing"""
@@ -351,46 +572,45 @@ class AdvancedOpenTableScraper:
     def get_restaurant_details(self, restaurant_url):
         """Get additional details from restaurant page"""
         try:
-            time.sleep(random.uniform(1, 3))  # Be respectful
+            time.sleep(random.uniform(*self.detail_delay))  # Be respectful
             response = self.fetch_page(restaurant_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
             
             details = {'phone': '', 'cuisine': ''}
-            
-            # Look for phone
-            phone_selectors = [
-                'a[href^="tel:"]',
-                '[data-test*="phone"]',
-                '.phone', '.contact',
-                '[class*="phone"]', '[class*="contact"]'
-            ]
-            
-            for selector in phone_selectors:
-                phone_elem = soup.select_one(selector)
-                if phone_elem:
-                    phone_text = phone_elem.get('href', '') + ' ' + phone_elem.get_text()
-                    phone = self.extract_phone_from_text(phone_text)
-                    if phone:
-                        details['phone'] = phone
-                        break
-            
-            # If no phone found, search page text
-            if not details['phone']:
+            with parsed_html(response.content) as soup:
+                # Look for phone
+                phone_selectors = [
+                    'a[href^="tel:"]',
+                    '[data-test*="phone"]',
+                    '.phone', '.contact',
+                    '[class*="phone"]', '[class*="contact"]'
+                ]
+                
+                for selector in phone_selectors:
+                    phone_elem = soup.select_one(selector)
+                    if phone_elem:
+                        phone_text = phone_elem.get('href', '') + ' ' + phone_elem.get_text()
+                        phone = self.extract_phone_from_text(phone_text)
+                        if phone:
+                            details['phone'] = phone
+                            break
+                
+                # If no phone found, search page text
+                if not details['phone']:
+                    page_text = soup.get_text()
+                    details['phone'] = self.extract_phone_from_text(page_text)
+                
+                # Look for cuisine info
+                cuisine_keywords = [
+                    'Italian', 'Chinese', 'Japanese', 'Mexican', 'Indian', 'French', 'Thai', 'Greek',
+                    'American', 'Canadian', 'Korean', 'Vietnamese', 'Mediterranean', 'Steakhouse',
+                    'Seafood', 'Pizza', 'Sushi', 'Burger', 'BBQ', 'Contemporary', 'Modern', 'Traditional'
+                ]
+                
                 page_text = soup.get_text()
-                details['phone'] = self.extract_phone_from_text(page_text)
-            
-            # Look for cuisine info
-            cuisine_keywords = [
-                'Italian', 'Chinese', 'Japanese', 'Mexican', 'Indian', 'French', 'Thai', 'Greek',
-                'American', 'Canadian', 'Korean', 'Vietnamese', 'Mediterranean', 'Steakhouse',
-                'Seafood', 'Pizza', 'Sushi', 'Burger', 'BBQ', 'Contemporary', 'Modern', 'Traditional'
-            ]
-            
-            page_text = soup.get_text()
-            for keyword in cuisine_keywords:
-                if re.search(rf'\b{keyword}\b', page_text, re.I):
-                    details['cuisine'] = keyword
-                    break
+                for keyword in cuisine_keywords:
+                    if re.search(rf'\b{keyword}\b', page_text, re.I):
+                        details['cuisine'] = keyword
+                        break
             
             return details
             
@@ -398,31 +618,43 @@ class AdvancedOpenTableScraper:
             print(f"Error getting details for {restaurant_url}: {e}")
             return {'phone': '', 'cuisine': ''}
     
-    def scrape_toronto_restaurants(self, max_restaurants=50):
-        """Main scraping method for Toronto restaurants"""
-        print("Starting Advanced OpenTable Canada restaurant scraper...")
-        print(f"Target: {max_restaurants} restaurants from Toronto, Ontario")
-        
-        # Multiple URLs to try for Toronto
-        toronto_urls = [
+    def get_toronto_urls(self):
+        """Candidate listing URLs for Toronto, in the order they are tried"""
+        return [
             f"{self.base_url}/toronto-ontario-restaurants",
             f"{self.base_url}/toronto-restaurants",
             f"{self.base_url}/c/toronto",
             f"{self.base_url}/search?location=toronto"
         ]
-        
+    
+    def iter_restaurants(self, max_restaurants=None):
+        """Lazily yield enriched restaurants across all candidate Toronto URLs
+
+        Listing pages and detail pages are only fetched when the consumer asks
+        for the next record, so breaking out of the loop stops the crawl.
+        """
         restaurants_found = 0
+        seen = set()
         
-        for base_url in toronto_urls:
-            if restaurants_found >= max_restaurants:
-                break
+        for base_url in self.get_toronto_urls():
+            if max_restaurants is not None and restaurants_found >= max_restaurants:
+                return
                 
             print(f"\nTrying URL: {base_url}")
             
             page = 1
             consecutive_empty_pages = 0
             
-            while restaurants_found < max_restaurants and consecutive_empty_pages < 3:
+            while consecutive_empty_pages < 3:
+                if max_restaurants is not None and restaurants_found >= max_restaurants:
+                    return
+                
+                if page > 1:
+                    # Be respectful - add delay between pages
+                    time.sleep(random.uniform(*self.page_delay))
+                if self.watchdog is not None:
+                    self.watchdog.throttle()
+                
                 try:
                     # Construct page URL
                     if page == 1:
@@ -432,56 +664,230 @@ class AdvancedOpenTableScraper:
                         current_url = f"{base_url}{separator}page={page}"
                     
                     print(f"\n--- Scraping page {page} ---")
-                    response = self.fetch_page(current_url)
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    # Extract restaurants from this page
-                    page_restaurants = self.extract_restaurants_from_page(soup)
-                    
-                    if not page_restaurants:
-                        consecutive_empty_pages += 1
-                        print(f"No restaurants found on page {page}")
-                    else:
-                        consecutive_empty_pages = 0
-                        print(f"Found {len(page_restaurants)} restaurants on page {page}")
-                        
-                        # Process each restaurant
-                        for restaurant in page_restaurants:
-                            if restaurants_found >= max_restaurants:
-                                break
-                            
-                            if restaurant['name'] and restaurant not in self.restaurants:
-                                # Get additional details if we have a URL
-                                if restaurant['url'] and (not restaurant['phone'] or not restaurant['cuisine']):
-                                    details = self.get_restaurant_details(restaurant['url'])
-                                    if not restaurant['phone'] and details['phone']:
-                                        restaurant['phone'] = details['phone']
-                                    if not restaurant['cuisine'] and details['cuisine']:
-                                        restaurant['cuisine'] = details['cuisine']
-                                
-                                self.restaurants.append(restaurant)
-                                restaurants_found += 1
-                                
-                                print(f"  {restaurants_found}. {restaurant['name']}")
-                                if restaurant['cuisine']:
-                                    print(f"     Cuisine: {restaurant['cuisine']}")
-                                if restaurant['phone']:
-                                    print(f"     Phone: {restaurant['phone']}")
-                    
-                    page += 1
-                    
-                    # Be respectful - add delay between pages
-                    time.sleep(random.uniform(3, 6))
-                    
+                    page_restaurants = self.fetch_listing_page(current_url)
                 except Exception as e:
                     print(f"Error on page {page}: {e}")
-                    consecutive_empty_pages += 1
-                    if consecutive_empty_pages >= 3:
+                    # A 404 or DNS failure won't be different on the next page, and an open breaker means the pattern is dead
+                    if isinstance(e, CircuitOpenError) or (isinstance(e, FetchError) and e.permanent):
+                        print(f"Giving up on {base_url}")
                         break
+                    consecutive_empty_pages += 1
+                    page += 1
+                    continue
+                
+                page += 1
+                
+                if not page_restaurants:
+                    consecutive_empty_pages += 1
+                    print(f"No restaurants found on page {page - 1}")
+                    continue
+                
+                consecutive_empty_pages = 0
+                print(f"Found {len(page_restaurants)} restaurants on page {page - 1}")
+                
+                # Batch the whole page's detail lookups into as few requests as possible
+                if self.detail_client:
+                    batch = []
+                    batch_keys = set(seen)
+                    for restaurant in page_restaurants:
+                        key = (restaurant['name'], restaurant['url'])
+                        if restaurant['name'] and key not in batch_keys:
+                            batch_keys.add(key)
+                            batch.append(restaurant)
+                    if max_restaurants is not None:
+                        batch = batch[:max_restaurants - restaurants_found]
+                    self.detail_client.enrich(batch)
+                
+                # Process each restaurant
+                for restaurant in page_restaurants:
+                    if max_restaurants is not None and restaurants_found >= max_restaurants:
+                        return
+                    
+                    key = (restaurant['name'], restaurant['url'])
+                    if not restaurant['name'] or key in seen:
+                        continue
+                    seen.add(key)
+                    
+                    # Get additional details if we have a URL
+                    if not self.detail_client and restaurant['url'] and (not restaurant['phone'] or not restaurant['cuisine']):
+                        details = self.get_restaurant_details(restaurant['url'])
+                        if not restaurant['phone'] and details['phone']:
+                            restaurant['phone'] = details['phone']
+                        if not restaurant['cuisine'] and details['cuisine']:
+                            restaurant['cuisine'] = details['cuisine']
+                    
+                    restaurants_found += 1
+                    yield restaurant
+    
+    def scrape_toronto_restaurants(self, max_restaurants=50):
+        """Main scraping method for Toronto restaurants"""
+        print("Starting Advanced OpenTable Canada restaurant scraper...")
+        print(f"Target: {max_restaurants} restaurants from Toronto, Ontario")
+        
+        for restaurant in self.iter_restaurants(max_restaurants):
+            self.restaurants.append(restaurant)
+            
+            print(f"  {len(self.restaurants)}. {restaurant['name']}")
+            if restaurant['cuisine']:
+                print(f"     Cuisine: {restaurant['cuisine']}")
+            if restaurant['phone']:
+                print(f"     Phone: {restaurant['phone']}")
+        
+        print(f"\nScraping completed! Found {len(self.restaurants)} restaurants.")
+        return self.restaurants
+    
+    def scrape_toronto_restaurants_pipelined(self, max_restaurants=50, output=None, stages=None):
+        """Scrape Toronto restaurants with fetch, parse, enrich and write running as concurrent stages
+        
+        Finds the same restaurants as scrape_toronto_restaurants, but a slow
+        detail lookup no longer holds up the next listing fetch or the
+        parsing of pages already downloaded. stages overrides PIPELINE_STAGES
+        entries with (workers, executor), the executor one PIPELINE_EXECUTORS
+        allows; rows are appended to the output CSV as they arrive, and stage
+        statistics are kept in self.pipeline
+        """
+        from opentable_pipeline import Pipeline, Stage
+        
+        config = dict(PIPELINE_STAGES, **(stages or {}))
+        crawl = PipelineCrawl(max_restaurants)
+        
+        print("Starting Advanced OpenTable Canada restaurant scraper (pipelined)...")
+        print(f"Target: {max_restaurants} restaurants from Toronto, Ontario")
+        
+        csvfile = writer = None
+        if output:
+            csvfile = open(output, 'w', newline='', encoding='utf-8')
+            writer = csv.DictWriter(csvfile, fieldnames=['name', 'url', 'phone', 'cuisine'])
+            writer.writeheader()
+        
+        def write(restaurant):
+            self.restaurants.append(restaurant)
+            if writer is not None:
+                writer.writerow(restaurant)
+            print(f"  {len(self.restaurants)}. {restaurant['name']}")
+        
+        def stage(name, func, **options):
+            workers, executor = config[name]
+            if executor not in PIPELINE_EXECUTORS[name]:
+                raise ValueError(f"the {name} stage runs under {' or '.join(PIPELINE_EXECUTORS[name])}, not {executor!r}")
+            return Stage(name, func, workers, executor, **options)
+        
+        # A page whose fetch, parse or enrich raises still gives back its pending slot
+        if config['fetch'][1] == 'async':
+            fetch = stage('fetch', partial(self.fetch_listing_item, crawl), finalize=self.close_async_session,
+                          on_error=crawl.page_dropped)
+        else:
+            fetch = stage('fetch', partial(self.fetch_listing_item_sync, crawl), on_error=crawl.page_dropped)
+        self.pipeline = Pipeline([
+            fetch,
+            stage('parse', partial(parse_listing_item, self.base_url), on_error=crawl.page_dropped),
+            stage('enrich', partial(self.enrich_listing_item, crawl), fanout=True, on_error=crawl.page_dropped),
+            stage('write', write, finalize=csvfile.close if csvfile is not None else None),
+        ])
+        self.pipeline.run(self.iter_listing_items(crawl))
         
         print(f"\nScraping completed! Found {len(self.restaurants)} restaurants.")
+        print(self.pipeline.summary())
         return self.restaurants
     
+    def iter_listing_items(self, crawl):
+        """Pipeline items for each page of each candidate listing URL, paced by PipelineCrawl.wait_for_room"""
+        for base_url in self.get_toronto_urls():
+            print(f"\nTrying URL: {base_url}")
+            separator = '&' if '?' in base_url else '?'
+            page = 1
+            while crawl.wait_for_room(base_url):
+                # Holding back the next page lets the stages drain what they already have
+                if self.watchdog is not None:
+                    self.watchdog.throttle()
+                yield {
+                    'base_url': base_url,
+                    'page': page,
+                    'url': base_url if page == 1 else f"{base_url}{separator}page={page}",
+                    'content': None,
+                    'restaurants': None,
+                    'cache_key': None,
+                    'parsed': False,
+                    # Set once the page has been claimed or dropped
+                    'settled': False,
+                }
+                page += 1
+            if crawl.full():
+                return
+    
+    def attach_listing_body(self, item, response):
+        """Put a fetched body on a pipeline item, or its parse result when the parse cache has one"""
+        item['content'] = response.content
+        if self.parse_cache is not None:
+            item['cache_key'] = self.parse_cache.key(response.content, f"advanced:{PARSER_VERSION}:{self.base_url}")
+            cached = self.parse_cache.get(item['cache_key'])
+            if cached is not None:
+                print(f"Parse cache hit: {len(cached)} restaurants")
+                item['restaurants'] = cached
+                item['content'] = None
+        return item
+    
+    async def fetch_listing_item(self, crawl, item):
+        """Fetch stage on the event loop; a page that fails moves on with no restaurants"""
+        if crawl.full():
+            crawl.page_dropped(item)
+            return None
+        if item['page'] > 1:
+            await asyncio.sleep(random.uniform(*self.page_delay))
+        try:
+            response = await self.fetch_page_async(item['url'])
+        except Exception as e:
+            return self.failed_listing_item(crawl, item, e)
+        return self.attach_listing_body(item, response)
+    
+    def fetch_listing_item_sync(self, crawl, item):
+        """Fetch stage for the 'thread' executor"""
+        if crawl.full():
+            crawl.page_dropped(item)
+            return None
+        if item['page'] > 1:
+            time.sleep(random.uniform(*self.page_delay))
+        try:
+            response = self.fetch_page(item['url'])
+        except Exception as e:
+            return self.failed_listing_item(crawl, item, e)
+        return self.attach_listing_body(item, response)
+    
+    def failed_listing_item(self, crawl, item, error):
+        """A listing page that could not be fetched moves on with no restaurants
+        
+        Permanent failures and open breakers also stop further pages of its listing URL
+        """
+        print(f"Error on page {item['page']}: {error}")
+        if isinstance(error, CircuitOpenError) or (isinstance(error, FetchError) and error.permanent):
+            crawl.give_up(item['base_url'])
+        item['restaurants'] = []
+        return item
+    
+    def enrich_listing_item(self, crawl, item):
+        """Enrich stage: a parsed page's new restaurants, up to max_restaurants, with details filled in"""
+        if item['parsed'] and self.parse_cache is not None:
+            self.parse_cache.put(item['cache_key'], item['restaurants'])
+        
+        # Claimed before the slow lookups, so pages enriched in parallel never take the same restaurant
+        batch = crawl.claim(item)
+        if not item['restaurants']:
+            print(f"No restaurants found on page {item['page']}")
+            return None
+        print(f"Found {len(item['restaurants'])} restaurants on page {item['page']}")
+        
+        if self.detail_client:
+            self.detail_client.enrich(batch)
+        else:
+            for restaurant in batch:
+                if restaurant['url'] and (not restaurant['phone'] or not restaurant['cuisine']):
+                    details = self.get_restaurant_details(restaurant['url'])
+                    if not restaurant['phone'] and details['phone']:
+                        restaurant['phone'] = details['phone']
+                    if not restaurant['cuisine'] and details['cuisine']:
+                        restaurant['cuisine'] = details['cuisine']
+        return batch
+    
     def save_to_csv(self, filename="toronto_restaurants_advanced.csv"):
         """Save scraped data to CSV file"""
         if not self.restaurants:
@@ -518,6 +924,8 @@ class AdvancedOpenTableScraper:
     
     def print_summary(self):
         """Print summary of scraped data"""
+        from opentable_analytics import COVERAGE_FIELDS, RestaurantColumns
+        
         if not self.restaurants:
             print("No restaurants scraped!")
             return
@@ -525,23 +933,22 @@ class AdvancedOpenTableScraper:
         print(f"\n=== SCRAPING SUMMARY ===")
         print(f"Total restaurants: {len(self.restaurants)}")
         
-        with_phone = sum(1 for r in self.restaurants if r['phone'])
-        with_cuisine = sum(1 for r in self.restaurants if r['cuisine'])
-        with_url = sum(1 for r in self.restaurants if r['url'])
-        
-        print(f"With phone numbers: {with_phone} ({with_phone/len(self.restaurants)*100:.1f}%)")
-        print(f"With cuisine info: {with_cuisine} ({with_cuisine/len(self.restaurants)*100:.1f}%)")
-        print(f"With URLs: {with_url} ({with_url/len(self.restaurants)*100:.1f}%)")
-        
-        # Cuisine breakdown
-        cuisines = {}
-        for restaurant in self.restaurants:
-            cuisine = restaurant['cuisine'] or 'Unknown'
-            cuisines[cuisine] = cuisines.get(cuisine, 0) + 1
+        report = RestaurantColumns.from_records(self.restaurants).report(top=10)
+        for field, label in COVERAGE_FIELDS[:3]:
+            coverage = report['coverage'][field]
+            print(f"With {label}: {coverage['count']} ({coverage['percent']:.1f}%)")
+        print(f"Page fetches: {self.singleflight.summary()}")
+        print(f"Requests: {self.retrier.summary()}")
+        if self.watchdog is not None:
+            print(f"Memory: {self.watchdog.summary()}")
+        if self.pipeline is not None:
+            print(self.pipeline.summary())
+        if self.parse_cache is not None:
+            print(f"Parse cache: {self.parse_cache.summary()}")
         
         print(f"\n=== CUISINE BREAKDOWN ===")
-        for cuisine, count in sorted(cuisines.items(), key=lambda x: x[1], reverse=True)[:10]:
-            print(f"{cuisine}: {count}")
+        for row in report['distributions']['cuisine']:
+            print(f"{row['value']}: {row['count']}")
         
         print(f"\n=== SAMPLE DATA ===")
         for i, restaurant in enumerate(self.restaurants[:5]):
@@ -0,0 +1,268 @@
+"""
+OpenTable Analytics Report
+==========================
+Coverage, distributions and per-metro rollups over restaurant records, computed on columnar arrays
+Records are read once into NumPy columns: dictionary-encoded int32 codes for
+cuisine, neighborhood, price band and metro, boolean masks for field
+coverage and a float array of ratings. Every statistic is then a bincount or
+masked reduction over those columns instead of another Python pass over the
+dicts, and the per-metro rollups come from single bincounts over combined
+(metro, value) codes. Columns can be saved as .npy files and loaded via mmap,
+so repeated reports over a national store skip the encoding step
+Usage: python opentable_analytics.py [--db restaurants.db | --columns restaurants.columns] [--format markdown|json] [-o report.md]
+       python opentable_analytics.py --db restaurants.db --save-columns restaurants.columns
+"""
+
+import argparse
+import json
+import os
+from itertools import repeat
+
+import numpy as np
+
+
+# Fields whose presence counts as coverage, with the label print_summary uses
+COVERAGE_FIELDS = (
+    ('phone', 'phone numbers'),
+    ('cuisine', 'cuisine info'),
+    ('url', 'URLs'),
+    ('neighborhood', 'neighborhoods'),
+    ('price_band', 'price bands'),
+    ('coordinates', 'coordinates'),
+    ('rating', 'ratings'),
+)
+
+# Dictionary-encoded fields; code 0 is always "missing"
+CATEGORICAL_FIELDS = ('cuisine', 'neighborhood', 'price_band', 'metro_id')
+
+MISSING_LABEL = 'Unknown'
+
+
+def field_values(records, field):
+    """Iterator over record.get(field) that runs entirely in C"""
+    return map(dict.get, records, repeat(field))
+
+
+class Categories(dict):
+    """value -> int code, assigning the next code to unseen values on lookup; None and '' are code 0"""
+    
+    def __init__(self):
+        super().__init__()
+        self.labels = [None]
+        self[None] = self[''] = 0
+    
+    def __missing__(self, value):
+        code = self[value] = len(self.labels)
+        self.labels.append(value)
+        return code
+
+
+class RestaurantColumns:
+    def __init__(self, codes, labels, present, ratings):
+        # {field: int32 codes} and {field: [label per code]} for CATEGORICAL_FIELDS
+        self.codes = codes
+        self.labels = labels
+        # {field: bool mask} for COVERAGE_FIELDS
+        self.present = present
+        # float64, NaN where a restaurant has no rating
+        self.ratings = ratings
+    
+    @classmethod
+    def from_records(cls, restaurants):
+        """Encode restaurant dicts, one C-level pass per column over the list"""
+        records = restaurants if isinstance(restaurants, list) else list(restaurants)
+        count = len(records)
+        
+        codes, labels = {}, {}
+        for field in CATEGORICAL_FIELDS:
+            categories = Categories()
+            values = field_values(records, field)
+            codes[field] = np.fromiter(map(categories.__getitem__, values), dtype=np.int32, count=count)
+            labels[field] = categories.labels
+        
+        present = {}
+        for field, _ in COVERAGE_FIELDS:
+            if field in codes:
+                present[field] = codes[field] != 0
+            elif field == 'coordinates':
+                latitudes = np.fromiter(map(bool, field_values(records, 'latitude')), dtype=bool, count=count)
+                longitudes = np.fromiter(map(bool, field_values(records, 'longitude')), dtype=bool, count=count)
+                present[field] = latitudes & longitudes
+            elif field != 'rating':
+                present[field] = np.fromiter(map(bool, field_values(records, field)), dtype=bool, count=count)
+        
+        # None becomes NaN when converting to float
+        ratings = np.array(list(field_values(records, 'rating')), dtype=np.float64).reshape(count)
+        present['rating'] = ~np.isnan(ratings)
+        return cls(codes, labels, present, ratings)
+    
+    @classmethod
+    def from_store(cls, store):
+        """Encode every restaurant in a RestaurantStore"""
+        return cls.from_records(store.iter_all())
+    
+    def __len__(self):
+        return len(self.ratings)
+    
+    def label(self, field, code):
+        value = self.labels[field][code]
+        return MISSING_LABEL if value is None else value
+    
+    def coverage(self):
+        """{field: restaurants with a value}"""
+        return {field: int(np.count_nonzero(self.present[field])) for field, _ in COVERAGE_FIELDS}
+    
+    def distribution(self, field, top=None):
+        """[(label, count)] of a categorical field, most common first"""
+        counts = np.bincount(self.codes[field], minlength=len(self.labels[field]))
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0][:top]
+        return [(self.label(field, code), int(counts[code])) for code in order.tolist()]
+    
+    def metro_rollups(self, top=None):
+        """Per-metro restaurant counts, coverage, mean rating and most common cuisine and neighborhood"""
+        metros = self.codes['metro_id']
+        nmetros = len(self.labels['metro_id'])
+        totals = np.bincount(metros, minlength=nmetros)
+        
+        coverage = {field: np.bincount(metros, weights=self.present[field], minlength=nmetros)
+                    for field, _ in COVERAGE_FIELDS}
+        rated = self.present['rating']
+        rating_sums = np.bincount(metros[rated], weights=self.ratings[rated], minlength=nmetros)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_ratings = rating_sums / coverage['rating']
+        
+        most_common = {}
+        for field in ('cuisine', 'neighborhood'):
+            # One bincount over metro * ncategories + category, ignoring missing values
+            values = self.codes[field]
+            known = values != 0
+            ncategories = len(self.labels[field])
+            grid = np.bincount(metros[known].astype(np.int64) * ncategories + values[known],
+                               minlength=nmetros * ncategories).reshape(nmetros, ncategories)
+            most_common[field] = (grid.argmax(axis=1), grid.max(axis=1))
+        
+        order = np.argsort(-totals, kind='stable')
+        order = order[totals[order] > 0][:top]
+        rollups = []
+        for metro in order.tolist():
+            total = int(totals[metro])
+            rollup = {
+                'metro_id': self.label('metro_id', metro),
+                'restaurants': total,
+                'coverage': {field: round(100 * float(coverage[field][metro]) / total, 1) for field, _ in COVERAGE_FIELDS},
+                'mean_rating': None if np.isnan(mean_ratings[metro]) else round(float(mean_ratings[metro]), 2),
+            }
+            for field, (codes, counts) in most_common.items():
+                rollup[f"top_{field}"] = self.label(field, int(codes[metro])) if counts[metro] else None
+            rollups.append(rollup)
+        return rollups
+    
+    def report(self, top=10, top_metros=None):
+        """Everything above as one JSON-serializable dict"""
+        total = len(self)
+        
+        def percent(count):
+            return round(100 * count / total, 1) if total else 0.0
+        
+        return {
+            'total': total,
+            'coverage': {field: {'count': count, 'percent': percent(count)}
+                         for field, count in self.coverage().items()},
+            'distributions': {
+                field: [{'value': value, 'count': count, 'percent': percent(count)}
+                        for value, count in self.distribution(field, None if field == 'price_band' else top)]
+                for field in ('cuisine', 'neighborhood', 'price_band')
+            },
+            'metros': self.metro_rollups(top_metros),
+        }
+    
+    def save(self, path):
+        """Write the columns as .npy files plus a JSON file of category labels"""
+        os.makedirs(path, exist_ok=True)
+        for field in CATEGORICAL_FIELDS:
+            np.save(os.path.join(path, f"{field}.npy"), self.codes[field])
+        for field, _ in COVERAGE_FIELDS:
+            if field not in self.codes and field != 'rating':
+                np.save(os.path.join(path, f"has_{field}.npy"), self.present[field])
+        np.save(os.path.join(path, 'ratings.npy'), self.ratings)
+        with open(os.path.join(path, 'labels.json'), 'w', encoding='utf-8') as file:
+            json.dump(self.labels, file)
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load saved columns; with mmap the arrays are paged in on demand"""
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None)
+        
+        with open(os.path.join(path, 'labels.json'), 'r', encoding='utf-8') as file:
+            labels = json.load(file)
+        codes = {field: array(field) for field in CATEGORICAL_FIELDS}
+        ratings = array('ratings')
+        present = {}
+        for field, _ in COVERAGE_FIELDS:
+            if field in codes:
+                present[field] = codes[field] != 0
+            elif field == 'rating':
+                present[field] = ~np.isnan(ratings)
+            else:
+                present[field] = array(f"has_{field}")
+        return cls(codes, labels, present, ratings)
+
+
+def to_markdown(report):
+    """Markdown tables for a report dict"""
+    total = report['total']
+    lines = ["# Restaurant data report", "", f"{total:,} restaurants", "", "## Coverage", "",
+             "| Field | Restaurants | % |", "|---|---:|---:|"]
+    for field, label in COVERAGE_FIELDS:
+        stats = report['coverage'][field]
+        lines.append(f"| {label} | {stats['count']:,} | {stats['percent']:.1f} |")
+    
+    for field, rows in report['distributions'].items():
+        lines += ["", f"## {field.replace('_', ' ').title()}", "", "| Value | Restaurants | % |", "|---|---:|---:|"]
+        lines += [f"| {row['value']} | {row['count']:,} | {row['percent']:.1f} |" for row in rows]
+    
+    lines += ["", "## Metros", "",
+              "| Metro | Restaurants | Phone % | Cuisine % | Mean rating | Top cuisine | Top neighborhood |",
+              "|---|---:|---:|---:|---:|---|---|"]
+    for metro in report['metros']:
+        rating = '' if metro['mean_rating'] is None else f"{metro['mean_rating']:.2f}"
+        lines.append(f"| {metro['metro_id']} | {metro['restaurants']:,} | {metro['coverage']['phone']:.1f} | "
+                     f"{metro['coverage']['cuisine']:.1f} | {rating} | {metro['top_cuisine'] or ''} | "
+                     f"{metro['top_neighborhood'] or ''} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    """Report on the store or on saved columns"""
+    parser = argparse.ArgumentParser(description="OpenTable restaurant analytics report")
+    parser.add_argument('--db', default='restaurants.db', help="SQLite database path")
+    parser.add_argument('--columns', help="Read columns saved with --save-columns instead of the store")
+    parser.add_argument('--save-columns', help="Save the encoded columns to this directory")
+    parser.add_argument('--format', choices=('markdown', 'json'), default='markdown')
+    parser.add_argument('--top', type=int, default=10, help="Rows per cuisine and neighborhood table")
+    parser.add_argument('-o', '--output', help="File to write instead of stdout")
+    args = parser.parse_args()
+    
+    if args.columns:
+        columns = RestaurantColumns.load(args.columns)
+    else:
+        from opentable_storage import RestaurantStore
+        with RestaurantStore(args.db) as store:
+            columns = RestaurantColumns.from_store(store)
+    if args.save_columns:
+        columns.save(args.save_columns)
+    
+    report = columns.report(top=args.top)
+    text = json.dumps(report, indent=2) + "\n" if args.format == 'json' else to_markdown(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Wrote a report on {report['total']:,} restaurants to {args.output}")
+    else:
+        print(text, end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+OpenTable Response Archive
+==========================
+Append-only archive of fetched responses, in the spirit of WARC
+Each response (URL, status, headers, timestamp and body) is compressed as its
+own zstd frame and appended to a segment file; a JSON-lines sidecar index
+records where every frame starts, so any page can be read back without
+decompressing the rest of its segment
+Usage: python opentable_archive.py add archive/ page.html [--url URL]
+       python opentable_archive.py list archive/
+       python opentable_archive.py cat archive/ URL
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+
+import zstandard
+
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".zst"
+INDEX_SUFFIX = ".idx"
+
+
+class ArchivedPage:
+    """One archived response; the body is decompressed on first access"""
+    
+    def __init__(self, reader, entry):
+        self._reader = reader
+        self.entry = entry
+        self.url = entry['url']
+        self.status = entry['status']
+        self.fetched_at = entry['fetched_at']
+        self._record = None
+    
+    def _load(self):
+        if self._record is None:
+            self._record = self._reader.read_record(self.entry)
+        return self._record
+    
+    @property
+    def headers(self):
+        return self._load()[0]['headers']
+    
+    @property
+    def content(self):
+        return self._load()[1]
+    
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+class ArchiveWriter:
+    def __init__(self, directory="archive", level=3, segment_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        
+        # Keep appending to the newest segment from an earlier run until it fills up
+        segments = segment_paths(directory)
+        self.segment_number = segment_number(segments[-1]) if segments else 0
+        self._open_segment()
+        self.stats = {'pages': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    @property
+    def compressor(self):
+        """This thread's ZstdCompressor; zstandard compressors must not be shared between threads"""
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, write_content_size=True)
+        return compressor
+    
+    def _open_segment(self):
+        base = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.segment_number:05d}")
+        self.data_file = open(base + SEGMENT_SUFFIX, 'ab')
+        # A crash mid-write leaves a partial last index line; appending after it would corrupt the next entry
+        drop_partial_line(base + INDEX_SUFFIX)
+        self.index_file = open(base + INDEX_SUFFIX, 'a', encoding='utf-8')
+        self.offset = self.data_file.tell()
+    
+    def close(self):
+        """Flush and close the current segment"""
+        self.data_file.close()
+        self.index_file.close()
+    
+    def add(self, url, content, status=200, headers=None, fetched_at=None):
+        """Append one response body with its metadata, returns its index entry"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        
+        header = json.dumps({
+            'url': url,
+            'status': status,
+            'headers': dict(headers or {}),
+            'fetched_at': fetched_at,
+        }).encode('utf-8')
+        frame = self.compressor.compress(header + b'\n' + content)
+        
+        with self._lock:
+            if self.offset and self.offset + len(frame) > self.segment_bytes:
+                self.close()
+                self.segment_number += 1
+                self._open_segment()
+            
+            entry = {
+                'url': url,
+                'status': status,
+                'fetched_at': fetched_at,
+                'segment': self.segment_number,
+                'offset': self.offset,
+                'length': len(frame),
+                'size': len(content),
+            }
+            # Data goes to disk before its index line, so the index never
+            # points past the end of a segment after a crash
+            self.data_file.write(frame)
+            self.data_file.flush()
+            self.index_file.write(json.dumps(entry) + '\n')
+            self.index_file.flush()
+            self.offset += len(frame)
+            
+            self.stats['pages'] += 1
+            self.stats['raw_bytes'] += len(content)
+            self.stats['stored_bytes'] += len(frame)
+        return entry
+    
+    def add_response(self, response):
+        """Append a requests or curl-cffi response"""
+        return self.add(response.url, response.content, response.status_code, response.headers)
+
+
+class ArchiveReader:
+    def __init__(self, directory="archive"):
+        self.directory = directory
+        self.entries = []
+        for path in segment_paths(directory):
+            index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+            if not os.path.exists(index_path):
+                continue
+            with open(index_path, 'r', encoding='utf-8', errors='replace') as file:
+                for line in file:
+                    if not line.endswith('\n'):  # A torn last line is an unfinished write
+                        continue
+                    try:
+                        self.entries.append(json.loads(line))
+                    except ValueError:
+                        # Left by a crash before the writer learned to truncate torn lines
+                        continue
+        
+        # Latest capture of each URL wins
+        self.by_url = {entry['url']: entry for entry in self.entries}
+        self._files = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __iter__(self):
+        """Every archived page in the order it was written"""
+        for entry in self.entries:
+            yield ArchivedPage(self, entry)
+    
+    @property
+    def decompressor(self):
+        """This thread's ZstdDecompressor, for the same reason as ArchiveWriter.compressor"""
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+    
+    def close(self):
+        """Close open segment files"""
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+    
+    def get(self, url):
+        """Latest archived capture of a URL, or None"""
+        entry = self.by_url.get(url)
+        return ArchivedPage(self, entry) if entry else None
+    
+    def read_record(self, entry):
+        """(metadata, body) for an index entry, reading only its own frame"""
+        # seek and read share the file position, so one reader at a time; os.pread is POSIX-only
+        with self._lock:
+            file = self._files.get(entry['segment'])
+            if file is None:
+                path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{entry['segment']:05d}{SEGMENT_SUFFIX}")
+                file = self._files[entry['segment']] = open(path, 'rb')
+            file.seek(entry['offset'])
+            frame = file.read(entry['length'])
+        record = self.decompressor.decompress(frame)
+        header, _, content = record.partition(b'\n')
+        return json.loads(header), content
+
+
+def drop_partial_line(path):
+    """Truncate a text file after its last newline, removing an unfinished final line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        if not size:
+            return
+        # Index lines are short; read back far enough to find the previous newline
+        position = size
+        while position > 0:
+            start = max(position - 65536, 0)
+            file.seek(start)
+            chunk = file.read(position - start)
+            if position == size and chunk.endswith(b'\n'):
+                return
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                file.truncate(start + newline + 1)
+                return
+            position = start
+        file.truncate(0)
+
+
+def segment_paths(directory):
+    """Segment files of an archive in write order"""
+    return sorted(glob.glob(os.path.join(directory, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")))
+
+
+def segment_number(path):
+    """Number of a segment from its path"""
+    name = os.path.basename(path)
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def archive_size(directory):
+    """Total bytes on disk of an archive's segments and indexes"""
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, f"{SEGMENT_PREFIX}*")))
+
+
+def main():
+    """Add saved pages to an archive, list it, or print one archived page"""
+    parser = argparse.ArgumentParser(description="OpenTable response archive")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    add_parser = subparsers.add_parser('add', help="Archive saved HTML files")
+    add_parser.add_argument('directory')
+    add_parser.add_argument('files', nargs='+')
+    add_parser.add_argument('--url', help="URL to record (defaults to file://<path>)")
+    
+    list_parser = subparsers.add_parser('list', help="List archived pages")
+    list_parser.add_argument('directory')
+    
+    cat_parser = subparsers.add_parser('cat', help="Print an archived page body")
+    cat_parser.add_argument('directory')
+    cat_parser.add_argument('url')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'add':
+        with ArchiveWriter(args.directory) as writer:
+            for path in args.files:
+                with open(path, 'rb') as file:
+                    content = file.read()
+                url = args.url or f"file://{os.path.abspath(path)}"
+                writer.add(url, content, fetched_at=os.path.getmtime(path))
+            print(f"Archived {writer.stats['pages']} pages: {writer.stats['raw_bytes']:,} bytes "
+                  f"stored in {writer.stats['stored_bytes']:,}")
+    
+    elif args.command == 'list':
+        with ArchiveReader(args.directory) as reader:
+            for entry in reader.entries:
+                fetched = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['fetched_at']))
+                print(f"{fetched}  {entry['status']}  {entry['size']:>9,}  {entry['length']:>9,}  {entry['url']}")
+            print(f"\n{len(reader)} pages, {archive_size(args.directory):,} bytes on disk")
+    
+    elif args.command == 'cat':
+        with ArchiveReader(args.directory) as reader:
+            page = reader.get(args.url)
+            if page is None:
+                print(f"{args.url} is not archived")
+                return
+            print(page.text)
+
+
+if __name__ == "__main__":
+    main()
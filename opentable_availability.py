@@ -0,0 +1,265 @@
+"""
+OpenTable Availability Snapshots
+================================
+Batched, concurrent availability lookups using restaurantAvailabilityToken
+Tokens are collected by OpenTableDocumentParser while parsing listing pages
+Results are stored as one 96-bit bitmap per restaurant, date and party size
+(one bit per 15-minute slot of the day) next to the restaurant store
+"""
+
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+
+AVAILABILITY_PATH = "/dapi/fe/gql"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS availability (
+    restaurant_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    party_size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    slots BLOB NOT NULL,
+    PRIMARY KEY (restaurant_id, date, party_size, fetched_at)
+);
+CREATE INDEX IF NOT EXISTS idx_availability_date ON availability (date, party_size);
+"""
+
+
+def time_to_minutes(value):
+    """'19:00' -> 1140"""
+    hours, minutes = value.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def slots_to_bitmap(requested_time, slots):
+    """Fold a list of slot dicts with timeOffsetMinutes into a day bitmap"""
+    base = time_to_minutes(requested_time)
+    bitmap = 0
+    for slot in slots:
+        if not slot.get('isAvailable'):
+            continue
+        minute = base + int(slot.get('timeOffsetMinutes', 0))
+        if 0 <= minute < 24 * 60:
+            bitmap |= 1 << (minute // SLOT_MINUTES)
+    return bitmap
+
+
+def bitmap_to_times(bitmap):
+    """Available slot start times of a bitmap, e.g. ['18:30', '19:00']"""
+    times = []
+    while bitmap:
+        low_bit = bitmap & -bitmap
+        slot = low_bit.bit_length() - 1
+        minute = slot * SLOT_MINUTES
+        times.append(f"{minute // 60:02d}:{minute % 60:02d}")
+        bitmap ^= low_bit
+    return times
+
+
+class BatchSizer:
+    """Adaptive batch size: grow while batches are fast, halve on failure or slowness"""
+    
+    def __init__(self, initial=25, minimum=1, maximum=200, target_latency=1.0):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+    
+    def next_size(self):
+        """Batch size to use for the next request"""
+        with self._lock:
+            return self.size
+    
+    def record_success(self, batch_size, elapsed):
+        """Grow after a fast full batch, shrink after a slow one"""
+        with self._lock:
+            if elapsed > self.target_latency:
+                self.size = max(self.minimum, self.size // 2)
+            elif batch_size >= self.size:
+                self.size = min(self.maximum, self.size + max(1, self.size // 4))
+    
+    def record_failure(self):
+        """Halve the batch size after a failed request"""
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+class AvailabilityStore:
+    def __init__(self, db_path="restaurants.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+    
+    def close(self):
+        """Close the underlying database connection"""
+        self.conn.close()
+    
+    def save(self, snapshots, date, party_size, fetched_at=None):
+        """Store {restaurant_id: bitmap} for one date and party size"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        rows = [
+            (restaurant_id, date, party_size, fetched_at, bitmap.to_bytes(BITMAP_BYTES, 'little'))
+            for restaurant_id, bitmap in snapshots.items()
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO availability VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+    
+    def latest(self, restaurant_id, date, party_size=2):
+        """Most recent bitmap for a restaurant and date, or None"""
+        row = self.conn.execute(
+            "SELECT slots FROM availability WHERE restaurant_id = ? AND date = ? AND party_size = ? "
+            "ORDER BY fetched_at DESC LIMIT 1",
+            (restaurant_id, date, party_size)
+        ).fetchone()
+        return int.from_bytes(row[0], 'little') if row else None
+
+
+class AvailabilityClient:
+    def __init__(self, base_url="https://www.opentable.ca", max_workers=8, sizer=None, headers=None):
+        self.base_url = base_url
+        self.endpoint = base_url + AVAILABILITY_PATH
+        self.max_workers = max_workers
+        self.sizer = sizer or BatchSizer()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.max_attempts = 3
+        self.stats = {'requests': 0, 'failed_batches': 0, 'restaurants': 0}
+        self._stats_lock = threading.Lock()
+    
+    def build_query(self, batch, date, requested_time, party_size):
+        """GraphQL-style availability request for one batch of restaurants"""
+        return {
+            'operationName': 'RestaurantsAvailability',
+            'variables': {
+                'restaurantIds': [restaurant_id for restaurant_id, _ in batch],
+                'restaurantAvailabilityTokens': [token for _, token in batch],
+                'date': date,
+                'time': requested_time,
+                'partySize': party_size,
+                'databaseRegion': 'NA',
+            },
+        }
+    
+    def fetch_batch(self, batch, date, requested_time, party_size):
+        """Query one batch, returns {restaurant_id: bitmap}"""
+        payload = self.build_query(batch, date, requested_time, party_size)
+        params = {'optype': 'query', 'opname': 'RestaurantsAvailability'}
+        
+        start = time.perf_counter()
+        response = self.session.post(self.endpoint, params=params, json=payload, timeout=30)
+        with self._stats_lock:
+            self.stats['requests'] += 1
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        
+        results = {}
+        for item in response.json().get('data', {}).get('availability', []) or []:
+            restaurant_id = item.get('restaurantId')
+            bitmap = 0
+            for day in item.get('availabilityDays', []) or []:
+                if day.get('dayOffset', 0) == 0:
+                    bitmap |= slots_to_bitmap(requested_time, day.get('slots', []) or [])
+            results[restaurant_id] = bitmap
+        
+        self.sizer.record_success(len(batch), elapsed)
+        return results
+    
+    def fetch(self, tokens, date, requested_time="19:00", party_size=2):
+        """Fetch availability for {restaurant_id: token}, returns {restaurant_id: bitmap}"""
+        queue = list(tokens.items())
+        results = {}
+        attempts = Counter()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            
+            while queue or pending:
+                # Keep every worker busy, sizing each batch from the latest feedback
+                while queue and len(pending) < self.max_workers:
+                    size = self.sizer.next_size()
+                    batch, queue = queue[:size], queue[size:]
+                    future = executor.submit(self.fetch_batch, batch, date, requested_time, party_size)
+                    pending[future] = batch
+                
+                future = next(as_completed(pending))
+                batch = pending.pop(future)
+                try:
+                    results.update(future.result())
+                except Exception as e:
+                    # Shrink batches and put the entries back at the front of the queue
+                    self.sizer.record_failure()
+                    self.stats['failed_batches'] += 1
+                    retry = []
+                    for entry in batch:
+                        attempts[entry[0]] += 1
+                        if attempts[entry[0]] < self.max_attempts:
+                            retry.append(entry)
+                        else:
+                            print(f"Availability lookup failed for restaurant {entry[0]}: {e}")
+                    queue[:0] = retry
+        
+        self.stats['restaurants'] += len(results)
+        return results
+    
+    def snapshot(self, parser, store, date=None, requested_time=None, party_size=None):
+        """Fetch and store availability for every token a parser has collected"""
+        context = parser.availability_context
+        date = date or context.get('date') or time.strftime('%Y-%m-%d')
+        requested_time = requested_time or context.get('time') or '19:00'
+        party_size = party_size or context.get('party_size') or 2
+        
+        print(f"Fetching availability for {len(parser.availability_tokens)} restaurants "
+              f"on {date} at {requested_time} for {party_size}")
+        results = self.fetch(parser.availability_tokens, date, requested_time, party_size)
+        store.save(results, date, party_size)
+        print(f"Stored {len(results)} availability snapshots "
+              f"({self.stats['requests']} requests, {self.stats['failed_batches']} failed batches)")
+        return results
+
+
+def main():
+    """Snapshot availability for the restaurants in a saved listing page"""
+    import sys
+    from opentable_parser import OpenTableDocumentParser
+    
+    html_file = sys.argv[1] if len(sys.argv) > 1 else "opentable_response.html"
+    base_url = sys.argv[2] if len(sys.argv) > 2 else "https://www.opentable.ca"
+    
+    parser = OpenTableDocumentParser()
+    parser.parse_html_file(html_file)
+    
+    client = AvailabilityClient(base_url)
+    store = AvailabilityStore()
+    try:
+        results = client.snapshot(parser, store)
+        for restaurant in parser.restaurants[:5]:
+            bitmap = results.get(restaurant['restaurant_id'], 0)
+            print(f"{restaurant['name']}: {', '.join(bitmap_to_times(bitmap)) or 'no availability'}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
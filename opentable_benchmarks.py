@@ -0,0 +1,1477 @@
+"""
+OpenTable Benchmarks
+====================
+Local performance benchmarks for the scraper components
+Uses synthetic restaurant objects shaped like the saved OpenTable page
+Usage: python opentable_benchmarks.py [benchmark ...]
+"""
+
+import html
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+BENCHMARKS = {}
+
+CUISINES = [
+    'Italian', 'Chinese', 'Japanese', 'Mexican', 'Indian', 'French', 'Thai', 'Greek',
+    'American', 'Canadian', 'Korean', 'Vietnamese', 'Mediterranean', 'Steakhouse',
+    'Seafood', 'Pizza', 'Sushi', 'Burger', 'BBQ', 'Contemporary'
+]
+
+NEIGHBORHOODS = [
+    'Little Italy / College St.', 'Yorkville', 'King West', 'Financial District',
+    'Leslieville', 'The Annex', 'Distillery District', 'Queen West', 'Liberty Village',
+    'Chinatown', 'Kensington Market', 'Entertainment District'
+]
+
+WORDS = [
+    'amazing', 'service', 'food', 'pasta', 'wine', 'patio', 'cozy', 'brunch', 'tasting',
+    'menu', 'seasonal', 'cocktails', 'romantic', 'family', 'friendly', 'chef', 'fresh',
+    'oysters', 'steak', 'dessert', 'vibrant', 'quiet', 'historic', 'modern', 'spicy'
+]
+
+
+def benchmark(func):
+    """Register a benchmark function under its name without the bench_ prefix"""
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+
+def synthetic_restaurants(count, seed=0, metros=(74,)):
+    """Build raw restaurant objects with the same shape as lolzViewAll.searchResults"""
+    rng = random.Random(seed)
+    
+    for i in range(count):
+        restaurant_id = 1000000 + i
+        slug = f"restaurant-{restaurant_id}-toronto"
+        photo_id = 50000000 + i
+        photo_path = f"{photo_id % 10}/{photo_id}.jpg"
+        yield {
+            'restaurantId': restaurant_id,
+            'name': f"{rng.choice(WORDS).title()} {rng.choice(CUISINES)} {i}",
+            'coordinates': {
+                'latitude': 43.65 + rng.uniform(-0.15, 0.15),
+                'longitude': -79.38 + rng.uniform(-0.25, 0.25),
+                '__typename': 'GeographicCoordinates'
+            },
+            'metro': {'metroId': rng.choice(metros), '__typename': 'Metro'},
+            'urls': {
+                'profileLink': {'link': f"/r/{slug}", '__typename': 'PageLink'},
+                '__typename': 'RestaurantUrls'
+            },
+            'priceBand': {'priceBandId': rng.randint(1, 4), 'currencySymbol': '$', '__typename': 'PriceBand'},
+            'photos': {
+                'profile': {
+                    size: {
+                        'url': f"https://resizer.otstatic.com/v2/photos/{size}/{photo_path}",
+                        'width': width,
+                        '__typename': 'Thumbnail'
+                    }
+                    for size, width in (('xsmall', 105), ('small', 160), ('medium', 320))
+                },
+                '__typename': 'RestaurantPhotos'
+            },
+            'neighborhood': {'name': rng.choice(NEIGHBORHOODS), '__typename': 'Neighborhood'},
+            'statistics': {
+                'recentReservationCount': rng.randint(0, 200),
+                'reviews': {
+                    'allTimeTextReviewCount': rng.randint(0, 5000),
+                    'ratings': {'overall': {'rating': round(rng.uniform(3.0, 5.0), 1)}}
+                }
+            },
+            'primaryCuisine': {'name': rng.choice(CUISINES), '__typename': 'Cuisine'},
+            'description': ' '.join(rng.choice(WORDS) for _ in range(40)),
+            'topReview': {'highlightedText': ' '.join(rng.choice(WORDS) for _ in range(12))},
+            'features': {'subtype': None, 'inPremiumMarketplace': rng.random() < 0.2},
+            'hasTakeout': rng.random() < 0.5,
+            'contactInformation': {
+                'phoneNumber': f"+1416{rng.randint(2000000, 9999999)}",
+                'formattedPhoneNumber': '',
+                '__typename': 'RestaurantContactInformation'
+            },
+            'deliveryPartners': [],
+            'restaurantAvailabilityToken': f"token-{restaurant_id}",
+            'awards': [],
+            '__typename': 'Restaurant'
+        }
+
+
+def synthetic_records(count, seed=0):
+    """Parsed restaurant records built from synthetic raw objects"""
+    from opentable_parser import OpenTableDocumentParser
+    
+    parser = OpenTableDocumentParser()
+    return [parser.parse_restaurant_data(raw) for raw in synthetic_restaurants(count, seed)]
+
+
+def report(name, count, elapsed, unit='records'):
+    """Print a single benchmark result line"""
+    rate = count / elapsed if elapsed else float('inf')
+    print(f"{name}: {count} {unit} in {elapsed:.3f}s ({rate:,.0f} {unit}/s)")
+
+
+@benchmark
+def bench_storage(count=100000):
+    """SQLite upsert throughput, cold insert and re-upsert of the same keys"""
+    from opentable_storage import RestaurantStore
+    
+    records = synthetic_records(count)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        with RestaurantStore(os.path.join(tmp, 'bench.db')) as store:
+            start = time.perf_counter()
+            store.upsert_many(records)
+            report("storage insert", count, time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            store.upsert_many(records)
+            report("storage re-upsert", count, time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            for record in records[:1000]:
+                store.find(phone=record['phone'])
+            report("storage phone lookup", 1000, time.perf_counter() - start, 'queries')
+            
+            # A phone that does not normalize matches nothing, not every phoneless row
+            store.upsert_many([{'name': 'No Phone Bistro', 'url': '', 'phone': '', 'cuisine': ''}])
+            assert store.find(phone='n/a') == [], "unparseable phone matched phoneless rows"
+            
+            # Scraper CSV rows carry no restaurantId; they must merge into the parser's rows
+            store.upsert_many({'name': r['name'], 'url': r['url'], 'phone': r['phone'], 'cuisine': r['cuisine']}
+                              for r in records)
+            assert store.count() == count + 1, store.count()
+
+
+@benchmark
+def bench_detail_pool(count=50, latency=0.2):
+    """Wall time for 50 restaurants with sequential vs pooled detail fetches"""
+    import contextlib
+    import io
+    from opentable_scraper import OpenTableScraper
+    from opentable_testserver import LocalOpenTableServer
+    
+    restaurants = list(synthetic_restaurants(count))
+    
+    for workers in (1, 4, 8, 16):
+        with LocalOpenTableServer(restaurants, page_size=20, latency=latency) as server:
+            scraper = OpenTableScraper(detail_workers=workers)
+            scraper.base_url = server.base_url
+            scraper.detail_delay = (0, 0)
+            scraper.page_delay = (0, 0)
+            
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = list(scraper.iter_restaurants(count))
+            elapsed = time.perf_counter() - start
+        
+        with_phone = sum(1 for r in results if r['phone'])
+        print(f"detail workers={workers:2d}: {len(results)} restaurants ({with_phone} with phone) "
+              f"in {elapsed:.2f}s with {latency * 1000:.0f}ms injected latency")
+
+
+@benchmark
+def bench_phone(count=1000000):
+    """Re-normalize a million-row phone column: uncached, memoized and vectorized"""
+    from opentable_phone import normalize_phone, normalize_phone_column
+    
+    rng = random.Random(0)
+    formats = ["({a}) {b}-{c}", "+1{a}{b}{c}", "{a}.{b}.{c}", "1-{a}-{b}-{c}", "{a} {b} {c}"]
+    pool = [
+        rng.choice(formats).format(a=rng.randint(200, 999), b=rng.randint(200, 999), c=rng.randint(1000, 9999))
+        for _ in range(count // 10)
+    ]
+    column = [rng.choice(pool) for _ in range(count)]
+    
+    start = time.perf_counter()
+    for value in column[:count // 10]:
+        normalize_phone.__wrapped__(value)
+    report("phone scalar uncached (10% sample)", count // 10, time.perf_counter() - start, 'rows')
+    
+    normalize_phone.cache_clear()
+    start = time.perf_counter()
+    for value in column:
+        normalize_phone(value)
+    report("phone scalar memoized", count, time.perf_counter() - start, 'rows')
+    
+    start = time.perf_counter()
+    normalize_phone_column(column)
+    report("phone vectorized column", count, time.perf_counter() - start, 'rows')
+
+
+def link_heavy_page(restaurant_links=300, other_links=3000, seed=0):
+    """Listing-page HTML dominated by navigation and footer anchors"""
+    rng = random.Random(seed)
+    parts = ['<html><body><nav>']
+    for i in range(other_links):
+        text = rng.choice(['Sign in', 'Help', 'Privacy', 'Toronto dining guide', 'Gift cards', 'Blog post'])
+        parts.append(f'<a href="/c/page-{i}"><span>{text} {i}</span></a>')
+        if i % 10 == 0 and i // 10 < restaurant_links:
+            n = i // 10
+            parts.append(f'<div class="tile"><a href="/r/restaurant-{n}-toronto?corrid={i}">'
+                         f'<span>{rng.choice(WORDS).title()} Kitchen {n}</span></a> Italian</div>')
+    parts.append('</nav></body></html>')
+    return ''.join(parts)
+
+
+@benchmark
+def bench_links(repeat=20):
+    """Per-page CPU of the link-based extraction strategies on a link-heavy page"""
+    import contextlib
+    import io
+    from bs4 import BeautifulSoup
+    with contextlib.redirect_stdout(io.StringIO()):
+        from opentable_advanced_scraper import AdvancedOpenTableScraper
+    
+    scraper = AdvancedOpenTableScraper()
+    soup = BeautifulSoup(link_heavy_page(), 'html.parser')
+    anchors = len(soup.find_all('a'))
+    
+    for strategy in (scraper.strategy_links_and_scripts, scraper.strategy_generic_links):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            found = strategy(soup)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{strategy.__name__}: {elapsed * 1000:.1f}ms per page "
+              f"({anchors} anchors, {len(found)} restaurants)")
+
+
+@benchmark
+def bench_availability(count=5000):
+    """Availability snapshots: one request per restaurant vs adaptive concurrent batches"""
+    from opentable_availability import AvailabilityClient, AvailabilityStore, BatchSizer, slots_to_bitmap
+    from opentable_testserver import LocalOpenTableServer
+    
+    tokens = {1000000 + i: f"token-{1000000 + i}" for i in range(count)}
+    configs = [
+        ("unbatched, 1 worker", 1, BatchSizer(initial=1, maximum=1), count // 20),
+        ("unbatched, 8 workers", 8, BatchSizer(initial=1, maximum=1), count // 5),
+        ("adaptive batches, 8 workers", 8, BatchSizer(initial=10, maximum=400, target_latency=0.5), count),
+    ]
+    
+    for label, workers, sizer, sample in configs:
+        with LocalOpenTableServer([], latency=0.01, max_batch_size=150, per_item_latency=0.001) as server:
+            client = AvailabilityClient(server.base_url, max_workers=workers, sizer=sizer)
+            subset = dict(list(tokens.items())[:sample])
+            
+            start = time.perf_counter()
+            results = client.fetch(subset, '2025-08-04', '19:00', 2)
+            elapsed = time.perf_counter() - start
+            
+            expected = server.availability_for(1000000)['availabilityDays'][0]['slots']
+            assert results[1000000] == slots_to_bitmap('19:00', expected)
+        
+        print(f"{label}: {len(results)} restaurants in {elapsed:.2f}s "
+              f"({len(results) / elapsed:,.0f}/s, {client.stats['requests']} requests, "
+              f"{client.stats['failed_batches']} rejected, final batch size {sizer.size})")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AvailabilityStore(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        store.save(results, '2025-08-04', 2)
+        report("availability bitmap save", len(results), time.perf_counter() - start)
+        store.close()
+
+
+@benchmark
+def bench_details(count=200):
+    """Requests and bytes per restaurant: HTML profile pages vs batched GraphQL details"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        from opentable_advanced_scraper import AdvancedOpenTableScraper
+    from opentable_details import RestaurantDetailClient
+    from opentable_testserver import LocalOpenTableServer
+    
+    raw = list(synthetic_restaurants(count))
+    for restaurant in raw:
+        # Pad the description so profile pages weigh roughly what real ones do
+        restaurant['description'] = restaurant['description'] * 200
+    
+    def records(base_url):
+        return [{'name': r['name'], 'url': base_url + r['urls']['profileLink']['link'], 'phone': '', 'cuisine': ''}
+                for r in raw]
+    
+    with LocalOpenTableServer(raw) as server:
+        scraper = AdvancedOpenTableScraper()
+        scraper.detail_delay = (0, 0)
+        restaurants = records(server.base_url)
+        
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for restaurant in restaurants:
+                details = scraper.get_restaurant_details(restaurant['url'])
+                restaurant.update(details)
+        elapsed = time.perf_counter() - start
+        requests_made = sum(server.hits.values())
+        with_phone = sum(1 for r in restaurants if r['phone'])
+        print(f"HTML profile pages: {elapsed:.2f}s, {requests_made / count:.2f} requests/restaurant, "
+              f"{server.bytes_sent / count:,.0f} bytes/restaurant, {with_phone}/{count} phones")
+    
+    with LocalOpenTableServer(raw) as server:
+        client = RestaurantDetailClient(server.base_url, batch_size=50)
+        restaurants = records(server.base_url)
+        
+        start = time.perf_counter()
+        client.enrich(restaurants)
+        elapsed = time.perf_counter() - start
+        with_phone = sum(1 for r in restaurants if r['phone'])
+        print(f"Batched GraphQL details: {elapsed:.2f}s, {client.stats['requests'] / count:.2f} requests/restaurant, "
+              f"{client.stats['bytes'] / count:,.0f} bytes/restaurant, {with_phone}/{count} phones")
+    
+    # A malformed item is skipped on its own instead of failing the other 49 in its batch
+    malformed = {raw[0]['restaurantId']: {'profileLink': 'not an object'},
+                 raw[1]['restaurantId']: {'profileLink': {'link': 42}}}
+    with LocalOpenTableServer(raw) as server:
+        details_for = server.details_for
+        server.details_for = lambda restaurant: dict(
+            details_for(restaurant), **({'urls': malformed[restaurant['restaurantId']]}
+                                        if restaurant['restaurantId'] in malformed else {}))
+        client = RestaurantDetailClient(server.base_url, batch_size=50)
+        restaurants = records(server.base_url)
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.enrich(restaurants)
+        with_phone = sum(1 for r in restaurants if r['phone'])
+    assert client.stats['invalid'] == 2 and with_phone == count - 2, (client.stats, with_phone)
+    print(f"with 2 malformed items: {with_phone}/{count} phones, {client.stats['invalid']} items rejected")
+
+
+def manual_extract(rest_data, base_url, format_phone):
+    """Hand-walked .get() chains for the schema's fields, the pre-schema style"""
+    restaurant = {}
+    try:
+        restaurant['name'] = rest_data.get('name', '').strip()
+        link = rest_data.get('urls', {}).get('profileLink', {}).get('link', '')
+        restaurant['url'] = link if link.startswith('http') else base_url + link if link else ''
+        contact_info = rest_data.get('contactInformation', {})
+        phone = contact_info.get('formattedPhoneNumber', '') or contact_info.get('phoneNumber', '')
+        restaurant['phone'] = format_phone(phone)
+        restaurant['cuisine'] = rest_data.get('primaryCuisine', {}).get('name', '').strip()
+        restaurant['restaurant_id'] = rest_data.get('restaurantId')
+        restaurant['metro_id'] = rest_data.get('metro', {}).get('metroId')
+        coordinates = rest_data.get('coordinates', {})
+        restaurant['latitude'] = coordinates.get('latitude')
+        restaurant['longitude'] = coordinates.get('longitude')
+        restaurant['neighborhood'] = rest_data.get('neighborhood', {}).get('name', '').strip()
+        restaurant['price_band'] = rest_data.get('priceBand', {}).get('priceBandId')
+        statistics = rest_data.get('statistics', {})
+        reviews = statistics.get('reviews', {})
+        restaurant['rating'] = reviews.get('ratings', {}).get('overall', {}).get('rating')
+        restaurant['review_count'] = reviews.get('allTimeTextReviewCount')
+        restaurant['recent_reservations'] = statistics.get('recentReservationCount')
+        restaurant['awards'] = [a.get('name') for a in rest_data.get('awards', [])]
+        restaurant['premium'] = bool(rest_data.get('features', {}).get('inPremiumMarketplace'))
+        restaurant['has_takeout'] = bool(rest_data.get('hasTakeout'))
+        restaurant['delivery_partners'] = [d.get('name') for d in rest_data.get('deliveryPartners', [])]
+        restaurant['description'] = rest_data.get('description', '').strip()
+        restaurant['top_review'] = rest_data.get('topReview', {}).get('highlightedText', '').strip()
+        restaurant['photos'] = {size: thumbnail['url'] for size, thumbnail in rest_data.get('photos', {}).get('profile', {}).items()
+                                if isinstance(thumbnail, dict) and thumbnail.get('url')}
+    except Exception as e:
+        print(f"Error parsing restaurant data: {e}")
+    return restaurant
+
+
+@benchmark
+def bench_schema(count=100000, repeat=5):
+    """Per-record extraction time: hand-written .get() chains vs the compiled schema extractor"""
+    from opentable_parser import OpenTableDocumentParser
+    from opentable_phone import format_phone, normalize_phone
+    
+    parser = OpenTableDocumentParser()
+    raw = list(synthetic_restaurants(count))
+    
+    # The two alternate chunk by chunk and keep each chunk's best time, so
+    # machine noise, which swings whole runs by 2x here, hits both sides alike
+    def timed(extract, chunk):
+        normalize_phone.cache_clear()  # Neither side may reuse phones the other just formatted
+        start = time.perf_counter()
+        for rest_data in chunk:
+            extract(rest_data)
+        return time.perf_counter() - start
+    
+    def manual_chunk(rest_data):
+        return manual_extract(rest_data, parser.base_url, format_phone)
+    
+    chunks = [raw[i:i + 1000] for i in range(0, count, 1000)]
+    best = {manual_chunk: [float('inf')] * len(chunks), parser.parse_restaurant_data: [float('inf')] * len(chunks)}
+    for _ in range(repeat):
+        for index, chunk in enumerate(chunks):
+            for extract, times in best.items():
+                times[index] = min(times[index], timed(extract, chunk))
+    manual, schema = (sum(times) for times in best.values())
+    
+    print(f"manual .get() chains: {manual / count * 1e6:.2f}us per record ({count} records, best of {repeat})")
+    print(f"compiled schema:      {schema / count * 1e6:.2f}us per record ({schema / manual:.2f}x manual)")
+
+
+@benchmark
+def bench_geo(count=1000000, queries=1000):
+    """Radius, k-nearest and bounding-box queries over a million clustered points"""
+    import numpy as np
+    from opentable_geo import SpatialIndex
+    
+    rng = np.random.default_rng(0)
+    # Restaurants cluster around metros; spread them over 20 metro centers
+    centers = np.column_stack([rng.uniform(42.0, 54.0, 20), rng.uniform(-124.0, -63.0, 20)])
+    which = rng.integers(0, len(centers), count)
+    lats = centers[which, 0] + rng.normal(0, 0.08, count)
+    lons = centers[which, 1] + rng.normal(0, 0.12, count)
+    ids = np.arange(count, dtype=np.int64)
+    
+    start = time.perf_counter()
+    index = SpatialIndex(lats, lons, ids)
+    print(f"build: {count:,} points in {time.perf_counter() - start:.2f}s")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.geo')
+        index.save(path)
+        start = time.perf_counter()
+        index = SpatialIndex.load(path)
+        print(f"mmap load: {(time.perf_counter() - start) * 1000:.2f}ms")
+        
+        points = [(lats[i], lons[i]) for i in rng.integers(0, count, queries)]
+        checks = [
+            ("radius 1km", lambda lat, lon: index.radius(lat, lon, 1000)[0]),
+            ("nearest k=10", lambda lat, lon: index.nearest(lat, lon, 10)[0]),
+            ("bbox 0.02deg", lambda lat, lon: index.bbox(lat - 0.01, lon - 0.01, lat + 0.01, lon + 0.01)),
+        ]
+        for label, query in checks:
+            found = 0
+            start = time.perf_counter()
+            for lat, lon in points:
+                found += len(query(lat, lon))
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {elapsed / queries * 1000:.3f}ms per query, {found / queries:.0f} results on average")
+        
+        # Brute-force check of one radius query against the full arrays
+        lat, lon = points[0]
+        from opentable_geo import haversine_m
+        expected = np.sort(ids[haversine_m(lat, lon, lats, lons) <= 1000])
+        assert np.array_equal(np.sort(index.radius(lat, lon, 1000)[0]), expected)
+        del index
+
+
+def import_times(args):
+    """Top-level {module: cumulative microseconds} from `python -X importtime` for a command"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that triggered them
+        times[name[1:]] = int(cumulative)
+    return times
+
+
+@benchmark
+def bench_startup(repeat=5):
+    """Cold-start import cost of each entry point, and which heavy modules it pulls in"""
+    heavy = ('bs4', 'requests', 'curl_cffi', 'numpy')
+    commands = [
+        ('import opentable', ['-c', 'import opentable'], heavy),
+        ('import opentable_parser', ['-c', 'import opentable_parser'], heavy),
+        ('import opentable_storage', ['-c', 'import opentable_storage'], heavy),
+        ('import opentable_advanced_scraper', ['-c', 'import opentable_advanced_scraper'], heavy),
+        ('opentable parse', ['opentable.py', 'parse', '-q', 'opentable_response.html'], heavy),
+        ('import opentable_scraper', ['-c', 'import opentable_scraper'], ()),
+    ]
+    
+    # Modules the bare interpreter already imports (site, encodings) are left out
+    baseline = set(import_times(['-c', 'pass']))
+    
+    def startup_cost(args):
+        times = import_times(args)
+        top_level = sum(
+            cost for name, cost in times.items()
+            if not name.startswith(' ') and name not in baseline
+        )
+        return top_level, {name.strip() for name in times}
+    
+    for label, args, forbidden in commands:
+        # Best of several runs, since the first run also warms the OS file cache
+        runs = [startup_cost(args) for _ in range(repeat)]
+        best = min(cost for cost, _ in runs)
+        loaded = [name for name in heavy if name in runs[0][1]]
+        print(f"{label}: {best / 1000:.1f}ms of imports, heavy modules: {', '.join(loaded) or 'none'}")
+        
+        unexpected = [name for name in loaded if name in forbidden]
+        assert not unexpected, f"{label} imports {', '.join(unexpected)} at startup"
+
+
+@benchmark
+def bench_singleflight(count=40, duplicates=5, workers=16, latency=0.2):
+    """Profile-page requests reaching the server with and without request coalescing"""
+    import contextlib
+    import io
+    from concurrent.futures import ThreadPoolExecutor
+    from opentable_scraper import OpenTableScraper
+    from opentable_testserver import LocalOpenTableServer
+    
+    restaurants = list(synthetic_restaurants(count))
+    variants = ['', '/', '?corrid=abc123', '?utm_source=listing#reviews', '?p=2&sd=2025-08-04']
+    
+    for coalesce in (False, True):
+        with LocalOpenTableServer(restaurants, latency=latency) as server:
+            scraper = OpenTableScraper(detail_workers=workers)
+            scraper.detail_delay = (0, 0)
+            if not coalesce:
+                scraper.fetch_page = scraper._fetch_page
+            
+            # The same restaurant surfaces from several listing pages under different URL spellings
+            urls = [
+                f"{server.base_url}/r/{server.slug_for(restaurant)}{variants[i % len(variants)]}"
+                for restaurant in restaurants for i in range(duplicates)
+            ]
+            random.Random(0).shuffle(urls)
+            
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor, contextlib.redirect_stdout(io.StringIO()):
+                phones = list(executor.map(scraper.get_restaurant_phone, urls))
+            elapsed = time.perf_counter() - start
+            
+            profile_hits = sum(hits for path, hits in server.hits.items() if path.startswith('/r/'))
+        
+        label = "coalesced" if coalesce else "uncoalesced"
+        print(f"{label}: {len(urls)} lookups -> {profile_hits} profile requests in {elapsed:.2f}s, "
+              f"{sum(1 for phone in phones if phone)} phones found")
+        if coalesce:
+            print(f"  {scraper.singleflight.summary()}")
+
+
+@benchmark
+def bench_streaming(repeat=5, bytes_per_second=2000000):
+    """Time to first record and bytes read per listing page: buffered fetch vs streamed parse"""
+    import requests
+    from opentable_parser import OpenTableDocumentParser
+    from opentable_testserver import LocalOpenTableServer
+    
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opentable_response.html'), 'rb') as file:
+        page = file.read()
+    routes = {'/toronto-ontario-restaurants': lambda request, parsed: (200, {}, page)}
+    
+    with LocalOpenTableServer(routes=routes, bytes_per_second=bytes_per_second) as server:
+        url = server.base_url + '/toronto-ontario-restaurants'
+        session = requests.Session()
+        print(f"page: {len(page):,} bytes served at {bytes_per_second / 1e6:.1f} MB/s")
+        
+        def buffered():
+            parser = OpenTableDocumentParser()
+            response = session.get(url, timeout=30)
+            first = next(parser.iter_restaurants_from_html(response.text))
+            return first, len(response.content)
+        
+        def streamed():
+            parser = OpenTableDocumentParser()
+            first = next(parser.iter_restaurants_from_url(url, session))
+            return first, parser.last_stream['bytes_decoded']
+        
+        for label, fetch in (("buffered fetch + parse", buffered), ("streamed parse", streamed)):
+            timings = []
+            server.bytes_sent = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                first, bytes_read = fetch()
+                timings.append(time.perf_counter() - start)
+            # Give aborted server writes a moment to notice the closed connection
+            time.sleep(0.1)
+            print(f"{label}: first record ({first['name']}) after {sorted(timings)[len(timings) // 2] * 1000:.0f}ms, "
+                  f"{bytes_read:,} bytes read, {server.bytes_sent // repeat:,} bytes sent per page")
+    
+    # The scraper streams listing pages under its retry policy and archives the JSON script it read
+    import csv
+    from opentable_archive import ArchiveWriter
+    from opentable_scraper import OpenTableScraper
+    
+    faults = {'/toronto-ontario-restaurants': [503]}
+    with LocalOpenTableServer(routes=routes, bytes_per_second=bytes_per_second, faults=faults) as server, tempfile.TemporaryDirectory() as tmp:
+        with ArchiveWriter(tmp) as archive:
+            scraper = OpenTableScraper(archive=archive, streaming=True)
+            scraper.base_url = server.base_url
+            scraper.retrier.sleep = lambda seconds: None
+            streamed = scraper.scrape_restaurants(max_restaurants=5)
+        archived = list(OpenTableDocumentParser().iter_archived_restaurants(tmp))
+        
+        # crawl --stream saves the full parser records to the card-column CSV
+        output = os.path.join(tmp, 'streamed.csv')
+        scraper.save_to_csv(output)
+        with open(output, newline='', encoding='utf-8') as file:
+            saved = list(csv.DictReader(file))
+        assert [row['name'] for row in saved] == [r['name'] for r in streamed], "streamed records not saved"
+    assert len(streamed) == 5 and server.faulted, "streamed listing page was not retried past the 503"
+    assert [r['name'] for r in archived[:5]] == [r['name'] for r in streamed], "archived script does not re-parse"
+    stats = scraper.stream_stats
+    print(f"scraper: retried past a 503, received {stats['bytes_received']:,} of "
+          f"{stats['content_length']:,} bytes on the wire, archived JSON re-parses to the same records")
+
+
+def listing_page_variants(count, per_page=30):
+    """Copies of the saved listing page, each carrying its own page of synthetic restaurants"""
+    import json
+    import re
+    
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opentable_response.html'), encoding='utf-8') as file:
+        page = file.read()
+    
+    pattern = re.compile(r'(<script id="primary-window-vars" type="application/json">)(.*?)(</script>)', re.DOTALL)
+    data = json.loads(html.unescape(pattern.search(page).group(2)))
+    search_results = data['windowVariables']['__INITIAL_STATE__']['lolzViewAll']['searchResults']
+    
+    for i in range(count):
+        restaurants = list(synthetic_restaurants(per_page, seed=i))
+        for restaurant in restaurants:
+            restaurant['restaurantId'] += i * per_page
+        search_results['restaurants'] = restaurants
+        body = json.dumps(data)
+        yield pattern.sub(lambda match: match.group(1) + body + match.group(3), page, count=1)
+
+
+@benchmark
+def bench_archive(pages=500):
+    """Disk usage and re-parse throughput of a day's crawl: zstd archive vs loose files"""
+    from opentable_archive import ArchiveReader, ArchiveWriter, archive_size
+    from opentable_parser import OpenTableDocumentParser
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        loose_dir = os.path.join(tmp, 'loose')
+        archive_dir = os.path.join(tmp, 'archive')
+        os.makedirs(loose_dir)
+        urls = []
+        
+        loose_elapsed = archive_elapsed = 0.0
+        with ArchiveWriter(archive_dir) as writer:
+            for i, page in enumerate(listing_page_variants(pages)):
+                url = f"https://www.opentable.ca/toronto-ontario-restaurants?page={i + 1}"
+                urls.append(url)
+                body = page.encode('utf-8')
+                
+                start = time.perf_counter()
+                with open(os.path.join(loose_dir, f"page-{i:05d}.html"), 'wb') as file:
+                    file.write(body)
+                loose_elapsed += time.perf_counter() - start
+                
+                start = time.perf_counter()
+                writer.add(url, body, headers={'content-type': 'text/html; charset=utf-8'})
+                archive_elapsed += time.perf_counter() - start
+        
+        loose_bytes = sum(os.path.getsize(os.path.join(loose_dir, name)) for name in os.listdir(loose_dir))
+        stored_bytes = archive_size(archive_dir)
+        print(f"loose files: {loose_bytes / 1e6:.1f} MB, written in {loose_elapsed:.2f}s")
+        print(f"archive: {stored_bytes / 1e6:.1f} MB ({loose_bytes / stored_bytes:.1f}x smaller), "
+              f"written in {archive_elapsed:.2f}s")
+        
+        parser = OpenTableDocumentParser()
+        start = time.perf_counter()
+        loose_count = 0
+        for name in sorted(os.listdir(loose_dir)):
+            loose_count += sum(1 for _ in parser.iter_restaurants(os.path.join(loose_dir, name)))
+        report("re-parse loose files", loose_count, time.perf_counter() - start)
+        
+        parser = OpenTableDocumentParser()
+        start = time.perf_counter()
+        with ArchiveReader(archive_dir) as reader:
+            archive_count = sum(1 for _ in parser.iter_archived_restaurants(reader))
+        report("re-parse archive", archive_count, time.perf_counter() - start)
+        assert archive_count == loose_count
+        
+        # Random access only decompresses the requested frame
+        rng = random.Random(0)
+        sample = [rng.choice(urls) for _ in range(200)]
+        with ArchiveReader(archive_dir) as reader:
+            start = time.perf_counter()
+            for url in sample:
+                reader.get(url).content
+            elapsed = time.perf_counter() - start
+        print(f"random access: {elapsed / len(sample) * 1000:.2f}ms per page")
+        
+        # Detail workers archive concurrently; each thread must get its own (de)compressor
+        from concurrent.futures import ThreadPoolExecutor
+        shared_dir = os.path.join(tmp, 'shared')
+        bodies = [page.encode('utf-8') for page in listing_page_variants(8)]
+        with ArchiveWriter(shared_dir) as writer, ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda n: [writer.add(f"https://www.opentable.ca/r/{n}-{i}", bodies[n]) for i in range(40)],
+                          range(8)))
+        with ArchiveReader(shared_dir) as reader, ThreadPoolExecutor(8) as pool:
+            intact = sum(pool.map(lambda page: page.content == bodies[int(page.url.rsplit('/', 1)[1].split('-')[0])],
+                                  list(reader)))
+        assert intact == 320, f"{320 - intact} pages corrupted by concurrent archive writes"
+        print(f"concurrent: 8 threads x 40 pages written and read back intact")
+
+
+@benchmark
+def bench_parse_cache(pages=200):
+    """Re-parse of unchanged listing pages: cold parse vs parse-cache hits"""
+    import contextlib
+    import io
+    from opentable_parsecache import ParseCache
+    from opentable_parser import OpenTableDocumentParser
+    
+    # Raw bytes, as fetched responses and archived pages hand them to the parser
+    bodies = [page.encode('utf-8') for page in listing_page_variants(pages)]
+    print(f"{pages} listing pages, {sum(len(body) for body in bodies) / 1e6:.1f} MB")
+    
+    def parse_all(parser):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [list(parser.iter_restaurants_from_html(body)) for body in bodies]
+        return results, time.perf_counter() - start
+    
+    cold, elapsed = parse_all(OpenTableDocumentParser())
+    report("cold parse", sum(map(len, cold)), elapsed)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, 'parse-cache')
+        results, elapsed = parse_all(OpenTableDocumentParser(cache=ParseCache(cache_dir)))
+        report("parse + cache store", sum(map(len, results)), elapsed)
+        
+        # A new process reopening the cache, as a re-run over the same pages would
+        cache = ParseCache(cache_dir)
+        results, elapsed = parse_all(OpenTableDocumentParser(cache=cache))
+        report("cache hits", sum(map(len, results)), elapsed)
+        assert results == cold
+        print(f"  {cache.summary()}")
+        
+        # A cache too small for the whole crawl keeps only the most recent pages
+        small = ParseCache(os.path.join(tmp, 'small'), max_bytes=cache.total_bytes // 4)
+        parse_all(OpenTableDocumentParser(cache=small))
+        print(f"LRU at 1/4 size: {small.summary()}")
+
+
+@benchmark
+def bench_pipeline(restaurants=300, max_restaurants=200, latency=0.05):
+    """Inline scrape loop vs the staged fetch/parse/enrich/write pipeline against a slow local site"""
+    from opentable_advanced_scraper import AdvancedOpenTableScraper
+    from opentable_testserver import LocalOpenTableServer
+    
+    raw = list(synthetic_restaurants(restaurants))
+    print(f"{max_restaurants} restaurants, 20 per listing page, every request {latency * 1000:.0f}ms, "
+          f"one profile page per restaurant")
+    
+    runs = [
+        ("inline", None),
+        ("pipelined", {}),
+        ("pipelined, enrich x16", {'enrich': (16, 'thread')}),
+    ]
+    found = {}
+    for label, stages in runs:
+        with LocalOpenTableServer(raw, page_size=20, latency=latency) as server:
+            scraper = AdvancedOpenTableScraper()
+            scraper.base_url = server.base_url
+            scraper.detail_delay = (0, 0)
+            scraper.page_delay = (0, 0)
+            
+            # Parse workers are separate processes, so silence the file descriptor rather than sys.stdout
+            sys.stdout.flush()
+            saved = os.dup(1)
+            with open(os.devnull, 'w') as devnull:
+                os.dup2(devnull.fileno(), 1)
+            try:
+                start = time.perf_counter()
+                if stages is None:
+                    results = scraper.scrape_toronto_restaurants(max_restaurants)
+                else:
+                    results = scraper.scrape_toronto_restaurants_pipelined(max_restaurants, stages=stages)
+                elapsed = time.perf_counter() - start
+                sys.stdout.flush()
+            finally:
+                os.dup2(saved, 1)
+                os.close(saved)
+            requests_made = sum(server.hits.values())
+        
+        found[label] = {(r['name'], r['phone']) for r in results}
+        print(f"{label}: {len(results)} restaurants in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s), "
+              f"{requests_made} requests")
+        if stages is not None:
+            print(scraper.pipeline.summary())
+        assert found[label] == found["inline"]
+    
+    # A stage that raises drops its page; the page's slot must still be released or the source waits forever
+    class FailingScraper(AdvancedOpenTableScraper):
+        failed = set()
+        
+        def attach_listing_body(self, item, response):
+            if item['page'] == 2 and 'fetch' not in self.failed:
+                self.failed.add('fetch')
+                raise RuntimeError("injected fetch failure")
+            return super().attach_listing_body(item, response)
+        
+        def enrich_listing_item(self, crawl, item):
+            if item['page'] == 3 and 'enrich' not in self.failed:
+                self.failed.add('enrich')
+                raise RuntimeError("injected enrich failure")
+            return super().enrich_listing_item(crawl, item)
+    
+    with LocalOpenTableServer(raw, page_size=20, latency=latency) as server:
+        scraper = FailingScraper()
+        scraper.base_url = server.base_url
+        scraper.detail_delay = (0, 0)
+        scraper.page_delay = (0, 0)
+        results = []
+        sys.stdout.flush()
+        saved = os.dup(1)
+        with open(os.devnull, 'w') as devnull:
+            os.dup2(devnull.fileno(), 1)
+        try:
+            def crawl():
+                results.extend(scraper.scrape_toronto_restaurants_pipelined(max_restaurants))
+            
+            run = threading.Thread(target=crawl, daemon=True)
+            run.start()
+            run.join(60)
+            sys.stdout.flush()
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+    assert not run.is_alive(), "pipelined crawl hung after a stage failure"
+    print(f"with a fetch and an enrich failure: {len(results)} restaurants, "
+          f"{sum(stats['errors'] for stats in scraper.pipeline.stats().values())} stage errors")
+    assert len(results) == max_restaurants
+
+
+@benchmark
+def bench_retry(restaurants=100, flaky_every=7):
+    """Retry-everything fetching vs failure-class policies and breakers against a faulty local site
+    
+    The real listing has restaurants / 20 pages and 404s after them; the
+    other candidate URLs are dead (always 404, always 503, connection reset).
+    Page 2 first answers with an empty interstitial, and every flaky_every-th
+    profile answers 503 or 429 once. Backoff runs on a simulated clock.
+    """
+    import zlib
+    from opentable_advanced_scraper import AdvancedOpenTableScraper
+    from opentable_retry import OTHER, FetchError, Retrier, RetryPolicy
+    from opentable_testserver import LocalOpenTableServer, SimulatedClock
+    
+    class LegacyPolicy(RetryPolicy):
+        def delay(self, retry, response=None):
+            return random.uniform(3, 8)
+    
+    class LegacyRetrier(Retrier):
+        """The old fetch_page loop: every failure tried three times, an empty page taken at face value"""
+        
+        def __init__(self, **kwargs):
+            policies = {OTHER: LegacyPolicy(attempts=3), 'empty': RetryPolicy(attempts=1)}
+            super().__init__(policies, breakers=False, **kwargs)
+        
+        def classify(self, response, error):
+            return super().classify(response, error) and OTHER
+    
+    def flaky_profile(request, parsed, hit):
+        if hit == 0 and zlib.crc32(parsed.path.encode()) % flaky_every == 0:
+            return 429 if zlib.crc32(parsed.path.encode()) % 2 else 503
+        return None
+    
+    faults = {
+        '/toronto-ontario-restaurants?page=2': ['empty'],
+        '/toronto-restaurants': 404,
+        '/c/toronto': 503,
+        '/search': 'reset',
+        '/r/': flaky_profile,
+    }
+    raw = list(synthetic_restaurants(restaurants))
+    print(f"{restaurants} restaurants on {restaurants // 20} listing pages, 3 dead candidate URLs, "
+          f"1 in {flaky_every} profiles fails once")
+    
+    found = {}
+    for label, make_retrier in (("retry everything", LegacyRetrier), ("per-class policy", Retrier)):
+        clock = SimulatedClock()
+        with LocalOpenTableServer(raw, page_size=20, faults=dict(faults), retry_after=2) as server:
+            scraper = AdvancedOpenTableScraper()
+            scraper.base_url = server.base_url
+            scraper.detail_delay = (0, 0)
+            scraper.page_delay = (0, 0)
+            scraper.retrier = make_retrier(sleep=clock.sleep, clock=clock)
+            
+            with open(os.devnull, 'w') as devnull:
+                saved, sys.stdout = sys.stdout, devnull
+                try:
+                    start = time.perf_counter()
+                    results = list(scraper.iter_restaurants(restaurants * 10))
+                    elapsed = time.perf_counter() - start
+                finally:
+                    sys.stdout = saved
+            
+            stats = scraper.retrier.stats
+            found[label] = {r['name'] for r in results}
+            print(f"{label}: {len(results)} restaurants, {sum(server.hits.values())} requests "
+                  f"({stats['wasted']} wasted), {stats['backoff']:.0f}s simulated backoff, {elapsed:.2f}s")
+            print(f"  {scraper.retrier.summary()}")
+            
+            if scraper.retrier.use_breakers:
+                # The 503 family is open: no request until the cooldown, then a single probe
+                dead = f"{server.base_url}/c/toronto"
+                hits = server.hits['/c/toronto']
+                with open(os.devnull, 'w') as devnull:
+                    saved, sys.stdout = sys.stdout, devnull
+                    try:
+                        try:
+                            scraper.fetch_listing_page(dead)
+                        except Exception as e:
+                            refused = type(e).__name__
+                        sent_while_open = server.hits['/c/toronto'] - hits
+                        del server.faults['/c/toronto']
+                        clock.sleep(scraper.retrier.reset_timeout + 1)
+                        probed = scraper.fetch_listing_page(dead)
+                    finally:
+                        sys.stdout = saved
+                print(f"  /c/toronto while open: {refused}, {sent_while_open} requests; "
+                      f"after cooldown the probe got {len(probed)} restaurants and the breaker is "
+                      f"{scraper.retrier.breaker(dead).state}")
+                
+                # Delisted profiles 404 one by one; that must not open the breaker every profile shares
+                server.faults['/r/delisted-'] = 404
+                profile = f"{server.base_url}/r/{server.slug_for(raw[0])}"
+                with open(os.devnull, 'w') as devnull:
+                    saved, sys.stdout = sys.stdout, devnull
+                    try:
+                        for n in range(scraper.retrier.failure_threshold + 1):
+                            try:
+                                scraper.fetch_page(f"{server.base_url}/r/delisted-{n}")
+                            except FetchError:
+                                pass
+                        status = scraper.fetch_page(profile).status_code
+                    finally:
+                        sys.stdout = saved
+                print(f"  {scraper.retrier.failure_threshold + 1} delisted profiles in a row, then a live one: "
+                      f"HTTP {status}, profile breaker {scraper.retrier.breaker(profile).state}")
+                assert status == 200
+    
+    lost = found["per-class policy"] - found["retry everything"]
+    print(f"restaurants only found with per-class retries: {len(lost)}")
+
+
+def soak_run(teardown, pages, checkpoint=1000):
+    """Parse `pages` replayed listing and profile pages in this process, printing RSS growth as it goes
+    
+    Run in a fresh interpreter per mode by bench_soak, since freed memory
+    stays with the allocator and would hide the second run's growth
+    """
+    import contextlib
+    import gc
+    import io
+    from urllib.parse import urlparse
+    import opentable_advanced_scraper
+    from opentable_memory import MemoryWatchdog
+    from opentable_testserver import LocalOpenTableServer
+    
+    # Imported up front in both modes so the baseline RSS includes bs4
+    from bs4 import BeautifulSoup
+    
+    if not teardown:
+        @contextlib.contextmanager
+        def parsed_html(content):
+            # What make_soup did: the tree is left for the cyclic collector
+            yield BeautifulSoup(content, 'html.parser')
+        
+        opentable_advanced_scraper.parsed_html = parsed_html
+    
+    raw = list(synthetic_restaurants(2000))
+    server = LocalOpenTableServer(raw, page_size=20)
+    bodies = [server.listing_page(urlparse(f"/toronto?page={page}"))[2].encode() for page in range(1, 101)]
+    bodies += [server.profile_page(urlparse(f"/r/{server.slug_for(r)}"))[2].encode() for r in raw[:100]]
+    
+    gc_time = [0.0, 0]
+    started = [0.0]
+    
+    def on_gc(phase, info):
+        if phase == 'start':
+            started[0] = time.perf_counter()
+        else:
+            gc_time[0] += time.perf_counter() - started[0]
+            gc_time[1] += info['generation'] == 2
+    
+    gc.callbacks.append(on_gc)
+    scraper = opentable_advanced_scraper.AdvancedOpenTableScraper()
+    watchdog = MemoryWatchdog()
+    base = watchdog.check()
+    found = 0
+    start = time.perf_counter()
+    for done in range(1, pages + 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            found += len(scraper.parse_listing_page(bodies[done % len(bodies)]))
+        rss = watchdog.check()
+        if done % checkpoint == 0:
+            print(f"checkpoint {done} {(rss - base) / 2**20:.1f}")
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(on_gc)
+    print(f"done {found} {elapsed:.2f} {(watchdog.stats['peak'] - base) / 2**20:.1f} {gc_time[0]:.2f} {gc_time[1]}")
+
+
+@benchmark
+def bench_soak(pages=10000):
+    """RSS over a long parse run with the soup left to the garbage collector vs torn down after extraction"""
+    from opentable_memory import MemoryWatchdog
+    
+    # Without a limit throttle() still samples RSS, so --trace-memory alone reports a peak
+    watchdog = MemoryWatchdog()
+    watchdog.throttle()
+    assert watchdog.stats['peak'] or watchdog.rss() is None, watchdog.summary()
+    print(f"watchdog without a limit: {watchdog.summary()}")
+    
+    print(f"{pages} replayed pages (100 listing pages of 20 cards, 100 profiles), "
+          f"RSS growth over the starting RSS in MB")
+    checkpoint = max(pages // 10, 1)
+    for label, teardown in (("gc only", False), ("teardown", True)):
+        result = subprocess.run(
+            [sys.executable, '-c',
+             f"import opentable_benchmarks; opentable_benchmarks.soak_run({teardown}, {pages}, {checkpoint})"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if result.returncode:
+            print(result.stderr)
+            continue
+        checkpoints = []
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if fields[0] == 'checkpoint':
+                checkpoints.append(fields[2])
+            elif fields[0] == 'done':
+                found, elapsed, peak, gc_seconds, full_collections = fields[1:]
+        print(f"{label}: {found} restaurants in {elapsed}s, RSS +{peak} MB peak, "
+              f"{gc_seconds}s in the GC ({full_collections} full collections)")
+        print(f"  RSS every {checkpoint} pages: {' '.join(checkpoints)}")
+
+
+def analytics_records(count, metros=120, seed=0):
+    """Flat restaurant records as the parser produces them, spread over metros with uneven coverage"""
+    rng = random.Random(seed)
+    metro_ids = list(range(1, metros + 1))
+    # Bigger metros first, so rollups have a realistic long tail
+    weights = [1 / rank for rank in range(1, metros + 1)]
+    chosen = rng.choices(metro_ids, weights, k=count)
+    for i, metro_id in enumerate(chosen):
+        yield {
+            'name': f"Restaurant {i}",
+            'url': f"https://www.opentable.ca/r/restaurant-{i}" if rng.random() < 0.98 else '',
+            'phone': f"(416) 555-{i % 10000:04d}" if rng.random() < 0.9 else '',
+            'cuisine': rng.choice(CUISINES) if rng.random() < 0.95 else '',
+            'restaurant_id': 1000000 + i,
+            'metro_id': metro_id,
+            'latitude': 43.65 + rng.uniform(-0.15, 0.15),
+            'longitude': -79.38 + rng.uniform(-0.25, 0.25),
+            'neighborhood': rng.choice(NEIGHBORHOODS) if rng.random() < 0.8 else '',
+            'price_band': rng.randint(1, 4) if rng.random() < 0.97 else None,
+            'rating': round(rng.uniform(3.0, 5.0), 1) if rng.random() < 0.85 else None,
+        }
+
+
+def loop_report(restaurants):
+    """The same numbers as RestaurantColumns.report, with the per-field passes print_summary used to make"""
+    from collections import Counter, defaultdict
+    
+    total = len(restaurants)
+    coverage = {
+        'phone': sum(1 for r in restaurants if r['phone']),
+        'cuisine': sum(1 for r in restaurants if r['cuisine']),
+        'url': sum(1 for r in restaurants if r['url']),
+        'neighborhood': sum(1 for r in restaurants if r['neighborhood']),
+        'price_band': sum(1 for r in restaurants if r['price_band']),
+        'coordinates': sum(1 for r in restaurants if r['latitude'] and r['longitude']),
+        'rating': sum(1 for r in restaurants if r['rating'] is not None),
+    }
+    distributions = {
+        field: Counter(r[field] or 'Unknown' for r in restaurants)
+        for field in ('cuisine', 'neighborhood', 'price_band')
+    }
+    metros = defaultdict(lambda: {'restaurants': 0, 'phone': 0, 'rating_sum': 0.0, 'rated': 0, 'cuisines': Counter()})
+    for r in restaurants:
+        metro = metros[r['metro_id']]
+        metro['restaurants'] += 1
+        metro['phone'] += bool(r['phone'])
+        if r['rating'] is not None:
+            metro['rating_sum'] += r['rating']
+            metro['rated'] += 1
+        if r['cuisine']:
+            metro['cuisines'][r['cuisine']] += 1
+    return total, coverage, distributions, metros
+
+
+@benchmark
+def bench_analytics(count=2000000, metros=120):
+    """Python-loop summary vs columnar NumPy report over millions of records"""
+    import shutil
+    from opentable_analytics import RestaurantColumns, to_markdown
+    
+    start = time.perf_counter()
+    records = list(analytics_records(count, metros))
+    print(f"{count:,} records over {metros} metros built in {time.perf_counter() - start:.1f}s")
+    
+    start = time.perf_counter()
+    total, coverage, distributions, metro_stats = loop_report(records)
+    loops = time.perf_counter() - start
+    print(f"python loops: {loops:.2f}s")
+    
+    start = time.perf_counter()
+    columns = RestaurantColumns.from_records(records)
+    encoded = time.perf_counter() - start
+    start = time.perf_counter()
+    report = columns.report(top=None)
+    reported = time.perf_counter() - start
+    print(f"columns: encode {encoded:.2f}s + report {reported * 1000:.0f}ms = {encoded + reported:.2f}s "
+          f"({loops / (encoded + reported):.1f}x)")
+    
+    path = tempfile.mkdtemp()
+    try:
+        columns.save(path)
+        start = time.perf_counter()
+        loaded = RestaurantColumns.load(path)
+        report_again = loaded.report(top=None)
+        markdown = to_markdown(report_again)
+        from_disk = time.perf_counter() - start
+    finally:
+        shutil.rmtree(path)
+    print(f"saved columns: load (mmap) + report + markdown {from_disk * 1000:.0f}ms ({loops / from_disk:.0f}x)")
+    
+    assert report['total'] == total and report_again == report
+    assert {field: stats['count'] for field, stats in report['coverage'].items()} == coverage
+    for field, counter in distributions.items():
+        assert {row['value']: row['count'] for row in report['distributions'][field]} == dict(counter)
+    for rollup in report['metros']:
+        metro = metro_stats[rollup['metro_id']]
+        assert rollup['restaurants'] == metro['restaurants']
+        assert rollup['coverage']['phone'] == round(100 * metro['phone'] / metro['restaurants'], 1)
+        assert rollup['mean_rating'] == round(metro['rating_sum'] / metro['rated'], 2)
+        assert metro['cuisines'][rollup['top_cuisine']] == max(metro['cuisines'].values())
+    print(f"report: {len(markdown.splitlines())} markdown lines, {len(report['metros'])} metro rollups")
+
+
+@benchmark
+def bench_photos(restaurants=600, latency=0.02, duplicate_share=0.25, workers=16):
+    """Sequential photo downloads vs the concurrent harvester, then a re-run with conditional requests"""
+    import hashlib
+    import shutil
+    from urllib.parse import urlsplit
+    import requests
+    from opentable_media import PhotoHarvester
+    from opentable_parser import OpenTableDocumentParser
+    from opentable_testserver import LocalOpenTableServer, StaticFiles
+    
+    rng = random.Random(0)
+    parser = OpenTableDocumentParser()
+    records = [parser.extract_restaurant(raw) for raw in synthetic_restaurants(restaurants)]
+    placeholder = rng.randbytes(20000)
+    files = {}
+    for record in records:
+        path = urlsplit(record['photos']['medium']).path
+        files[path] = placeholder if rng.random() < duplicate_share else rng.randbytes(rng.randint(15000, 60000))
+    static = StaticFiles(files)
+    print(f"{restaurants} medium photos, {duplicate_share:.0%} of them one placeholder image, "
+          f"{latency * 1000:.0f}ms per request, {sum(map(len, files.values())) / 2**20:.1f} MB in total")
+    
+    directory = tempfile.mkdtemp()
+    try:
+        with LocalOpenTableServer([], latency=latency, routes=static.routes()) as server:
+            for record in records:
+                record['photos'] = {size: server.base_url + urlsplit(url).path for size, url in record['photos'].items()}
+            
+            sequential = os.path.join(directory, 'sequential')
+            os.makedirs(sequential)
+            session = requests.Session()
+            start = time.perf_counter()
+            for record in records:
+                url = record['photos']['medium']
+                with open(os.path.join(sequential, url.rsplit('/', 1)[-1]), 'wb') as file:
+                    file.write(session.get(url, timeout=30).content)
+            elapsed = time.perf_counter() - start
+            stored = sum(os.path.getsize(os.path.join(sequential, name)) for name in os.listdir(sequential))
+            print(f"sequential: {elapsed:.2f}s, {len(os.listdir(sequential))} files, {stored / 2**20:.1f} MB on disk")
+            
+            store = os.path.join(directory, 'store')
+            runs = [("harvester", None), ("re-run, nothing changed", None), ("re-run, 5% changed", 0.05)]
+            for label, changed in runs:
+                if changed:
+                    for path in rng.sample(sorted(files), int(len(files) * changed)):
+                        files[path] = rng.randbytes(30000)
+                hits = sum(server.hits.values())
+                with open(os.devnull, 'w') as devnull:
+                    saved, sys.stdout = sys.stdout, devnull
+                    try:
+                        with PhotoHarvester(store, workers=workers) as harvester:
+                            harvester.harvest(records)
+                    finally:
+                        sys.stdout = saved
+                stats = harvester.stats
+                print(f"{label}: {stats['seconds']:.2f}s, {sum(server.hits.values()) - hits} requests, "
+                      f"{stats['downloaded']} new files, {stats['deduplicated']} duplicates, {stats['unchanged']} 304s, "
+                      f"{stats['bytes_downloaded'] / 2**20:.1f} MB transferred, {stats['failed']} failed")
+                
+                for record in records:
+                    url = record['photos']['medium']
+                    with open(harvester.path_for(url), 'rb') as file:
+                        assert hashlib.sha256(file.read()).digest() == hashlib.sha256(files[urlsplit(url).path]).digest()
+            
+            blobs = [os.path.join(root, name) for root, _, names in os.walk(store) for name in names
+                     if name.endswith('.jpg')]
+            manifest = os.path.getsize(os.path.join(store, 'manifest.json'))
+            print(f"store: {len(blobs)} files, {sum(map(os.path.getsize, blobs)) / 2**20:.1f} MB, "
+                  f"manifest {manifest / 1024:.0f} KB")
+    finally:
+        shutil.rmtree(directory)
+
+
+def duplicated_sources(venues, seed=0):
+    """(source, record, venue number) for venues seen by the JSON parser and the HTML strategies
+    
+    Every venue has a JSON record; about half also appear in an HTML strategy's
+    output, the way clean_text and JSON-LD would render them: no restaurantId
+    or coordinates, punctuation stripped, phones reformatted, tracking
+    parameters on the URL, and sometimes no URL or phone at all
+    """
+    import itertools
+    
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'su', 'vi', 'pe', 'do', 'ba', 'gu', 'chi', 'ze', 'fo', 'ja']
+    words = [''.join(parts).title() for parts in itertools.product(syllables, repeat=4)]
+    rng.shuffle(words)
+    suffixes = ['', ' Restaurant', ' Bar & Grill', ' Café', ' Kitchen', "'s", ' Trattoria', ' Bistro']
+    
+    for venue in range(venues):
+        # Unique word pair per venue, so names only collide through the variants below
+        first, second = venue % len(words), (venue // len(words) + venue * 7919) % len(words)
+        name = f"{words[first]} {words[second]}{rng.choice(suffixes)}"
+        area, number = rng.randint(200, 999), rng.randint(2000000, 9999999)
+        slug = f"/r/{venue}-{name.lower().replace(' ', '-')}"
+        record = {
+            'name': name,
+            'url': f"https://www.opentable.ca{slug}",
+            'phone': f"({area}) {str(number)[:3]}-{str(number)[3:]}",
+            'cuisine': rng.choice(CUISINES),
+            'restaurant_id': 1000000 + venue,
+            'latitude': 43.65 + rng.uniform(-0.15, 0.15),
+            'longitude': -79.38 + rng.uniform(-0.25, 0.25),
+        }
+        yield 'json', record, venue
+        
+        if rng.random() < 0.5:
+            html_name = name.replace("'", '').replace('é', 'e').replace('&', 'and')
+            if rng.random() < 0.3:
+                html_name = html_name.upper()
+            yield 'html', {
+                'name': html_name,
+                'url': f"https://www.opentable.ca{slug}?corrid={rng.randint(0, 10 ** 9)}" if rng.random() < 0.7 else '',
+                'phone': f"+1{area}{number}" if rng.random() < 0.6 else '',
+                'cuisine': '',
+            }, venue
+
+
+@benchmark
+def bench_resolve(venues=670000):
+    """Entity resolution over a million records from two sources, with precision and recall"""
+    import gc
+    import resource
+    from opentable_resolve import EntityResolver
+    
+    # An id-less record matching two restaurantIds must not join them into one restaurant
+    bridge = EntityResolver()
+    bridge.add({'name': 'Pizzeria Libretto Ossington', 'phone': '416-532-8000', 'restaurant_id': 1}, 'json')
+    bridge.add({'name': 'Pizzeria Libretto Ossington', 'phone': '416-532-8000'}, 'html')
+    bridge.add({'name': 'Pizzeria Libretto Ossington', 'phone': '416-532-8000', 'restaurant_id': 2}, 'json')
+    assert len(bridge.clusters()) == 2, "id-less record bridged two restaurantIds"
+    # Clustering again rebuilds the name-token blocks instead of appending to them
+    first = dict(bridge.stats)
+    assert len(bridge.clusters()) == 2 and bridge.stats == first, (first, bridge.stats)
+    
+    rows = list(duplicated_sources(venues))
+    truth = [venue for _, _, venue in rows]
+    
+    resolver = EntityResolver()
+    start = time.perf_counter()
+    for source, record, _ in rows:
+        resolver.add(record, source)
+    report("resolve add", len(truth), time.perf_counter() - start)
+    del rows
+    
+    gc.freeze()  # Nothing below is garbage; skip rescanning millions of container objects
+    start = time.perf_counter()
+    clusters = resolver.clusters()
+    report("resolve cluster", len(truth), time.perf_counter() - start)
+    print(f"  {resolver.summary()}")
+    print(f"  peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    
+    # Precision: clusters holding a single venue; recall: venues kept in a single cluster
+    impure = sum(1 for indexes in clusters if len({truth[i] for i in indexes}) > 1)
+    clusters_per_venue = {}
+    for indexes in clusters:
+        for venue in {truth[i] for i in indexes}:
+            clusters_per_venue[venue] = clusters_per_venue.get(venue, 0) + 1
+    split = sum(1 for count in clusters_per_venue.values() if count > 1)
+    ids = resolver.ids
+    mixed_ids = sum(1 for indexes in clusters if len({ids[i] for i in indexes} - {None}) > 1)
+    assert not mixed_ids, f"{mixed_ids} clusters hold more than one restaurantId"
+    print(f"  {venues} venues: {len(clusters)} clusters, {impure} mixing venues "
+          f"({1 - impure / len(clusters):.4%} precision), {split} venues split "
+          f"({1 - split / venues:.4%} recall)")
+    
+    start = time.perf_counter()
+    merged = [resolver.merge(indexes) for indexes in clusters[:100000]]
+    report("resolve merge", len(merged), time.perf_counter() - start)
+    gc.unfreeze()
+
+
+@benchmark
+def bench_recrawl(profiles=480, listings=20, requests_per_hour=100, days=4, warmup_days=1):
+    """Measured freshness per request on a simulated site: fixed-interval recrawl vs adaptive revisits"""
+    import contextlib
+    import io
+    from opentable_recrawl import DAY, HOUR, RecrawlDaemon, RevisitScheduler
+    from opentable_testserver import ChangingSite, LocalOpenTableServer, SimulatedClock
+    
+    # Known change rates: listing pages churn, a few profiles are volatile, most are stable
+    rng = random.Random(0)
+    pages = {f"/toronto-ontario-restaurants/{i}": ('listing', 1 / (2 * HOUR)) for i in range(listings)}
+    for i in range(profiles):
+        roll = rng.random()
+        mean_interval = 3 * HOUR if roll < 0.15 else 2 * DAY if roll < 0.5 else 30 * DAY
+        pages[f"/r/restaurant-{i}"] = ('profile', 1 / mean_interval)
+    print(f"{len(pages)} pages, budget {requests_per_hour}/h ({requests_per_hour * 24 / len(pages):.1f} "
+          f"visits per page per day), {days} simulated days")
+    
+    for policy in ('uniform', 'adaptive'):
+        clock = SimulatedClock()
+        site = ChangingSite(pages, clock, horizon=days * DAY, seed=1)
+        with LocalOpenTableServer(routes=site.routes()) as server:
+            base_url = server.base_url
+            scheduler = RevisitScheduler(':memory:', requests_per_hour=requests_per_hour, policy=policy, clock=clock)
+            for path, (kind, _) in pages.items():
+                scheduler.add(base_url + path, kind)
+            
+            fetched_version = {}
+            daemon = RecrawlDaemon(scheduler, sleep=clock.sleep)
+            
+            def fetch(url):
+                path = url[len(server.base_url):]
+                fetched_version[path] = site.version(path)
+                return daemon.http_fetch(url)
+            daemon.fetch = fetch
+            
+            # Sample every page's freshness against the site's true version every ten minutes
+            start = clock()
+            measure_from = start + warmup_days * DAY
+            next_sample = measure_from
+            samples = {'listing': [0, 0], 'profile': [0, 0]}
+            requests_measured = 0
+            wall = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                while clock() < start + days * DAY:
+                    if daemon.step() is not None and clock() >= measure_from:
+                        requests_measured += 1
+                    while next_sample <= clock():
+                        for path, (kind, _) in pages.items():
+                            samples[kind][0] += fetched_version.get(path) == site.version(path, next_sample)
+                            samples[kind][1] += 1
+                        next_sample += 600
+            wall = time.perf_counter() - wall
+        
+        fresh = sum(count for count, _ in samples.values()) / sum(total for _, total in samples.values())
+        listing_fresh = samples['listing'][0] / samples['listing'][1]
+        profile_fresh = samples['profile'][0] / samples['profile'][1]
+        measured_days = days - warmup_days
+        print(f"{policy}: freshness {fresh:.1%} (listings {listing_fresh:.1%}, profiles {profile_fresh:.1%}), "
+              f"{requests_measured} requests over {measured_days} days, "
+              f"{fresh * len(pages) / (requests_measured / (measured_days * 24)):.2f} fresh pages per request/h "
+              f"[{wall:.1f}s wall]")
+        print(f"  {scheduler.summary()}")
+        
+        # Noise a fingerprint picks up shows as change rates estimated above the true ones
+        ratios = {'listing': [], 'profile': []}
+        for path, (kind, rate) in pages.items():
+            state = scheduler.states[base_url + path]
+            if state.visits >= 3:
+                ratios[kind].append(scheduler.change_rate(state) / rate)
+        print("  estimated / true change rate, median: " + ', '.join(
+            f"{kind} {sorted(values)[len(values) // 2]:.2f}x" for kind, values in ratios.items() if values))
+        scheduler.close()
+    
+    # URLs added but never fetched must still be scheduled after a restart
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'recrawl.db')
+        clock = SimulatedClock()
+        with RevisitScheduler(path, clock=clock) as scheduler:
+            scheduler.add('https://example.com/r/a')
+            scheduler.add('https://example.com/r/b')
+        with RevisitScheduler(path, clock=clock) as scheduler:
+            polled = {scheduler.poll()[0], scheduler.poll()[0]}
+        assert polled == {'https://example.com/r/a', 'https://example.com/r/b'}, polled
+        print("restart: never-fetched URLs still due")
+
+
+@benchmark
+def bench_search(count=200000, queries=500):
+    """Build, load and query times of the full-text index over a national-sized dataset"""
+    import itertools
+    from opentable_search import SearchIndex, SearchIndexBuilder
+    
+    # Descriptions drawn from a Zipf-distributed vocabulary, like real text
+    rng = random.Random(0)
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'su', 'vi', 'pe', 'do', 'ba', 'gu', 'chi', 'ze', 'fo']
+    vocabulary = WORDS + [''.join(parts) for parts in itertools.product(syllables, repeat=4)][:20000]
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    
+    records = synthetic_records(count)
+    for record in records:
+        record['description'] = ' '.join(rng.choices(vocabulary, cum_weights=cumulative, k=60))
+        record['top_review'] = ' '.join(rng.choices(vocabulary, cum_weights=cumulative, k=15))
+    
+    builder = SearchIndexBuilder()
+    start = time.perf_counter()
+    builder.add_many(records)
+    report("index build", len(builder), time.perf_counter() - start)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.search')
+        start = time.perf_counter()
+        index = builder.save(path)
+        print(f"save: {time.perf_counter() - start:.2f}s, {len(index.terms):,} terms, {len(index.docs):,} postings")
+        del builder
+        
+        start = time.perf_counter()
+        index = SearchIndex.load(path)
+        print(f"mmap load: {(time.perf_counter() - start) * 1000:.1f}ms")
+        
+        by_id = {record['restaurant_id']: record for record in records}
+        kinds = [
+            ("common term", lambda: (rng.choice(WORDS[:5]), None, None)),
+            ("rare term", lambda: (rng.choice(vocabulary[5000:]), None, None)),
+            ("three terms", lambda: (' '.join(rng.sample(vocabulary[:2000], 3)), None, None)),
+            ("cuisine + neighborhood + text",
+             lambda: (rng.choice(vocabulary[:500]), rng.choice(CUISINES), rng.choice(NEIGHBORHOODS))),
+        ]
+        for label, make_query in kinds:
+            batch = [make_query() for _ in range(queries)]
+            start = time.perf_counter()
+            results = [index.search(text, cuisine=cuisine, neighborhood=neighborhood) for text, cuisine, neighborhood in batch]
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {elapsed / queries * 1000:.2f}ms per query")
+            
+            for (text, cuisine, neighborhood), hits in zip(batch, results):
+                for restaurant_id, _, _ in hits:
+                    record = by_id[restaurant_id]
+                    assert not cuisine or record['cuisine'] == cuisine
+                    assert not neighborhood or record['neighborhood'] == neighborhood
+        del index
+
+
+def main():
+    """Run the named benchmarks, or all of them"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}")
+            print(f"Available: {', '.join(BENCHMARKS)}")
+            continue
+        print(f"\n=== {name.upper()} ===")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+OpenTable Detail Client
+=======================
+Fetches phone and cuisine for many restaurants per round trip from the
+GraphQL layer behind the site instead of downloading /r/<slug> pages
+Requests are batched, concurrent lookups of the same restaurant share one
+in-flight request, and responses are shape-checked before use
+Restaurants the GraphQL layer can't answer fall back to the HTML profile page
+"""
+
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from opentable_phone import format_phone
+
+
+DETAILS_PATH = "/dapi/fe/gql"
+
+# Only the fields the scrapers actually use are requested
+DETAILS_QUERY = """
+query RestaurantsDetails($restaurantIds: [Int!], $slugs: [String!]) {
+  restaurants(restaurantIds: $restaurantIds, slugs: $slugs) {
+    restaurantId
+    urls { profileLink { link } }
+    contactInformation { phoneNumber formattedPhoneNumber }
+    primaryCuisine { name }
+  }
+}
+"""
+
+
+def restaurant_key(restaurant):
+    """Lookup key for a restaurant record: its id, or the slug of its profile URL"""
+    if restaurant.get('restaurant_id'):
+        return ('id', int(restaurant['restaurant_id']))
+    
+    path = urlparse(restaurant.get('url') or '').path.rstrip('/')
+    if '/r/' in path:
+        return ('slug', path.rsplit('/', 1)[-1])
+    return None
+
+
+def validate_detail(item):
+    """Check one response item has the shape we rely on, returns a reason or None"""
+    if not isinstance(item, dict):
+        return "item is not an object"
+    if not isinstance(item.get('restaurantId'), int):
+        return "missing restaurantId"
+    for field in ('contactInformation', 'primaryCuisine', 'urls'):
+        value = item.get(field)
+        if value is not None and not isinstance(value, dict):
+            return f"{field} is not an object"
+    contact = item.get('contactInformation') or {}
+    for field in ('phoneNumber', 'formattedPhoneNumber'):
+        if contact.get(field) is not None and not isinstance(contact[field], str):
+            return f"contactInformation.{field} is not a string"
+    cuisine = (item.get('primaryCuisine') or {}).get('name')
+    if cuisine is not None and not isinstance(cuisine, str):
+        return "primaryCuisine.name is not a string"
+    profile_link = (item.get('urls') or {}).get('profileLink')
+    if profile_link is not None and not isinstance(profile_link, dict):
+        return "urls.profileLink is not an object"
+    link = (profile_link or {}).get('link')
+    if link is not None and not isinstance(link, str):
+        return "urls.profileLink.link is not a string"
+    return None
+
+
+class RestaurantDetailClient:
+    def __init__(self, base_url="https://www.opentable.ca", batch_size=50, fallback=None, headers=None):
+        self.base_url = base_url
+        self.endpoint = base_url + DETAILS_PATH
+        self.batch_size = batch_size
+        # Called with a restaurant URL when GraphQL has no usable answer, e.g.
+        # AdvancedOpenTableScraper.get_restaurant_details; returns {'phone', 'cuisine'}
+        self.fallback = fallback
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'bytes': 0,
+            'restaurants': 0,
+            'coalesced': 0,
+            'invalid': 0,
+            'fallbacks': 0,
+        }
+    
+    def enrich(self, restaurants):
+        """Fill in missing phone and cuisine on restaurant records in place"""
+        wanted = []
+        for restaurant in restaurants:
+            if restaurant.get('phone') and restaurant.get('cuisine'):
+                continue
+            wanted.append((restaurant, restaurant_key(restaurant)))
+        
+        details = self.lookup([key for _, key in wanted if key])
+        
+        for restaurant, key in wanted:
+            detail = details.get(key) if key else None
+            if detail is None and self.fallback and restaurant.get('url'):
+                with self._lock:
+                    self.stats['fallbacks'] += 1
+                detail = self.fallback(restaurant['url'])
+            if not detail:
+                continue
+            if not restaurant.get('phone') and detail.get('phone'):
+                restaurant['phone'] = detail['phone']
+            if not restaurant.get('cuisine') and detail.get('cuisine'):
+                restaurant['cuisine'] = detail['cuisine']
+        
+        return restaurants
+    
+    def lookup(self, keys):
+        """Resolve lookup keys to detail dicts, sharing requests already in flight"""
+        futures = {}
+        to_send = []
+        
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                future = self._inflight.get(key)
+                if future is None:
+                    future = Future()
+                    self._inflight[key] = future
+                    to_send.append(key)
+                else:
+                    self.stats['coalesced'] += 1
+                futures[key] = future
+        
+        for start in range(0, len(to_send), self.batch_size):
+            self._send_batch(to_send[start:start + self.batch_size])
+        
+        return {key: future.result() for key, future in futures.items()}
+    
+    def _send_batch(self, keys):
+        """Send one GraphQL request and resolve the futures for its keys"""
+        results = {}
+        try:
+            results = self.fetch_batch(keys)
+        except Exception as e:
+            print(f"Detail batch of {len(keys)} failed: {e}")
+        finally:
+            with self._lock:
+                for key in keys:
+                    future = self._inflight.pop(key)
+                    future.set_result(results.get(key))
+    
+    def fetch_batch(self, keys):
+        """Query details for a batch of keys, returns {key: {'phone', 'cuisine'}}"""
+        payload = {
+            'operationName': 'RestaurantsDetails',
+            'query': DETAILS_QUERY,
+            'variables': {
+                'restaurantIds': [value for kind, value in keys if kind == 'id'],
+                'slugs': [value for kind, value in keys if kind == 'slug'],
+            },
+        }
+        params = {'optype': 'query', 'opname': 'RestaurantsDetails'}
+        response = self.session.post(self.endpoint, params=params, json=payload, timeout=30)
+        
+        # Bytes off the wire, before gzip is undone; the body has been read, so the count is final
+        raw = getattr(response, 'raw', None)
+        received = raw.tell() if hasattr(raw, 'tell') else len(response.content)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += received
+        response.raise_for_status()
+        
+        items = (response.json().get('data') or {}).get('restaurants')
+        if not isinstance(items, list):
+            raise ValueError("response has no data.restaurants list")
+        
+        results = {}
+        for item in items:
+            problem = validate_detail(item)
+            if problem:
+                with self._lock:
+                    self.stats['invalid'] += 1
+                print(f"Skipping malformed detail: {problem}")
+                continue
+            
+            detail = {
+                'phone': format_phone(
+                    (item.get('contactInformation') or {}).get('formattedPhoneNumber')
+                    or (item.get('contactInformation') or {}).get('phoneNumber') or ''
+                ),
+                'cuisine': ((item.get('primaryCuisine') or {}).get('name') or '').strip(),
+            }
+            results[('id', item['restaurantId'])] = detail
+            
+            link = ((item.get('urls') or {}).get('profileLink') or {}).get('link') or ''
+            if link:
+                results[('slug', urlparse(link).path.rstrip('/').rsplit('/', 1)[-1])] = detail
+        
+        with self._lock:
+            self.stats['restaurants'] += len(items)
+        return results
+    
+    def print_stats(self):
+        """Print requests and bytes transferred per restaurant"""
+        restaurants = max(self.stats['restaurants'], 1)
+        print(f"Detail requests: {self.stats['requests']} for {self.stats['restaurants']} restaurants "
+              f"({self.stats['requests'] / restaurants:.3f} requests/restaurant)")
+        print(f"Bytes transferred: {self.stats['bytes']:,} ({self.stats['bytes'] / restaurants:,.0f} bytes/restaurant)")
+        print(f"Coalesced lookups: {self.stats['coalesced']}, malformed items: {self.stats['invalid']}, "
+              f"HTML fallbacks: {self.stats['fallbacks']}")
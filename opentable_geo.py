@@ -0,0 +1,266 @@
+"""
+OpenTable Spatial Index
+=======================
+Grid index over restaurant coordinates for radius, k-nearest and
+bounding-box queries, plus quadtree tiles for planning geographic crawls
+Coordinates live in NumPy arrays sorted by grid cell, so every query is a
+few binary searches followed by vectorized distance math on contiguous slices
+The index is saved as .npy files next to the restaurant store and loaded via mmap
+Usage: python opentable_geo.py build [--db restaurants.db]
+       python opentable_geo.py near 43.6568 -79.4075 --radius 1000
+       python opentable_geo.py nearest 43.6568 -79.4075 -k 10
+"""
+
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat, lon, lats, lons):
+    """Great-circle distance in meters from one point to arrays of points"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def index_path_for(db_path):
+    """Directory the spatial index is stored in for a given store path"""
+    root, _ = os.path.splitext(db_path)
+    return root + ".geo"
+
+
+class SpatialIndex:
+    def __init__(self, lats, lons, ids, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        ids = np.asarray(ids, dtype=np.int64)
+        
+        # Sort points by grid cell so each row of cells is one contiguous slice
+        self.lat0 = float(lats.min()) if len(lats) else 0.0
+        self.lon0 = float(lons.min()) if len(lons) else 0.0
+        cols = ((lons - self.lon0) / cell_deg).astype(np.int64)
+        self.ncols = int(cols.max()) + 1 if len(cols) else 1
+        keys = self._keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        
+        self.keys = keys[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.ids = ids[order]
+    
+    @classmethod
+    def from_records(cls, restaurants, cell_deg=0.01):
+        """Build from restaurant dicts that carry latitude and longitude"""
+        lats, lons, ids = [], [], []
+        for restaurant in restaurants:
+            if restaurant.get('latitude') is None or restaurant.get('longitude') is None:
+                continue
+            lats.append(restaurant['latitude'])
+            lons.append(restaurant['longitude'])
+            ids.append(restaurant.get('restaurant_id') or -1)
+        return cls(lats, lons, ids, cell_deg)
+    
+    @classmethod
+    def from_store(cls, store, cell_deg=0.01):
+        """Build from every restaurant in a RestaurantStore"""
+        return cls.from_records(store.iter_all(), cell_deg)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def _keys(self, lats, lons):
+        """Grid cell key (row * ncols + col) for arrays of coordinates"""
+        rows = np.floor((lats - self.lat0) / self.cell_deg).astype(np.int64)
+        cols = np.floor((lons - self.lon0) / self.cell_deg).astype(np.int64)
+        return rows * self.ncols + cols
+    
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Index array of points in the grid cells overlapping a bounding box"""
+        row_start = math.floor((min_lat - self.lat0) / self.cell_deg)
+        row_end = math.floor((max_lat - self.lat0) / self.cell_deg)
+        col_start = max(math.floor((min_lon - self.lon0) / self.cell_deg), 0)
+        col_end = min(math.floor((max_lon - self.lon0) / self.cell_deg), self.ncols - 1)
+        if col_start > col_end:
+            return np.empty(0, dtype=np.int64)
+        
+        rows = np.arange(row_start, row_end + 1, dtype=np.int64)
+        starts = np.searchsorted(self.keys, rows * self.ncols + col_start, side='left')
+        ends = np.searchsorted(self.keys, rows * self.ncols + col_end, side='right')
+        
+        slices = [np.arange(start, end) for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+    
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Restaurant ids inside a bounding box"""
+        candidates = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        lats = self.lats[candidates]
+        lons = self.lons[candidates]
+        mask = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return self.ids[candidates[mask]]
+    
+    def radius(self, lat, lon, meters):
+        """(ids, distances) of restaurants within `meters` of a point, nearest first"""
+        dlat = meters / METERS_PER_DEGREE
+        dlon = meters / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        candidates = self._candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        
+        distances = haversine_m(lat, lon, self.lats[candidates], self.lons[candidates])
+        mask = distances <= meters
+        candidates = candidates[mask]
+        distances = distances[mask]
+        
+        order = np.argsort(distances, kind='stable')
+        return self.ids[candidates[order]], distances[order]
+    
+    def nearest(self, lat, lon, k=10):
+        """(ids, distances) of the k nearest restaurants"""
+        k = min(k, len(self))
+        if k == 0:
+            return self.ids[:0], np.empty(0)
+        
+        # Grow the search radius until it holds k points; any point closer than
+        # the kth found is guaranteed to be inside the searched circle
+        meters = self.cell_deg * METERS_PER_DEGREE
+        while True:
+            ids, distances = self.radius(lat, lon, meters)
+            if len(ids) >= k:
+                return ids[:k], distances[:k]
+            if meters > math.pi * EARTH_RADIUS_M:
+                return ids, distances
+            meters *= 2
+    
+    def tiles(self, max_per_tile=500, min_size_deg=0.005):
+        """Quadtree bounding boxes that each hold at most max_per_tile restaurants"""
+        result = []
+        stack = [(np.arange(len(self)), float(self.lats.min()), float(self.lons.min()),
+                  float(self.lats.max()), float(self.lons.max()))] if len(self) else []
+        
+        while stack:
+            members, min_lat, min_lon, max_lat, max_lon = stack.pop()
+            too_small = (max_lat - min_lat) < min_size_deg and (max_lon - min_lon) < min_size_deg
+            if len(members) <= max_per_tile or too_small:
+                result.append({
+                    'min_lat': min_lat, 'min_lon': min_lon,
+                    'max_lat': max_lat, 'max_lon': max_lon,
+                    'count': int(len(members)),
+                })
+                continue
+            
+            mid_lat = (min_lat + max_lat) / 2
+            mid_lon = (min_lon + max_lon) / 2
+            north = self.lats[members] > mid_lat
+            east = self.lons[members] > mid_lon
+            for is_north, is_east in ((False, False), (False, True), (True, False), (True, True)):
+                quadrant = members[(north == is_north) & (east == is_east)]
+                if len(quadrant):
+                    stack.append((
+                        quadrant,
+                        mid_lat if is_north else min_lat,
+                        mid_lon if is_east else min_lon,
+                        max_lat if is_north else mid_lat,
+                        max_lon if is_east else mid_lon,
+                    ))
+        
+        return result
+    
+    def save(self, path):
+        """Write the index as .npy files plus a small JSON header"""
+        os.makedirs(path, exist_ok=True)
+        for name in ('keys', 'lats', 'lons', 'ids'):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({
+                'cell_deg': self.cell_deg,
+                'lat0': self.lat0,
+                'lon0': self.lon0,
+                'ncols': self.ncols,
+                'count': len(self),
+            }, file)
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved index; with mmap the arrays are paged in on demand"""
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        
+        index = cls.__new__(cls)
+        index.cell_deg = meta['cell_deg']
+        index.lat0 = meta['lat0']
+        index.lon0 = meta['lon0']
+        index.ncols = meta['ncols']
+        for name in ('keys', 'lats', 'lons', 'ids'):
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None))
+        return index
+
+
+def main():
+    """Build and query the spatial index stored next to the restaurant store"""
+    parser = argparse.ArgumentParser(description="OpenTable restaurant spatial index")
+    parser.add_argument('--db', default='restaurants.db', help="SQLite database path")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    build_parser = subparsers.add_parser('build', help="Build the index from the store")
+    build_parser.add_argument('--cell', type=float, default=0.01, help="Grid cell size in degrees")
+    
+    near_parser = subparsers.add_parser('near', help="Restaurants within a radius")
+    near_parser.add_argument('lat', type=float)
+    near_parser.add_argument('lon', type=float)
+    near_parser.add_argument('--radius', type=float, default=1000, help="Radius in meters")
+    
+    nearest_parser = subparsers.add_parser('nearest', help="k nearest restaurants")
+    nearest_parser.add_argument('lat', type=float)
+    nearest_parser.add_argument('lon', type=float)
+    nearest_parser.add_argument('-k', type=int, default=10)
+    
+    tiles_parser = subparsers.add_parser('tiles', help="Plan crawl tiles")
+    tiles_parser.add_argument('--max', type=int, default=500, help="Restaurants per tile")
+    
+    args = parser.parse_args()
+    path = index_path_for(args.db)
+    
+    if args.command == 'build':
+        from opentable_storage import RestaurantStore
+        with RestaurantStore(args.db) as store:
+            index = SpatialIndex.from_store(store, args.cell)
+        index.save(path)
+        print(f"Indexed {len(index)} restaurants into {path}")
+        return
+    
+    index = SpatialIndex.load(path)
+    
+    if args.command == 'tiles':
+        tiles = index.tiles(args.max)
+        for tile in tiles:
+            print(json.dumps(tile))
+        print(f"\n{len(tiles)} tiles")
+        return
+    
+    if args.command == 'near':
+        ids, distances = index.radius(args.lat, args.lon, args.radius)
+    else:
+        ids, distances = index.nearest(args.lat, args.lon, args.k)
+    
+    from opentable_storage import RestaurantStore
+    with RestaurantStore(args.db) as store:
+        names = {r['restaurant_id']: r['name'] for r in store.get_many(ids.tolist())}
+    for restaurant_id, distance in zip(ids.tolist(), distances.tolist()):
+        print(f"{distance:8.0f}m  {names.get(restaurant_id, restaurant_id)}")
+    print(f"\n{len(ids)} restaurants found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+OpenTable Photo Harvester
+=========================
+Downloads the restaurant photos listed in parsed records into a content-addressed store
+Photo URLs come from the parser's 'photos' field ({size: url} per restaurant).
+Downloads run on a bounded thread pool sharing one connection pool, and each
+body is streamed to a temporary file while it is hashed, so memory use does
+not depend on image size. Files are stored under their SHA-256, which makes
+identical images (placeholders, photos shared between sizes or locations)
+a single file on disk. A compact JSON manifest keeps each URL's hash, ETag and
+Last-Modified, so the next run sends conditional requests and an unchanged
+photo costs a 304 instead of a download
+Usage: python opentable.py photos opentable_response.html --dir photos/ [--size medium] [--workers 8]
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from opentable_retry import Retrier
+
+
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 65536
+
+
+def photo_jobs(restaurants, sizes=('medium',)):
+    """Yield (restaurant key, size, url) for the wanted sizes of every restaurant's photos"""
+    for restaurant in restaurants:
+        photos = restaurant.get('photos') or {}
+        key = str(restaurant.get('restaurant_id') or restaurant.get('url') or restaurant.get('name'))
+        for size in sizes:
+            url = photos.get(size)
+            if url:
+                yield key, size, url
+
+
+def extension_for(url):
+    """File extension of a URL's path, '.jpg' when it has none"""
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    return extension if extension and len(extension) <= 5 else '.jpg'
+
+
+class PhotoManifest:
+    """URL -> [sha256, extension, etag, last_modified] and restaurant -> {size: url}, saved as one JSON file"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.urls = {}
+        self.photos = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == MANIFEST_VERSION:
+                self.urls = data['urls']
+                self.photos = data['photos']
+    
+    def __len__(self):
+        return len(self.urls)
+    
+    def get(self, url):
+        return self.urls.get(url)
+    
+    def set(self, url, digest, extension, etag, last_modified):
+        self.urls[url] = [digest, extension, etag, last_modified]
+    
+    def link(self, key, size, url):
+        self.photos.setdefault(key, {})[size] = url
+    
+    def save(self):
+        """Write the manifest atomically, without whitespace"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False, encoding='utf-8') as file:
+            json.dump({'version': MANIFEST_VERSION, 'urls': self.urls, 'photos': self.photos}, file,
+                      separators=(',', ':'))
+        os.replace(file.name, self.path)
+
+
+class PhotoHarvester:
+    def __init__(self, directory="photos", sizes=('medium',), workers=8, timeout=30, retrier=None, headers=None):
+        self.directory = directory
+        self.sizes = tuple(sizes)
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retrier = retrier or Retrier()
+        self.manifest = PhotoManifest(os.path.join(directory, 'manifest.json'))
+        os.makedirs(os.path.join(directory, 'tmp'), exist_ok=True)
+        
+        # One connection per worker, so concurrent downloads reuse connections instead of queueing for one
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers or {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
+            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+        })
+        
+        self._lock = threading.Lock()
+        self.stats = {'photos': 0, 'downloaded': 0, 'deduplicated': 0, 'unchanged': 0, 'failed': 0,
+                      'bytes_downloaded': 0, 'bytes_stored': 0, 'seconds': 0.0}
+    
+    def blob_path(self, digest, extension):
+        """Where the file with this content hash lives"""
+        return os.path.join(self.directory, digest[:2], digest + extension)
+    
+    def path_for(self, url):
+        """Local file for a harvested URL, or None"""
+        entry = self.manifest.get(url)
+        return self.blob_path(entry[0], entry[1]) if entry else None
+    
+    def harvest(self, restaurants):
+        """Download every wanted photo of these restaurants, returning the run's stats
+        
+        Each URL is fetched once however many restaurants share it, and only
+        twice the worker count are queued at a time, so restaurants can be a
+        lazy iterator over a large crawl
+        """
+        start = time.perf_counter()
+        queued = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = deque()
+                for key, size, url in photo_jobs(restaurants, self.sizes):
+                    with self._lock:
+                        self.stats['photos'] += 1
+                        self.manifest.link(key, size, url)
+                    if url in queued:
+                        continue
+                    queued.add(url)
+                    pending.append(executor.submit(self.fetch, url))
+                    while len(pending) >= 2 * self.workers or (pending and pending[0].done()):
+                        pending.popleft().result()
+                while pending:
+                    pending.popleft().result()
+        finally:
+            self.manifest.save()
+            self.stats['seconds'] += time.perf_counter() - start
+        return self.stats
+    
+    def fetch(self, url):
+        """Download one URL unless the server says our copy is current; failures are counted, not raised"""
+        entry = self.manifest.get(url)
+        headers = {}
+        if entry and os.path.exists(self.blob_path(entry[0], entry[1])):
+            if entry[2]:
+                headers['If-None-Match'] = entry[2]
+            if entry[3]:
+                headers['If-Modified-Since'] = entry[3]
+        
+        def send(url):
+            response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+            if response.status_code >= 400:
+                # Read the (small) error body so the connection goes back to the pool
+                response.content
+            return response
+        
+        try:
+            outcome = self.retrier.call(url, send, accept=lambda response: self.store(url, response))
+        except Exception as e:
+            print(f"Photo {url} failed: {e}")
+            outcome = 'failed'
+        with self._lock:
+            self.stats[outcome] += 1
+        return outcome
+    
+    def store(self, url, response):
+        """Stream a response body into the store; returns which stat it counts towards"""
+        try:
+            if response.status_code == 304:
+                # Closing a streamed response with its body unread drops the connection; drain the empty body first
+                response.content
+                return 'unchanged'
+            
+            digest = hashlib.sha256()
+            size = 0
+            with tempfile.NamedTemporaryFile(dir=os.path.join(self.directory, 'tmp'), delete=False) as file:
+                try:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                except BaseException:
+                    file.close()
+                    os.unlink(file.name)
+                    raise
+        finally:
+            response.close()
+        
+        digest = digest.hexdigest()
+        extension = extension_for(url)
+        path = self.blob_path(digest, extension)
+        with self._lock:
+            self.stats['bytes_downloaded'] += size
+            stored = os.path.exists(path)
+            if stored:
+                os.unlink(file.name)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(file.name, path)
+                self.stats['bytes_stored'] += size
+            self.manifest.set(url, digest, extension, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return 'deduplicated' if stored else 'downloaded'
+    
+    def close(self):
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['photos']} photos: {stats['downloaded']} downloaded, {stats['deduplicated']} duplicates "
+                f"of stored files, {stats['unchanged']} unchanged (304), {stats['failed']} failed; "
+                f"{stats['bytes_downloaded'] / 2**20:.1f} MB transferred, {stats['bytes_stored'] / 2**20:.1f} MB "
+                f"stored in {stats['seconds']:.1f}s")
@@ -0,0 +1,279 @@
+"""
+OpenTable Memory Bounds
+=======================
+Deterministic parse-tree teardown and an optional memory watchdog for long crawls
+A BeautifulSoup tree is a web of parent, sibling and next_element references,
+so a dropped soup is only freed when the cyclic garbage collector gets to it;
+by then it has often been promoted to an older generation, and over a long
+crawl RSS creeps up. parsed_html() tears the tree down as soon as extraction
+is done, which lets reference counting free it on the spot. MemoryWatchdog
+samples RSS before each page; past its limit it collects garbage, reports the
+top allocation sites from tracemalloc and pauses fetching until memory is
+back under the limit
+Usage: with parsed_html(response.content) as soup: ...
+       watchdog = MemoryWatchdog(rss_limit_mb=512, trace=True); watchdog.throttle()
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def release_soup(soup):
+    """Break every reference cycle in a parse tree so it is freed without the GC
+    
+    BeautifulSoup.decompose() on the document itself stops at the root, so
+    each top-level node is decomposed first; elements and strings taken from
+    the tree are unusable afterwards, copy what you need with str() first
+    """
+    if soup is None:
+        return
+    for child in list(soup.contents):
+        child.decompose()
+    soup.decompose()
+
+
+@contextmanager
+def parsed_html(content, parser='html.parser'):
+    """BeautifulSoup tree for a page, torn down when the block exits; bs4 is imported on first use"""
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(content, parser)
+    try:
+        yield soup
+    finally:
+        release_soup(soup)
+
+
+def _proc_reader():
+    """Linux: resident pages from /proc/self/statm"""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    
+    def read():
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * page_size
+    return read
+
+
+def _psutil_reader():
+    import psutil
+    return psutil.Process().memory_info
+
+
+def _windows_reader():
+    """Windows: WorkingSetSize from GetProcessMemoryInfo"""
+    import ctypes
+    from ctypes import wintypes
+    
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage',
+            )
+        ]
+    
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    get_info = kernel32.K32GetProcessMemoryInfo
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+    get_info.restype = wintypes.BOOL
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    process = kernel32.GetCurrentProcess()
+    
+    def read():
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not get_info(process, ctypes.byref(counters), counters.cb):
+            raise OSError(ctypes.get_last_error(), "GetProcessMemoryInfo failed")
+        return counters.WorkingSetSize
+    return read
+
+
+def _mach_reader():
+    """macOS: resident_size from task_info(MACH_TASK_BASIC_INFO)"""
+    import ctypes
+    import ctypes.util
+    
+    class MachTaskBasicInfo(ctypes.Structure):
+        _fields_ = [('virtual_size', ctypes.c_uint64), ('resident_size', ctypes.c_uint64),
+                    ('resident_size_max', ctypes.c_uint64), ('user_time', ctypes.c_int32 * 2),
+                    ('system_time', ctypes.c_int32 * 2), ('policy', ctypes.c_int32),
+                    ('suspend_count', ctypes.c_int32)]
+    
+    MACH_TASK_BASIC_INFO = 20
+    libc = ctypes.CDLL(ctypes.util.find_library('c'))
+    task = ctypes.c_uint32.in_dll(libc, 'mach_task_self_').value
+    task_info = libc.task_info
+    task_info.argtypes = [ctypes.c_uint32, ctypes.c_int, ctypes.POINTER(MachTaskBasicInfo),
+                          ctypes.POINTER(ctypes.c_uint32)]
+    task_info.restype = ctypes.c_int
+    
+    def read():
+        info = MachTaskBasicInfo()
+        count = ctypes.c_uint32(ctypes.sizeof(info) // 4)
+        result = task_info(task, MACH_TASK_BASIC_INFO, ctypes.byref(info), ctypes.byref(count))
+        if result != 0:
+            raise OSError(result, "task_info failed")
+        return info.resident_size
+    return read
+
+
+_rss_reader = None
+
+
+def rss_reader():
+    """Function returning this process's current RSS in bytes, or None where no such reading is available
+    
+    Peak RSS (ru_maxrss) is deliberately not a fallback: it never goes
+    down, so a limit check against it would stay tripped once crossed
+    """
+    global _rss_reader
+    if _rss_reader is None:
+        _rss_reader = False
+        candidates = [_proc_reader, _psutil_reader]
+        if sys.platform == 'win32':
+            candidates.append(_windows_reader)
+        elif sys.platform == 'darwin':
+            candidates.append(_mach_reader)
+        for candidate in candidates:
+            try:
+                read = candidate()
+                read()
+            except Exception:
+                continue
+            # psutil hands back its memory_info named tuple
+            _rss_reader = (lambda: read().rss) if candidate is _psutil_reader else read
+            break
+    return _rss_reader or None
+
+
+def rss_bytes():
+    """Current resident set size of this process, None when it can't be read on this platform"""
+    reader = rss_reader()
+    return reader() if reader is not None else None
+
+
+class MemoryWatchdog:
+    def __init__(self, rss_limit_mb=None, trace=False, frames=1, top=10, pause=1.0, max_pause=60.0,
+                 sleep=time.sleep, rss=rss_bytes):
+        # Fetching pauses while RSS is above this; with None, throttle() still samples RSS for the peak
+        self.rss_limit = rss_limit_mb * 1024 * 1024 if rss_limit_mb else None
+        # tracemalloc slows allocation noticeably, so allocation sites are only traced on request
+        self.trace = trace
+        self.frames = frames
+        self.top = top
+        # Seconds between checks while paused, and the longest a single pause may last
+        self.pause = pause
+        self.max_pause = max_pause
+        self.sleep = sleep
+        self.rss = rss
+        if self.rss_limit is not None and rss() is None:
+            print("Memory watchdog: current RSS can't be read on this platform (install psutil), "
+                  "the memory limit is disabled")
+            self.rss_limit = None
+        self.baseline = None
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self.stats = {'checks': 0, 'over_limit': 0, 'pauses': 0, 'paused': 0.0, 'peak': 0, 'collected': 0}
+    
+    def start(self):
+        """Begin tracing allocations when trace is set, with a baseline snapshot to compare against"""
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        if tracemalloc.is_tracing():
+            self.baseline = tracemalloc.take_snapshot()
+        return self
+    
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.baseline = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def check(self):
+        """Current RSS in bytes, updating the peak; None when it can't be read"""
+        rss = self.rss()
+        with self._lock:
+            self.stats['checks'] += 1
+            if rss is not None:
+                self.stats['peak'] = max(self.stats['peak'], rss)
+        return rss
+    
+    def over_limit(self):
+        """Sample RSS, updating the peak even without a limit, and say whether it is over the limit"""
+        rss = self.check()
+        return self.rss_limit is not None and rss is not None and rss > self.rss_limit
+    
+    def throttle(self):
+        """Call before fetching the next page; returns seconds spent paused
+        
+        Over the limit, a full collection runs first. If that is not enough
+        the top allocators are reported and the caller waits, so threads
+        still working on earlier pages can drain, until RSS is back under
+        the limit or max_pause runs out
+        """
+        if not self.over_limit():
+            return 0.0
+        with self._lock:
+            self.stats['over_limit'] += 1
+            self.stats['collected'] += gc.collect()
+        if not self.over_limit():
+            return 0.0
+        
+        print(f"Memory watchdog: RSS {(self.check() or 0) / 2**20:.0f} MB over the "
+              f"{self.rss_limit / 2**20:.0f} MB limit, pausing fetches")
+        self.report()
+        waited = 0.0
+        while waited < self.max_pause and self.over_limit():
+            self.sleep(self.pause)
+            waited += self.pause
+            gc.collect()
+        with self._lock:
+            self.stats['pauses'] += 1
+            self.stats['paused'] += waited
+        return waited
+    
+    def top_allocators(self, limit=None):
+        """[(location, bytes allocated since start, blocks)] largest first; empty unless tracing"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        if self.baseline is not None:
+            stats = snapshot.compare_to(self.baseline, 'lineno')
+            rows = [(stat.traceback[0], stat.size_diff, stat.count_diff) for stat in stats]
+        else:
+            rows = [(stat.traceback[0], stat.size, stat.count) for stat in snapshot.statistics('lineno')]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return [(f"{frame.filename}:{frame.lineno}", size, count) for frame, size, count in rows[:limit or self.top]]
+    
+    def report(self):
+        """Print the top allocation sites, when tracing"""
+        for location, size, count in self.top_allocators():
+            print(f"  {size / 1024:10.1f} KiB {count:>8} blocks  {location}")
+    
+    def summary(self):
+        stats = self.stats
+        if not stats['checks']:
+            return "RSS not sampled"
+        if not stats['peak']:
+            return "RSS not available on this platform"
+        if self.rss_limit is None:
+            return f"peak RSS {stats['peak'] / 2**20:.0f} MB over {stats['checks']} checks, no limit set"
+        return (f"peak RSS {stats['peak'] / 2**20:.0f} MB of {self.rss_limit / 2**20:.0f} MB, "
+                f"over the limit {stats['over_limit']} times, "
+                f"paused {stats['pauses']} times for {stats['paused']:.1f}s")
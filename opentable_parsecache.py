@@ -0,0 +1,176 @@
+"""
+OpenTable Parse Cache
+=====================
+On-disk cache of parse results keyed by a hash of the response body
+Listing pages are often byte-identical across re-runs and candidate URLs, so
+the extracted records are stored once per (body, parser version) and later
+parses of the same body skip HTML and JSON parsing entirely
+Entries are zlib-compressed JSON files; the least recently used ones are
+evicted once the cache grows past its size limit
+Usage: python opentable_parsecache.py stats parse-cache/
+       python opentable_parsecache.py clear parse-cache/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+ENTRY_SUFFIX = ".json.z"
+
+
+def body_key(body, version):
+    """Cache key for a response body parsed by a given parser version
+    
+    xxh3 is used when xxhash is installed and blake2b otherwise; the two give
+    different keys, so switching between them only costs a cold cache
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    suffix = b'\0' + str(version).encode('utf-8')
+    if xxhash is not None:
+        digest = xxhash.xxh3_128(body)
+    else:
+        digest = hashlib.blake2b(body, digest_size=16)
+    digest.update(suffix)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    def __init__(self, directory="parse-cache", max_bytes=256 * 1024 * 1024, level=3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        
+        # key -> stored size, least recently used first; an earlier run's
+        # access order is recovered from the files' modification times
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        found = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(ENTRY_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+    
+    def key(self, body, version):
+        """Key for a body parsed by a given parser version, hashed once and passed to get and put"""
+        return body_key(body, version)
+    
+    def get(self, key):
+        """Cached parse result for a key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+        
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                result = json.loads(zlib.decompress(file.read()))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            # Removed by another process or torn; treat as a miss and forget it
+            self._forget(key)
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        
+        with self._lock:
+            self.stats['hits'] += 1
+        return result
+    
+    def put(self, key, result):
+        """Store a JSON-serializable parse result, evicting least recently used entries past max_bytes"""
+        data = zlib.compress(json.dumps(result, separators=(',', ':')).encode('utf-8'), self.level)
+        
+        # Write to a temporary name first so readers never see a partial entry
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.stats['stores'] += 1
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                self.stats['evictions'] += 1
+                evicted.append(old_key)
+        
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+    
+    def _forget(self, key):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self.total_bytes -= size
+    
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+    
+    def summary(self):
+        """One-line description of cache effectiveness so far"""
+        return (f"{self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{len(self._entries)} entries ({self.total_bytes:,} bytes), "
+                f"{self.stats['evictions']} evicted")
+
+
+def main():
+    """Show or clear a parse cache directory"""
+    parser = argparse.ArgumentParser(description="OpenTable parse-result cache")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('directory')
+    args = parser.parse_args()
+    
+    cache = ParseCache(args.directory)
+    if args.command == 'stats':
+        print(f"{len(cache)} entries, {cache.total_bytes:,} bytes in {args.directory}")
+    else:
+        count = len(cache)
+        cache.clear()
+        print(f"Removed {count} entries from {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,31 +9,240 @@ Outputs: CSV file with the restaurant data
 import json
 import csv
 import re
-from bs4 import BeautifulSoup
 import html
+from opentable_phone import format_phone
+from opentable_schema import compile_schema, empty_record, restaurant_fields
 
 
-class OpenTableDocumentParser:
+# Bump whenever extraction output changes, so cached parse results are not reused
+PARSER_VERSION = 2
+
+
+class WindowVarsScanner:
+    """Incremental scanner that pulls the primary-window-vars JSON out of a body fed in chunks
+    
+    Only the script's contents are kept; everything before it is discarded
+    as it arrives, and feed() reports when the script has closed so the
+    caller can stop downloading the rest of the page
+    """
+    
+    START = b'<script id="primary-window-vars" type="application/json">'
+    END = b'</script>'
+    
     def __init__(self):
+        self.buffer = bytearray()
+        self.payload = None
+        self.done = False
+        self.bytes_fed = 0
+    
+    def feed(self, chunk):
+        """Consume the next chunk of the body, returns True once the script is complete"""
+        if self.done:
+            return True
+        self.bytes_fed += len(chunk)
+        
+        if self.payload is None:
+            self.buffer += chunk
+            start = self.buffer.find(self.START)
+            if start == -1:
+                # Keep just enough for a start tag split across chunks
+                del self.buffer[:-len(self.START)]
+                return False
+            self.payload = self.buffer[start + len(self.START):]
+            self.buffer = None
+            search_from = 0
+        else:
+            search_from = max(0, len(self.payload) - len(self.END))
+            self.payload += chunk
+        
+        end = self.payload.find(self.END, search_from)
+        if end != -1:
+            del self.payload[end:]
+            self.done = True
+        return self.done
+    
+    def data(self):
+        """Decoded JSON once the script is complete, otherwise None"""
+        if not self.done:
+            return None
+        return json.loads(html.unescape(self.payload.decode('utf-8')))
+    
+    def document(self):
+        """The script alone as a minimal page that parses like the full one, or None"""
+        if not self.done:
+            return None
+        return self.START + bytes(self.payload) + self.END
+
+
+class OpenTableDocumentParser:
+    def __init__(self, base_url="https://www.opentable.ca", cache=None):
         self.restaurants = []
-        self.base_url = "https://www.opentable.ca"
+        self.base_url = base_url
+        
+        # Optional ParseCache; pages whose body was parsed before are not parsed again
+        self.cache = cache
+        self.cache_version = f"document:{PARSER_VERSION}:{base_url}"
+        
+        # Field accessors built once from the schema
+        self.fields = restaurant_fields(self.base_url)
+        self.extract_restaurant = compile_schema(self.fields)
+        
+        # Collected while parsing for the availability subsystem
+        self.availability_tokens = {}
+        self.availability_context = {}
+        
+        # Bytes read for the most recent iter_restaurants_from_url call
+        self.last_stream = {}
+    
+    def iter_restaurants(self, filepath):
+        """Lazily yield restaurants from an OpenTable HTML response file"""
+        with open(filepath, 'rb') as file:
+            content = file.read()
+        
+        yield from self.iter_restaurants_from_html(content)
+    
+    def iter_restaurants_from_html(self, content):
+        """Lazily yield restaurants from the text (or raw bytes) of an OpenTable listing page"""
+        if self.cache is not None:
+            yield from self.cached_restaurants_from_html(content)
+            return
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+        
+        # Extract JSON data from the script tag
+        json_data = self.extract_json_from_html(content)
+        if not json_data:
+            print("No JSON data found in HTML file")
+            return
+        
+        yield from self.iter_restaurants_from_json(json_data)
+    
+    def cached_restaurants_from_html(self, content):
+        """Restaurants of a listing page, from self.cache when this body was parsed before
+        
+        A hit restores the page's availability tokens and context as well, so
+        it leaves the parser in the same state as a fresh parse would
+        """
+        key = self.cache.key(content, self.cache_version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.availability_tokens.update((int(key), token) for key, token in cached['tokens'])
+            if cached['context']:
+                self.availability_context = cached['context']
+            return cached['restaurants']
+        
+        context_before = self.availability_context
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+        json_data = self.extract_json_from_html(content)
+        if json_data:
+            restaurants = self.extract_restaurants_from_json(json_data)
+        else:
+            print("No JSON data found in HTML file")
+            restaurants = []
+        
+        tokens = [
+            (r['restaurant_id'], self.availability_tokens[r['restaurant_id']])
+            for r in restaurants if r['restaurant_id'] in self.availability_tokens
+        ]
+        context = self.availability_context if self.availability_context is not context_before else None
+        self.cache.put(key, {'restaurants': restaurants, 'tokens': tokens, 'context': context})
+        return restaurants
+    
+    def read_window_vars(self, chunks):
+        """Feed body chunks to a WindowVarsScanner until the JSON script closes
+        
+        Returns (data or None, scanner); chunks after the script are never pulled
+        """
+        scanner = WindowVarsScanner()
+        for chunk in chunks:
+            if scanner.feed(chunk):
+                break
+        return scanner.data(), scanner
+    
+    def read_streamed_response(self, response, chunk_size=16384):
+        """Read a streamed response until the JSON script closes, then hang up
+        
+        Returns (data or None, scanner). self.last_stream records the bytes
+        received off the wire, comparable with the advertised Content-Length,
+        next to the decoded bytes the scanner was fed
+        """
+        try:
+            data, scanner = self.read_window_vars(response.iter_content(chunk_size))
+            raw = getattr(response, 'raw', None)
+            received = raw.tell() if hasattr(raw, 'tell') else scanner.bytes_fed
+        finally:
+            # Closing a streamed response mid-body drops the connection instead of draining it
+            response.close()
+        
+        self.last_stream = {
+            'url': response.url,
+            'bytes_received': received,
+            'bytes_decoded': scanner.bytes_fed,
+            'content_length': int(response.headers.get('Content-Length') or 0),
+            'complete': scanner.done,
+        }
+        return data, scanner
+    
+    def iter_restaurants_from_url(self, url, session=None, chunk_size=16384):
+        """Stream a listing page and yield its restaurants as soon as the JSON script has arrived
+        
+        The download is abandoned once the script closes, so the rest of the
+        page is neither transferred in full nor held in memory
+        """
+        if session is None:
+            import requests
+            session = requests.Session()
+        
+        response = session.get(url, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        data, scanner = self.read_streamed_response(response, chunk_size)
+        if data is None:
+            print(f"No JSON data found in {url}")
+            return
+        
+        yield from self.iter_restaurants_from_json(data)
+    
+    def iter_archived_restaurants(self, archive, urls=None):
+        """Lazily yield restaurants from pages in an ArchiveReader or archive directory
+        
+        Every archived page is parsed in write order, or only the given URLs,
+        each read from its own frame without decompressing the whole segment
+        """
+        if isinstance(archive, str):
+            from opentable_archive import ArchiveReader
+            archive = ArchiveReader(archive)
+        
+        pages = iter(archive) if urls is None else (archive.get(url) for url in urls)
+        for page in pages:
+            if page is None or page.status != 200:
+                continue
+            yield from self.iter_restaurants_from_html(page.content)
+    
+    def parse_archive(self, archive, urls=None):
+        """Parse archived listing pages into self.restaurants"""
+        count = 0
+        for restaurant in self.iter_archived_restaurants(archive, urls):
+            self.restaurants.append(restaurant)
+            count += 1
+        print(f"Extracted {count} restaurants from archive")
+        return count
     
     def parse_html_file(self, filepath):
         """Parse the OpenTable HTML response file"""
         print(f"Parsing HTML file: {filepath}")
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Extract JSON data from the script tag
-            json_data = self.extract_json_from_html(content)
-            if json_data:
-                restaurants = self.extract_restaurants_from_json(json_data)
-                self.restaurants.extend(restaurants)
-                print(f"Extracted {len(restaurants)} restaurants from HTML file")
-            else:
-                print("No JSON data found in HTML file")
+            count = 0
+            for restaurant in self.iter_restaurants(filepath):
+                self.restaurants.append(restaurant)
+                count += 1
+            if count:
+                print(f"Extracted {count} restaurants from HTML file")
                 
         except Exception as e:
             print(f"Error parsing HTML file: {e}")
@@ -58,88 +267,50 @@ class OpenTableDocumentParser:
             print(f"Error extracting JSON from HTML: {e}")
             return None
     
-    def extract_restaurants_from_json(self, data):
-        """Extract restaurant data from the JSON structure"""
-        restaurants = []
-        
+    def iter_restaurants_from_json(self, data):
+        """Yield restaurant records from the JSON structure one at a time"""
         try:
             # Navigate through the JSON structure to find restaurants
-            lolz_data = data.get('windowVariables', {}).get('__INITIAL_STATE__', {}).get('lolzViewAll', {})
+            initial_state = data.get('windowVariables', {}).get('__INITIAL_STATE__', {})
+            lolz_data = initial_state.get('lolzViewAll', {})
             search_results = lolz_data.get('searchResults', {})
             restaurant_list = search_results.get('restaurants', [])
             
-            for rest_data in restaurant_list:
-                restaurant = self.parse_restaurant_data(rest_data)
-                if restaurant['name']:  # Only add if we have a name
-                    restaurants.append(restaurant)
-            
+            # Date, time and party size the page's availability tokens were issued for
+            availability = initial_state.get('availability') or {}
+            if availability:
+                self.availability_context = {
+                    'date': (availability.get('availabilityDate') or '')[:10],
+                    'time': (availability.get('availabilityTime') or '')[11:16],
+                    'party_size': availability.get('availabilityPartySize') or 2,
+                }
         except Exception as e:
             print(f"Error extracting restaurants from JSON: {e}")
+            return
         
-        return restaurants
+        for rest_data in restaurant_list:
+            restaurant = self.parse_restaurant_data(rest_data)
+            if restaurant['name']:  # Only yield if we have a name
+                token = rest_data.get('restaurantAvailabilityToken')
+                if token and restaurant['restaurant_id']:
+                    self.availability_tokens[restaurant['restaurant_id']] = token
+                yield restaurant
+    
+    def extract_restaurants_from_json(self, data):
+        """Extract restaurant data from the JSON structure"""
+        return list(self.iter_restaurants_from_json(data))
     
     def parse_restaurant_data(self, rest_data):
         """Parse individual restaurant data from JSON"""
-        restaurant = {
-            'name': '',
-            'url': '',
-            'phone': '',
-            'cuisine': ''
-        }
-        
         try:
-            # Extract name
-            restaurant['name'] = rest_data.get('name', '').strip()
-            
-            # Extract URL
-            urls = rest_data.get('urls', {})
-            profile_link = urls.get('profileLink', {})
-            if profile_link:
-                link = profile_link.get('link', '')
-                if link:
-                    if link.startswith('http'):
-                        restaurant['url'] = link
-                    else:
-                        restaurant['url'] = self.base_url + link
-            
-            # Extract phone
-            contact_info = rest_data.get('contactInformation', {})
-            if contact_info:
-                phone = contact_info.get('formattedPhoneNumber', '') or contact_info.get('phoneNumber', '')
-                restaurant['phone'] = self.clean_phone(phone)
-            
-            # Extract cuisine
-            primary_cuisine = rest_data.get('primaryCuisine', {})
-            if primary_cuisine:
-                restaurant['cuisine'] = primary_cuisine.get('name', '').strip()
-            
+            return self.extract_restaurant(rest_data)
         except Exception as e:
             print(f"Error parsing restaurant data: {e}")
-        
-        return restaurant
+            return empty_record(self.fields)
     
     def clean_phone(self, phone):
         """Clean and format phone number"""
-        if not phone:
-            return ""
-        
-        # Remove any non-digit characters except + and spaces for formatting
-        phone = phone.strip()
-        
-        # If it's already formatted nicely, return it
-        if re.match(r'\(\d{3}\) \d{3}-\d{4}', phone):
-            return phone
-        
-        # Extract digits only
-        digits = re.sub(r'[^\d]', '', phone)
-        
-        # Format North American phone numbers
-        if len(digits) == 10:
-            return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
-        elif len(digits) == 11 and digits[0] == '1':
-            return f"({digits[1:4]}) {digits[4:7]}-{digits[7:]}"
-        
-        return phone  # Return original if we can't format it
+        return format_phone(phone)
     
     def save_to_csv(self, filename="toronto_restaurants_parsed.csv"):
         """Save parsed data to CSV file"""
@@ -151,7 +322,7 @@ class OpenTableDocumentParser:
         
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['name', 'url', 'phone', 'cuisine']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
             
             writer.writeheader()
             for restaurant in self.restaurants:
@@ -161,6 +332,8 @@ class OpenTableDocumentParser:
     
     def print_summary(self):
         """Print summary of parsed data"""
+        from opentable_analytics import COVERAGE_FIELDS, RestaurantColumns
+        
         if not self.restaurants:
             print("No restaurants parsed!")
             return
@@ -168,13 +341,12 @@ class OpenTableDocumentParser:
         print(f"\n=== PARSING SUMMARY ===")
         print(f"Total restaurants: {len(self.restaurants)}")
         
-        with_phone = sum(1 for r in self.restaurants if r['phone'])
-        with_cuisine = sum(1 for r in self.restaurants if r['cuisine'])
-        with_url = sum(1 for r in self.restaurants if r['url'])
-        
-        print(f"With phone numbers: {with_phone} ({with_phone/len(self.restaurants)*100:.1f}%)")
-        print(f"With cuisine info: {with_cuisine} ({with_cuisine/len(self.restaurants)*100:.1f}%)")
-        print(f"With URLs: {with_url} ({with_url/len(self.restaurants)*100:.1f}%)")
+        report = RestaurantColumns.from_records(self.restaurants).report(top=10)
+        for field, label in COVERAGE_FIELDS[:3]:
+            coverage = report['coverage'][field]
+            print(f"With {label}: {coverage['count']} ({coverage['percent']:.1f}%)")
+        if self.cache is not None:
+            print(f"Parse cache: {self.cache.summary()}")
         
         print(f"\n=== SAMPLE DATA ===")
         for i, restaurant in enumerate(self.restaurants[:5]):
@@ -0,0 +1,195 @@
+"""
+OpenTable Phone Normalization
+=============================
+Canonical phone number handling shared by the scrapers, parser and store
+Every number is normalized to an E.164 value (+16477151200) and a display
+value ((647) 715-1200); anything that is not a North American number is
+left as-is for display and has no E.164 value
+Usage: python opentable_phone.py input.csv output.csv [--column phone]
+"""
+
+import csv
+import re
+import sys
+import time
+from functools import lru_cache
+
+# NumPy is only needed for whole-column normalization, so it is imported on
+# first use rather than slowing down every script that formats a phone number
+np = None
+
+
+# One pattern for finding a phone number in free text; the lookarounds stop it
+# from matching inside longer digit runs such as photo ids
+PHONE_IN_TEXT = re.compile(r'(?<!\d)(?:\+?1[-.\s]?)?\(?(\d{3})\)?[-.\s]?(\d{3})[-.\s]?(\d{4})(?!\d)')
+NON_DIGITS = re.compile(r'\D')
+
+
+@lru_cache(maxsize=65536)
+def normalize_phone(raw):
+    """Return (e164, display) for a raw phone string, memoized"""
+    if not raw:
+        return '', ''
+    
+    raw = raw.strip()
+    digits = NON_DIGITS.sub('', raw)
+    
+    if len(digits) == 11 and digits[0] == '1':
+        digits = digits[1:]
+    if len(digits) != 10:
+        return '', raw  # Return original if we can't format it
+    
+    return f"+1{digits}", f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+
+
+def to_e164(raw):
+    """E.164 form of a phone number, or '' if it can't be normalized"""
+    return normalize_phone(raw)[0]
+
+
+def format_phone(raw):
+    """Display form of a phone number, e.g. (647) 715-1200"""
+    return normalize_phone(raw)[1]
+
+
+def extract_phone(text):
+    """Find the first phone number in free text and return its display form"""
+    if not text:
+        return ""
+    
+    match = PHONE_IN_TEXT.search(text)
+    if not match:
+        return ""
+    return f"({match.group(1)}) {match.group(2)}-{match.group(3)}"
+
+
+def _load_numpy():
+    """Import NumPy on first use, returns the module or None if it isn't installed"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        np = numpy
+    return np or None
+
+
+def _as_string_list(values):
+    """Accept lists, NumPy arrays, pandas Series or Arrow arrays/columns"""
+    if hasattr(values, 'to_pylist'):
+        values = values.to_pylist()
+    elif hasattr(values, 'tolist'):
+        values = values.tolist()
+    return ['' if value is None else str(value) for value in values]
+
+
+def normalize_phone_column(values):
+    """Normalize a whole column in one vectorized pass, returns (e164, display) lists"""
+    values = _as_string_list(values)
+    if _load_numpy() is None or not values:
+        pairs = [normalize_phone(value) for value in values]
+        return [pair[0] for pair in pairs], [pair[1] for pair in pairs]
+    
+    # Historical exports repeat the same restaurants run after run, so only
+    # distinct strings go through the vectorized pass
+    unique = list(dict.fromkeys(values))
+    e164_unique, display_unique = _normalize_unique(unique)
+    
+    e164_lookup = dict(zip(unique, e164_unique))
+    display_lookup = dict(zip(unique, display_unique))
+    return list(map(e164_lookup.__getitem__, values)), list(map(display_lookup.__getitem__, values))
+
+
+def _normalize_unique(values):
+    """Vectorized core of normalize_phone_column over distinct strings"""
+    text = np.asarray(values, dtype=str)
+    count = len(text)
+    width = text.dtype.itemsize // 4
+    
+    # Treat the fixed-width unicode array as a (chars, rows) matrix of code points
+    # and fold the digits of every row into an integer one character column at a time
+    columns = text.view(np.uint32).reshape(count, width).T.astype(np.int64)
+    number = np.zeros(count, dtype=np.int64)
+    digit_count = np.zeros(count, dtype=np.int64)
+    for column in columns:
+        digit = column - 48
+        is_digit = (digit >= 0) & (digit <= 9)
+        number = np.where(is_digit, number * 10 + digit, number)
+        digit_count += is_digit
+    
+    has_country_code = (digit_count == 11) & (number // 10 ** 10 == 1)
+    number = np.where(has_country_code, number - 10 ** 10, number)
+    valid = (digit_count == 10) | has_country_code
+    
+    powers = 10 ** np.arange(9, -1, -1, dtype=np.int64)
+    digits = (number[:, None] // powers % 10 + 48).astype(np.uint32)
+    
+    e164 = np.empty((count, 12), dtype=np.uint32)
+    e164[:, 0] = ord('+')
+    e164[:, 1] = ord('1')
+    e164[:, 2:] = digits
+    
+    display = np.empty((count, 14), dtype=np.uint32)
+    display[:, 0] = ord('(')
+    display[:, 1:4] = digits[:, 0:3]
+    display[:, 4] = ord(')')
+    display[:, 5] = ord(' ')
+    display[:, 6:9] = digits[:, 3:6]
+    display[:, 9] = ord('-')
+    display[:, 10:14] = digits[:, 6:10]
+    
+    e164_values = np.where(valid, e164.view('U12').ravel(), '').tolist()
+    display_values = display.view('U14').ravel().tolist()
+    
+    # Unformattable numbers keep their original text, same as the scalar path
+    for index in np.flatnonzero(~valid).tolist():
+        display_values[index] = values[index].strip()
+    
+    return e164_values, display_values
+
+
+def normalize_csv(input_path, output_path, column='phone'):
+    """Rewrite a CSV export with normalized phone and phone_e164 columns"""
+    with open(input_path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        fieldnames = list(reader.fieldnames or [])
+        rows = list(reader)
+    
+    start = time.perf_counter()
+    e164_values, display_values = normalize_phone_column([row.get(column, '') for row in rows])
+    elapsed = time.perf_counter() - start
+    
+    if 'phone_e164' not in fieldnames:
+        fieldnames.append('phone_e164')
+    
+    with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for row, e164, display in zip(rows, e164_values, display_values):
+            row[column] = display
+            row['phone_e164'] = e164
+            writer.writerow(row)
+    
+    print(f"Normalized {len(rows)} phone numbers in {elapsed:.2f}s -> {output_path}")
+    return len(rows)
+
+
+def main():
+    """Normalize the phone column of a CSV export"""
+    args = sys.argv[1:]
+    column = 'phone'
+    if '--column' in args:
+        index = args.index('--column')
+        column = args[index + 1]
+        del args[index:index + 2]
+    
+    if len(args) != 2:
+        print("Usage: python opentable_phone.py input.csv output.csv [--column phone]")
+        return
+    
+    normalize_csv(args[0], args[1], column)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""
+OpenTable Stage Pipeline
+========================
+Runs a crawl as stages connected by bounded queues instead of one inline loop
+Each stage has its own worker count and executor: 'async' runs coroutines on
+an event loop (network fetches), 'process' a process pool (CPU-bound parsing)
+and 'thread' a thread pool (detail lookups, writes). A stage whose output
+queue is full blocks, which in turn fills its own input queue, so a slow
+stage holds back everything upstream and memory stays bounded by the queue
+sizes rather than the crawl size. Per-stage queue depth, utilization and time
+spent blocked on a full downstream queue show which stage is the bottleneck
+Usage: AdvancedOpenTableScraper().scrape_toronto_restaurants_pipelined(max_restaurants=200)
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# Marks the end of a stage's input
+DONE = object()
+
+EXECUTORS = ('thread', 'process', 'async')
+
+
+def timed_call(func, item):
+    """(func(item), seconds spent); runs inside process-pool workers, so it is module level"""
+    start = time.perf_counter()
+    result = func(item)
+    return result, time.perf_counter() - start
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, executor='thread', queue_size=None, fanout=False, finalize=None,
+                 on_error=None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"unknown executor {executor!r}, expected one of {', '.join(EXECUTORS)}")
+        self.name = name
+        # Called once per input item; None drops the item. Coroutine function for
+        # 'async' stages, picklable (module level or functools.partial) for 'process'
+        self.func = func
+        self.workers = max(1, workers)
+        self.executor = executor
+        # Input queue capacity; a full queue blocks the stage feeding it
+        self.queue_size = queue_size or 2 * self.workers
+        # When set, func returns an iterable and each element moves on separately
+        self.fanout = fanout
+        # Called (or awaited, for 'async') after the last item, e.g. to close a session
+        self.finalize = finalize
+        # Called with the input item when func raises, so whatever the item holds can be released
+        self.on_error = on_error
+        
+        self.inbox = queue.Queue(self.queue_size)
+        self.stats = {'in': 0, 'out': 0, 'errors': 0, 'busy': 0.0, 'blocked': 0.0,
+                      'depth_total': 0, 'depth_samples': 0, 'depth_max': 0}
+        self.started = None
+        self.finished = None
+    
+    @property
+    def consumers(self):
+        """Threads taking items from the inbox, each of which needs its own DONE"""
+        return self.workers if self.executor == 'thread' else 1
+    
+    def utilization(self):
+        """Fraction of worker time spent processing items while the stage ran"""
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.stats['busy'] / (self.workers * elapsed) if elapsed > 0 else 0.0
+    
+    def mean_depth(self):
+        samples = self.stats['depth_samples']
+        return self.stats['depth_total'] / samples if samples else 0.0
+
+
+class Pipeline:
+    def __init__(self, stages, sample_interval=0.05):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        self.stages = list(stages)
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._remaining = [stage.consumers for stage in self.stages]
+        self.source_stats = {'items': 0, 'blocked': 0.0}
+        self.elapsed = 0.0
+    
+    def stop(self):
+        """Stop pulling from the source; items already inside still run to completion"""
+        self._stop.set()
+    
+    def run(self, source):
+        """Push every item of source through the stages, returns when the last stage has drained"""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(source,), name='pipeline-source', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            stage.started = time.perf_counter()
+            runner = {'thread': self._run_threads, 'process': self._run_process, 'async': self._run_async}[stage.executor]
+            threads.extend(runner(index))
+        
+        sampling = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(sampling,), name='pipeline-sampler', daemon=True)
+        sampler.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sampling.set()
+        sampler.join()
+        
+        self.elapsed = time.perf_counter() - start
+        return self.stats()
+    
+    def _feed(self, source):
+        """Move source items into the first stage, blocking while it is full"""
+        first = self.stages[0]
+        try:
+            for item in source:
+                self._put(first.inbox, item, self.source_stats)
+                self.source_stats['items'] += 1
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            print(f"Pipeline source failed: {e}")
+        finally:
+            for _ in range(first.consumers):
+                first.inbox.put(DONE)
+    
+    def _put(self, inbox, item, stats):
+        """Put into a bounded queue, counting time spent waiting for room as blocked"""
+        try:
+            inbox.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            inbox.put(item)
+            with self._lock:
+                stats['blocked'] += time.perf_counter() - start
+    
+    def _emit(self, index, result):
+        """Hand a stage's result to the next stage, or drop it after the last one"""
+        if result is None:
+            return
+        stage = self.stages[index]
+        items = result if stage.fanout else (result,)
+        following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        for item in items:
+            with self._lock:
+                stage.stats['out'] += 1
+            if following is not None:
+                self._put(following.inbox, item, stage.stats)
+    
+    def _record(self, stage, busy, failed=False):
+        with self._lock:
+            stage.stats['in'] += 1
+            stage.stats['busy'] += busy
+            stage.stats['errors'] += failed
+    
+    def _fail(self, stage, item, error, busy=0.0):
+        """Count and report an item whose func raised, then hand it to the stage's on_error"""
+        self._record(stage, busy, failed=True)
+        print(f"Stage '{stage.name}' failed on an item: {error}")
+        if stage.on_error is not None:
+            try:
+                stage.on_error(item)
+            except Exception as e:
+                print(f"Stage '{stage.name}' on_error failed: {e}")
+    
+    def _consumer_done(self, index):
+        """Called by each consumer of a stage on exit; the last one closes the next stage's input"""
+        stage = self.stages[index]
+        with self._lock:
+            self._remaining[index] -= 1
+            last = self._remaining[index] == 0
+        if not last:
+            return
+        stage.finished = time.perf_counter()
+        if index + 1 < len(self.stages):
+            following = self.stages[index + 1]
+            for _ in range(following.consumers):
+                following.inbox.put(DONE)
+    
+    def _run_threads(self, index):
+        stage = self.stages[index]
+        remaining = [stage.workers]
+        
+        def work():
+            try:
+                while True:
+                    item = stage.inbox.get()
+                    if item is DONE:
+                        break
+                    start = time.perf_counter()
+                    try:
+                        result = stage.func(item)
+                    except Exception as e:
+                        self._fail(stage, item, e, time.perf_counter() - start)
+                        continue
+                    self._record(stage, time.perf_counter() - start)
+                    self._emit(index, result)
+            finally:
+                with self._lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and stage.finalize is not None:
+                    stage.finalize()
+                self._consumer_done(index)
+        
+        return [threading.Thread(target=work, name=f"pipeline-{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)]
+    
+    def _run_process(self, index):
+        """One thread submits to a process pool, another emits results as they complete
+        
+        A semaphore caps items submitted but not yet emitted at twice the
+        worker count, so a blocked downstream stage stops submissions too
+        """
+        stage = self.stages[index]
+        slots = threading.Semaphore(2 * stage.workers)
+        completed = queue.Queue()
+        submitted = []
+        # Input item of each future, for on_error; the worker's copy is lost when it fails
+        items = {}
+        # forkserver children don't inherit this process's threads or the locks they hold
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+        pool = ProcessPoolExecutor(stage.workers, mp_context=context)
+        
+        def submit():
+            count = 0
+            try:
+                while True:
+                    item = stage.inbox.get()
+                    if item is DONE:
+                        break
+                    slots.acquire()
+                    try:
+                        future = pool.submit(timed_call, stage.func, item)
+                    except Exception as e:
+                        # A broken pool refuses new work
+                        self._fail(stage, item, e)
+                        slots.release()
+                        continue
+                    items[future] = item
+                    future.add_done_callback(completed.put)
+                    count += 1
+            finally:
+                submitted.append(count)
+                completed.put(DONE)
+        
+        def collect():
+            emitted = 0
+            total = None
+            try:
+                while total is None or emitted < total:
+                    future = completed.get()
+                    if future is DONE:
+                        total = submitted[0]
+                        continue
+                    emitted += 1
+                    item = items.pop(future)
+                    try:
+                        result, busy = future.result()
+                    except Exception as e:
+                        self._fail(stage, item, e)
+                    else:
+                        self._record(stage, busy)
+                        self._emit(index, result)
+                    slots.release()
+            finally:
+                pool.shutdown()
+                if stage.finalize is not None:
+                    stage.finalize()
+                self._consumer_done(index)
+        
+        return [threading.Thread(target=submit, name=f"pipeline-{stage.name}-submit", daemon=True),
+                threading.Thread(target=collect, name=f"pipeline-{stage.name}-collect", daemon=True)]
+    
+    def _run_async(self, index):
+        """An event loop on its own thread running `workers` coroutines
+        
+        Blocking queue operations on either side of the loop run on the loop's
+        thread pool, so a full downstream queue pauses the coroutines without
+        blocking the loop itself
+        """
+        stage = self.stages[index]
+        
+        async def main():
+            loop = asyncio.get_running_loop()
+            # Room for every worker to wait on the next stage, plus the input pump
+            loop.set_default_executor(ThreadPoolExecutor(2 * stage.workers + 1))
+            ready = asyncio.Queue(stage.workers)
+            
+            async def pump():
+                while True:
+                    item = await loop.run_in_executor(None, stage.inbox.get)
+                    if item is DONE:
+                        break
+                    await ready.put(item)
+                for _ in range(stage.workers):
+                    await ready.put(DONE)
+            
+            async def work():
+                while True:
+                    item = await ready.get()
+                    if item is DONE:
+                        return
+                    start = time.perf_counter()
+                    try:
+                        result = await stage.func(item)
+                    except Exception as e:
+                        self._fail(stage, item, e, time.perf_counter() - start)
+                        continue
+                    self._record(stage, time.perf_counter() - start)
+                    await loop.run_in_executor(None, self._emit, index, result)
+            
+            try:
+                await asyncio.gather(pump(), *(work() for _ in range(stage.workers)))
+            finally:
+                if stage.finalize is not None:
+                    await stage.finalize()
+        
+        def run_loop():
+            try:
+                asyncio.run(main())
+            finally:
+                self._consumer_done(index)
+        
+        return [threading.Thread(target=run_loop, name=f"pipeline-{stage.name}-loop", daemon=True)]
+    
+    def _sample(self, stopped):
+        """Record every stage's input queue depth until the pipeline finishes"""
+        while not stopped.wait(self.sample_interval):
+            with self._lock:
+                for stage in self.stages:
+                    depth = stage.inbox.qsize()
+                    stage.stats['depth_total'] += depth
+                    stage.stats['depth_samples'] += 1
+                    stage.stats['depth_max'] = max(stage.stats['depth_max'], depth)
+    
+    def stats(self):
+        """Per-stage counters, utilization and queue depth"""
+        return {
+            stage.name: {
+                'executor': stage.executor,
+                'workers': stage.workers,
+                'queue_size': stage.queue_size,
+                'in': stage.stats['in'],
+                'out': stage.stats['out'],
+                'errors': stage.stats['errors'],
+                'utilization': stage.utilization(),
+                'mean_depth': stage.mean_depth(),
+                'max_depth': stage.stats['depth_max'],
+                'blocked': stage.stats['blocked'],
+            }
+            for stage in self.stages
+        }
+    
+    def bottleneck(self):
+        """Name of the stage with the highest utilization"""
+        return max(self.stages, key=lambda stage: stage.utilization()).name
+    
+    def summary(self):
+        """Table of per-stage throughput, utilization and queue depth"""
+        lines = [f"Pipeline: {self.source_stats['items']} source items in {self.elapsed:.2f}s, "
+                 f"bottleneck '{self.bottleneck()}'"]
+        for name, stats in self.stats().items():
+            lines.append(
+                f"  {name:<8} {stats['executor']:>7} x{stats['workers']:<3} "
+                f"in {stats['in']:>6} out {stats['out']:>6} errors {stats['errors']:>3}  "
+                f"busy {stats['utilization']:6.1%}  queue {stats['mean_depth']:5.1f} avg "
+                f"{stats['max_depth']:>3}/{stats['queue_size']} max  blocked {stats['blocked']:6.2f}s"
+            )
+        return "\n".join(lines)
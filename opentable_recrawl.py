@@ -0,0 +1,492 @@
+"""
+OpenTable Adaptive Recrawl
+==========================
+Long-running revisit scheduler for keeping scraped pages fresh on a budget
+Every URL keeps a history of visits and whether its content had changed;
+from that each URL's change rate is estimated, and revisit intervals are
+chosen to maximize the expected fraction of fresh pages within a global
+requests-per-hour budget. Listing pages are weighted up because they
+discover new restaurants; pages that change faster than the budget can
+follow are deliberately visited less, since every visit to them is wasted
+A token bucket keeps the actual request rate under the budget
+Usage: python opentable.py recrawl --state recrawl.db --budget 600 [--seed URL ...] [--duration 3600]
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    last_fetch REAL,
+    fingerprint TEXT,
+    visits REAL NOT NULL DEFAULT 0,
+    changes REAL NOT NULL DEFAULT 0,
+    observed REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS visits (
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    status INTEGER NOT NULL,
+    changed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_visits_url ON visits (url, fetched_at);
+"""
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# Assumed changes per second for a URL with no history yet
+PRIOR_RATES = {'listing': 1 / HOUR, 'profile': 1 / DAY}
+
+# Relative value of a fresh copy; listing pages also feed discovery
+KIND_WEIGHTS = {'listing': 4.0, 'profile': 1.0}
+
+# Fields pages are fingerprinted on. Per-request tokens, ratings and review or
+# booking counts move on every visit without the restaurant changing, and
+# would make every page look like it changes on every visit
+LISTING_FIELDS = ('restaurant_id', 'url', 'name', 'phone', 'cuisine')
+PROFILE_FIELDS = ('name', 'phone', 'address', 'cuisine', 'hours')
+
+
+def marginal_freshness(rate, frequency):
+    """Gain in expected freshness per extra visit per second, at a given visit frequency
+    
+    A page changing as a Poisson process with `rate`, visited every
+    1/frequency seconds, is fresh (frequency/rate)(1 - e^(-rate/frequency))
+    of the time; this is the derivative of that with respect to frequency
+    """
+    ratio = rate / frequency
+    return -math.expm1(-ratio) / rate - math.exp(-ratio) / frequency
+
+
+def expected_freshness(rate, frequency):
+    """Expected fraction of time a page visited at this frequency is fresh"""
+    if frequency <= 0:
+        return 0.0
+    ratio = rate / frequency
+    return -math.expm1(-ratio) / ratio if ratio > 1e-12 else 1.0
+
+
+class URLState:
+    __slots__ = ('url', 'kind', 'added_at', 'last_fetch', 'fingerprint', 'visits', 'changes',
+                 'observed', 'interval', 'next_due')
+    
+    def __init__(self, url, kind, added_at):
+        self.url = url
+        self.kind = kind
+        self.added_at = added_at
+        self.last_fetch = None
+        self.fingerprint = None
+        # Exponentially decayed counts, so estimates follow pages whose behavior drifts
+        self.visits = 0.0
+        self.changes = 0.0
+        self.observed = 0.0
+        self.interval = None
+        self.next_due = added_at
+
+
+class RevisitScheduler:
+    def __init__(self, db_path="recrawl.db", requests_per_hour=600, min_interval=5 * 60,
+                 max_interval=14 * DAY, policy='adaptive', decay=0.9, rebalance_every=200, clock=time.time):
+        self.db_path = db_path
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.policy = policy
+        self.decay = decay
+        self.rebalance_every = rebalance_every
+        self.clock = clock
+        
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        
+        self.states = {}
+        self.heap = []
+        self._pending = 0
+        
+        # One minute of budget may be spent in a burst, never more
+        self.refill_rate = requests_per_hour / HOUR
+        self.capacity = max(1.0, requests_per_hour / 60)
+        self.tokens = self.capacity
+        self.refilled_at = clock()
+        
+        self.stats = {'requests': 0, 'changes': 0, 'errors': 0, 'rebalances': 0}
+        self._load()
+        self.rebalance()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __len__(self):
+        return len(self.states)
+    
+    def close(self):
+        """Flush pending history and close the database"""
+        self.conn.commit()
+        self.conn.close()
+    
+    def _load(self):
+        """Restore URL states saved by an earlier run"""
+        rows = self.conn.execute(
+            "SELECT url, kind, added_at, last_fetch, fingerprint, visits, changes, observed FROM urls"
+        )
+        for url, kind, added_at, last_fetch, fingerprint, visits, changes, observed in rows:
+            state = URLState(url, kind, added_at)
+            state.last_fetch = last_fetch
+            state.fingerprint = fingerprint
+            state.visits, state.changes, state.observed = visits, changes, observed
+            self.states[url] = state
+            # rebalance() only pushes URLs whose due time moves, and a never-fetched URL stays due at added_at
+            heapq.heappush(self.heap, (state.next_due, url))
+    
+    def add(self, url, kind='profile'):
+        """Start tracking a URL, due immediately; returns False when it was already known"""
+        if url in self.states:
+            return False
+        now = self.clock()
+        state = self.states[url] = URLState(url, kind, now)
+        state.interval = self._initial_interval()
+        self.conn.execute("INSERT OR IGNORE INTO urls (url, kind, added_at) VALUES (?, ?, ?)", (url, kind, now))
+        heapq.heappush(self.heap, (state.next_due, url))
+        return True
+    
+    def _initial_interval(self):
+        """Interval for a new URL until the next rebalance, the uniform share of the budget"""
+        share = len(self.states) / max(self.refill_rate, 1e-9)
+        return min(max(share, self.min_interval), self.max_interval)
+    
+    def change_rate(self, state):
+        """Estimated changes per second
+        
+        Uses Cho and Garcia-Molina's estimator for pages only observed at
+        visits, -ln((n - x + 0.5) / (n + 0.5)) / mean interval, which does not
+        undercount pages that changed more than once between two visits,
+        blended with the prior for the URL's kind while history is short
+        """
+        prior = PRIOR_RATES.get(state.kind, PRIOR_RATES['profile'])
+        n = state.visits
+        if n < 0.5 or state.observed <= 0:
+            return prior
+        x = min(state.changes, n)
+        estimate = -math.log((n - x + 0.5) / (n + 0.5)) / (state.observed / n)
+        return (prior + estimate * n) / (1 + n)
+    
+    def poll(self, now=None):
+        """(url, 0) for the next URL to fetch, or (None, seconds to wait) when nothing is due or the budget is spent"""
+        now = self.clock() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.refill_rate)
+        self.refilled_at = now
+        
+        while self.heap:
+            due, url = self.heap[0]
+            if self.states[url].next_due != due:
+                heapq.heappop(self.heap)  # Superseded by a later reschedule
+                continue
+            # Waits under a millisecond count as none; they may not even move an epoch timestamp
+            if due > now + 1e-3:
+                return None, due - now
+            shortfall = (1 - self.tokens) / self.refill_rate
+            if shortfall > 1e-3:
+                return None, shortfall
+            heapq.heappop(self.heap)
+            self.tokens = max(self.tokens - 1, 0.0)
+            return url, 0.0
+        return None, self.max_interval
+    
+    def record(self, url, fingerprint, status=200, now=None):
+        """Record a visit and reschedule the URL; returns whether its content had changed"""
+        now = self.clock() if now is None else now
+        state = self.states[url]
+        changed = False
+        self.stats['requests'] += 1
+        
+        if status == 200 and fingerprint is not None:
+            if state.last_fetch is not None and state.fingerprint is not None:
+                changed = fingerprint != state.fingerprint
+                state.visits = state.visits * self.decay + 1
+                state.changes = state.changes * self.decay + changed
+                state.observed = state.observed * self.decay + (now - state.last_fetch)
+                self.stats['changes'] += changed
+            state.fingerprint = fingerprint
+            state.last_fetch = now
+            state.next_due = now + state.interval
+        else:
+            # Failures say nothing about change; try again after the normal interval
+            self.stats['errors'] += 1
+            state.next_due = now + state.interval
+        heapq.heappush(self.heap, (state.next_due, url))
+        
+        self.conn.execute("INSERT INTO visits (url, fetched_at, status, changed) VALUES (?, ?, ?, ?)",
+                          (url, now, status, int(changed)))
+        self.conn.execute(
+            "UPDATE urls SET last_fetch = ?, fingerprint = ?, visits = ?, changes = ?, observed = ? WHERE url = ?",
+            (state.last_fetch, state.fingerprint, state.visits, state.changes, state.observed, url)
+        )
+        self._pending += 1
+        if self._pending >= self.rebalance_every:
+            self.conn.commit()
+            self.rebalance()
+        return changed
+    
+    def rebalance(self):
+        """Recompute every URL's revisit interval from its current change-rate estimate"""
+        self._pending = 0
+        if not self.states:
+            return
+        self.stats['rebalances'] += 1
+        
+        # Spend slightly less than the budget so the token bucket rarely has to hold URLs back
+        budget = self.refill_rate * 0.95
+        f_min, f_max = 1 / self.max_interval, 1 / self.min_interval
+        
+        if self.policy == 'uniform':
+            frequency = min(max(budget / len(self.states), f_min), f_max)
+            frequencies = {url: frequency for url in self.states}
+        else:
+            frequencies = self._optimal_frequencies(budget, f_min, f_max)
+        
+        for url, state in self.states.items():
+            state.interval = 1 / frequencies[url]
+            # URLs never fetched stay due right away
+            due = state.last_fetch + state.interval if state.last_fetch is not None else state.added_at
+            if due != state.next_due:
+                state.next_due = due
+                heapq.heappush(self.heap, (due, url))
+    
+    def _optimal_frequencies(self, budget, f_min, f_max):
+        """Visit frequencies maximizing weighted expected freshness with their sum held to the budget
+        
+        At the optimum every page's weighted marginal freshness equals one
+        multiplier, found by bisection; URLs are grouped by rate (quarter
+        powers of two) and kind, so the work depends on the number of
+        groups rather than URLs
+        """
+        groups = {}
+        for url, state in self.states.items():
+            rate = max(self.change_rate(state), 1e-12)
+            key = (KIND_WEIGHTS.get(state.kind, 1.0), 2 ** (round(math.log2(rate) * 4) / 4))
+            groups.setdefault(key, []).append(url)
+        
+        def frequency_for(multiplier, weight, rate):
+            if weight * marginal_freshness(rate, f_max) >= multiplier:
+                return f_max
+            if weight * marginal_freshness(rate, f_min) <= multiplier:
+                return f_min
+            lo, hi = math.log(f_min), math.log(f_max)
+            for _ in range(30):
+                mid = (lo + hi) / 2
+                if weight * marginal_freshness(rate, math.exp(mid)) > multiplier:
+                    lo = mid
+                else:
+                    hi = mid
+            return math.exp((lo + hi) / 2)
+        
+        def spend(multiplier):
+            return sum(len(urls) * frequency_for(multiplier, weight, rate) for (weight, rate), urls in groups.items())
+        
+        if spend(0.0) <= budget:
+            multiplier = 0.0  # Budget covers visiting everything as often as allowed
+        else:
+            lo, hi = math.log(1e-30), math.log(1e6)
+            for _ in range(60):
+                mid = (lo + hi) / 2
+                if spend(math.exp(mid)) > budget:
+                    lo = mid
+                else:
+                    hi = mid
+            multiplier = math.exp(hi)
+        
+        frequencies = {}
+        for (weight, rate), urls in groups.items():
+            frequency = frequency_for(multiplier, weight, rate)
+            for url in urls:
+                frequencies[url] = frequency
+        return frequencies
+    
+    def expected_freshness(self):
+        """Mean expected freshness over all URLs under the current estimates and intervals"""
+        if not self.states:
+            return 0.0
+        total = sum(expected_freshness(self.change_rate(state), 1 / state.interval) for state in self.states.values())
+        return total / len(self.states)
+    
+    def history(self, url, limit=50):
+        """Most recent (fetched_at, status, changed) visits of a URL"""
+        return self.conn.execute(
+            "SELECT fetched_at, status, changed FROM visits WHERE url = ? ORDER BY fetched_at DESC LIMIT ?",
+            (url, limit)
+        ).fetchall()
+    
+    def summary(self):
+        """One-line description of the crawl so far"""
+        requests = self.stats['requests']
+        changed = self.stats['changes'] / requests if requests else 0.0
+        return (f"{len(self.states)} URLs, {requests} requests ({self.stats['errors']} failed), "
+                f"{self.stats['changes']} changes detected ({changed:.0%} of requests), "
+                f"expected freshness {self.expected_freshness():.1%} at {self.requests_per_hour}/h")
+
+
+def clean_value(value):
+    """Whitespace-collapsed text of a JSON-LD value; lists and objects are flattened in a stable order"""
+    if isinstance(value, dict):
+        value = [value[key] for key in sorted(value) if not key.startswith('@')]
+    if isinstance(value, list):
+        return ', '.join(filter(None, (clean_value(item) for item in value)))
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def profile_fields(body):
+    """PROFILE_FIELDS of a profile page, from its JSON-LD Restaurant object, else from the markup"""
+    from opentable_memory import parsed_html
+    from opentable_phone import to_e164
+    
+    fields = dict.fromkeys(PROFILE_FIELDS, '')
+    with parsed_html(body) as soup:
+        for script in soup.find_all('script', type='application/ld+json'):
+            try:
+                data = json.loads(script.string or '')
+            except ValueError:
+                continue
+            for item in data if isinstance(data, list) else [data]:
+                if not isinstance(item, dict) or item.get('@type') not in ('Restaurant', 'FoodEstablishment'):
+                    continue
+                for field, key in (('name', 'name'), ('phone', 'telephone'), ('address', 'address'),
+                                   ('cuisine', 'servesCuisine'),
+                                   ('hours', 'openingHoursSpecification' if 'openingHoursSpecification' in item
+                                    else 'openingHours')):
+                    fields[field] = fields[field] or clean_value(item.get(key))
+        
+        selectors = {
+            'name': 'h1',
+            'phone': 'a[href^="tel:"]',
+            'address': 'address, [itemprop="address"], [data-test*="address"]',
+            'cuisine': '[itemprop="servesCuisine"], [data-test*="cuisine"], [class*="cuisine"]',
+            'hours': '[itemprop="openingHours"], [data-test*="hours"], [class*="hours"]',
+        }
+        for field, selector in selectors.items():
+            if not fields[field]:
+                element = soup.select_one(selector)
+                if element is not None:
+                    text = element['href'][4:] if field == 'phone' else element.get_text(' ')
+                    fields[field] = ' '.join(text.split())
+    
+    # Formatting churn in the phone number is not a change either
+    fields['phone'] = to_e164(fields['phone']) or fields['phone']
+    return fields
+
+
+def url_kind(url):
+    """'profile' for /r/<slug> pages, 'listing' for everything else"""
+    return 'profile' if urlparse(url).path.startswith('/r/') else 'listing'
+
+
+class RecrawlDaemon:
+    def __init__(self, scheduler, fetch=None, sleep=time.sleep, max_idle=60.0, discover=True):
+        self.scheduler = scheduler
+        self.fetch = fetch or self.http_fetch
+        self.sleep = sleep
+        self.max_idle = max_idle
+        self.discover = discover
+        self.session = None
+        self._parsers = {}
+    
+    def http_fetch(self, url):
+        """(status, body) over one shared requests session"""
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        response = self.session.get(url, timeout=30)
+        return response.status_code, response.content
+    
+    def parser_for(self, url):
+        """Document parser for the site a listing URL belongs to"""
+        parts = urlparse(url)
+        base_url = f"{parts.scheme}://{parts.netloc}"
+        parser = self._parsers.get(base_url)
+        if parser is None:
+            from opentable_parser import OpenTableDocumentParser
+            parser = self._parsers[base_url] = OpenTableDocumentParser(base_url)
+        return parser
+    
+    def fingerprint(self, url, kind, body):
+        """(fingerprint, restaurants) of a page
+        
+        Pages are fingerprinted on the stable fields extracted from them,
+        LISTING_FIELDS of each listed record or a profile's PROFILE_FIELDS,
+        never on the raw HTML, so per-request tokens and live counts do not
+        read as changes. A page nothing can be extracted from falls back to
+        its raw body
+        """
+        from opentable_singleflight import canonical_url
+        
+        restaurants = []
+        stable = None
+        if kind == 'listing':
+            restaurants = list(self.parser_for(url).iter_restaurants_from_html(body))
+            if restaurants:
+                stable = [
+                    dict({field: restaurant.get(field) for field in LISTING_FIELDS},
+                         url=canonical_url(restaurant['url']) if restaurant.get('url') else '')
+                    for restaurant in restaurants
+                ]
+        else:
+            fields = profile_fields(body)
+            if any(fields.values()):
+                stable = fields
+        
+        content = json.dumps(stable, sort_keys=True).encode('utf-8') if stable else body
+        return hashlib.blake2b(content, digest_size=16).hexdigest(), restaurants
+    
+    def step(self):
+        """Fetch the next due URL, or wait until one is due; returns the URL fetched or None"""
+        url, wait = self.scheduler.poll()
+        if url is None:
+            self.sleep(min(wait, self.max_idle))
+            return None
+        
+        kind = self.scheduler.states[url].kind
+        try:
+            status, body = self.fetch(url)
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+            self.scheduler.record(url, None, status=0)
+            return url
+        
+        fingerprint, restaurants = (None, [])
+        if status == 200:
+            fingerprint, restaurants = self.fingerprint(url, kind, body)
+        changed = self.scheduler.record(url, fingerprint, status)
+        
+        if self.discover:
+            for restaurant in restaurants:
+                if restaurant.get('url'):
+                    self.scheduler.add(restaurant['url'], 'profile')
+        
+        if changed:
+            print(f"Changed: {url}")
+        return url
+    
+    def run(self, duration=None, report_every=HOUR):
+        """Keep recrawling until duration seconds have passed, or forever"""
+        clock = self.scheduler.clock
+        end = clock() + duration if duration else None
+        next_report = clock() + report_every
+        while end is None or clock() < end:
+            self.step()
+            if clock() >= next_report:
+                print(self.scheduler.summary())
+                next_report += report_every
@@ -0,0 +1,406 @@
+"""
+OpenTable Entity Resolution
+===========================
+Merges records of the same restaurant collected from different sources, such
+as the JSON parser and the advanced scraper's HTML strategies, which disagree
+on restaurantId, punctuation in names, phone formatting and URL query strings
+Records are grouped into blocks by cheap keys (E.164 phone, canonical profile
+URL, restaurantId, geohash cell, exact name and its rarest tokens); fuzzy name
+matching only runs on pairs that share a block, and matches are joined into
+clusters with union-find, so the work grows with block sizes rather than
+with the square of the record count
+Usage: python opentable_resolve.py toronto_restaurants.csv toronto_restaurants_advanced.csv -o merged.csv
+       python opentable_resolve.py --db restaurants.db --json merged.jsonl
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+from opentable_phone import to_e164
+from opentable_singleflight import canonical_url
+
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Words too common in restaurant names to say anything about identity
+GENERIC_WORDS = frozenset([
+    'the', 'and', 'of', 'on', 'at', 'de', 'la', 'le', 'el', 'il', 'da', 'restaurant', 'restaurants',
+    'bar', 'cafe', 'bistro', 'grill', 'kitchen', 'house', 'eatery', 'lounge', 'pub', 'tavern',
+    'dining', 'room', 'trattoria', 'pizzeria', 'steakhouse', 'sushi', 'toronto', 'co',
+])
+
+APOSTROPHES = re.compile(r"['‘’`]")
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(name):
+    """Lowercase ASCII name with punctuation removed, so 'Jack’s Café & Bar' becomes 'jacks cafe and bar'"""
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    name = APOSTROPHES.sub('', name.lower()).replace('&', ' and ')
+    return NON_ALNUM.sub(' ', name).strip()
+
+
+@lru_cache(maxsize=65536)
+def name_shingles(normalized):
+    """Character trigrams of a normalized name, padded so short names still get some"""
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def name_similarity(a, b):
+    """Jaccard similarity of two normalized names' trigrams"""
+    if a == b:
+        return 1.0
+    sa = name_shingles(a)
+    sb = name_shingles(b)
+    if not sa or not sb:
+        return 0.0
+    shared = len(sa & sb)
+    return shared / (len(sa) + len(sb) - shared)
+
+
+def _spread_bits(value):
+    """Move bit k of a 32-bit integer to bit 2k"""
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def geohash(lat, lon, precision=7):
+    """Geohash cell of a point; precision 7 cells are about 150m across
+    
+    Quantizes both coordinates once and interleaves their bits (longitude
+    first), instead of bisecting the ranges one bit at a time
+    """
+    total_bits = 5 * precision
+    axis_bits = (total_bits + 1) // 2
+    scale = 1 << axis_bits
+    lon_q = min(int((lon + 180.0) / 360.0 * scale), scale - 1)
+    lat_q = min(int((lat + 90.0) / 180.0 * scale), scale - 1)
+    code = ((_spread_bits(lon_q) << 1) | _spread_bits(lat_q)) >> (2 * axis_bits - total_bits)
+    return ''.join(GEOHASH_BASE32[(code >> shift) & 31] for shift in range(total_bits - 5, -1, -5))
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance in meters, accurate at the few-hundred-meter scale matching uses"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371008.8 * math.hypot(x, y)
+
+
+def as_int(value):
+    """int for ids that may arrive as strings from CSV, or None"""
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def as_float(value):
+    """float for coordinates that may arrive as strings from CSV, or None"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_empty(value):
+    return value is None or value == '' or value == [] or value == {}
+
+
+class EntityResolver:
+    def __init__(self, max_block_size=50, name_tokens=2, max_distance_m=300.0, geohash_precision=7):
+        self.max_block_size = max_block_size
+        self.name_tokens = name_tokens
+        self.max_distance_m = max_distance_m
+        self.geohash_precision = geohash_precision
+        
+        self.records = []
+        self.sources = []
+        
+        # Per-record match features in parallel lists, cheaper than a dict per record
+        self.names = []
+        self.phones = []
+        self.urls = []
+        self.ids = []
+        self.coords = []
+        
+        # Block key -> record index, promoted to a list once a second record shares it;
+        # most keys (URLs, ids, exact names) belong to a single record
+        self.blocks = {}
+        self.token_counts = {}
+        # Rarest-token name blocks, rebuilt by every clusters() call since rarity changes as records arrive
+        self.name_blocks = {}
+        
+        self.stats = {'records': 0, 'blocks': 0, 'oversized_blocks': 0, 'comparisons': 0,
+                      'matches': 0, 'id_conflicts': 0, 'clusters': 0}
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def _block(self, key, index, blocks=None):
+        blocks = self.blocks if blocks is None else blocks
+        members = blocks.get(key)
+        if members is None:
+            blocks[key] = index
+        elif members.__class__ is int:
+            blocks[key] = [members, index]
+        else:
+            members.append(index)
+    
+    def add(self, record, source=''):
+        """Add one restaurant record from a named source, returns its index"""
+        index = len(self.records)
+        self.records.append(record)
+        self.sources.append(source)
+        
+        name = normalize_name(record.get('name'))
+        phone = to_e164(record.get('phone') or '')
+        url = canonical_url(record['url']) if record.get('url') else ''
+        restaurant_id = as_int(record.get('restaurant_id'))
+        lat = as_float(record.get('latitude'))
+        lon = as_float(record.get('longitude'))
+        coords = (lat, lon) if lat is not None and lon is not None else None
+        
+        self.names.append(name)
+        self.phones.append(phone)
+        self.urls.append(url)
+        self.ids.append(restaurant_id)
+        self.coords.append(coords)
+        
+        if phone:
+            self._block('p:' + phone, index)
+        if url:
+            self._block('u:' + url, index)
+        if restaurant_id is not None:
+            self._block(f'i:{restaurant_id}', index)
+        if coords:
+            self._block('g:' + geohash(lat, lon, self.geohash_precision), index)
+        
+        tokens = set(name.split())
+        if tokens:
+            self._block('k:' + ' '.join(sorted(tokens)), index)
+        for token in tokens:
+            if len(token) > 2 and token not in GENERIC_WORDS:
+                self.token_counts[token] = self.token_counts.get(token, 0) + 1
+        return index
+    
+    def add_many(self, records, source=''):
+        """Add records from one source, returns the number added"""
+        count = 0
+        for record in records:
+            self.add(record, source)
+            count += 1
+        return count
+    
+    def _block_name_tokens(self):
+        """Block every record on its rarest distinctive name tokens, taken together
+        
+        Done once all records are in, since rarity is only known then. Unlike
+        the exact-name key, this ignores generic words ('Bar & Grill', 'The'),
+        and combining the rarest tokens keeps blocks small even when each
+        token on its own is shared by dozens of restaurants
+        """
+        counts = self.token_counts
+        self.name_blocks = {}
+        for index, name in enumerate(self.names):
+            tokens = [token for token in set(name.split()) if token in counts]
+            if not tokens:
+                continue
+            tokens.sort(key=lambda token: (counts[token], token))
+            self._block('n:' + ' '.join(sorted(tokens[:self.name_tokens])), index, self.name_blocks)
+    
+    def is_match(self, i, j):
+        """Whether records i and j describe the same restaurant"""
+        id_i, id_j = self.ids[i], self.ids[j]
+        if id_i is not None and id_j is not None:
+            return id_i == id_j
+        if self.urls[i] and self.urls[i] == self.urls[j]:
+            return True
+        
+        phone_i, phone_j = self.phones[i], self.phones[j]
+        if phone_i and phone_j and phone_i != phone_j:
+            return False
+        
+        coords_i, coords_j = self.coords[i], self.coords[j]
+        near = False
+        if coords_i and coords_j:
+            if distance_m(*coords_i, *coords_j) > self.max_distance_m:
+                return False
+            near = True
+        
+        # The more independent evidence agrees, the less the names have to
+        similarity = name_similarity(self.names[i], self.names[j])
+        if phone_i and phone_i == phone_j:
+            return similarity >= 0.3
+        if near:
+            return similarity >= 0.6
+        return similarity >= 0.8
+    
+    def clusters(self):
+        """Lists of record indexes that refer to the same restaurant"""
+        self._block_name_tokens()
+        parent = list(range(len(self.records)))
+        
+        def find(index):
+            root = index
+            while parent[root] != root:
+                root = parent[root]
+            while parent[index] != root:
+                parent[index], index = root, parent[index]
+            return root
+        
+        ids = self.ids
+        # restaurantId carried by each component root, so an id-less record
+        # cannot bridge two components with different ids
+        root_ids = list(ids)
+        for key in ('blocks', 'oversized_blocks', 'comparisons', 'matches', 'id_conflicts'):
+            self.stats[key] = 0
+        for members in itertools.chain(self.blocks.values(), self.name_blocks.values()):
+            if members.__class__ is int:
+                continue
+            self.stats['blocks'] += 1
+            if len(members) > self.max_block_size:
+                self.stats['oversized_blocks'] += 1
+                continue
+            for a in range(len(members)):
+                i = members[a]
+                id_i = ids[i]
+                for b in range(a + 1, len(members)):
+                    j = members[b]
+                    # Two different restaurantIds never match; most pairs in name blocks end here
+                    if id_i is not None and ids[j] is not None and id_i != ids[j]:
+                        continue
+                    root_i, root_j = find(i), find(j)
+                    if root_i == root_j:
+                        continue
+                    id_a, id_b = root_ids[root_i], root_ids[root_j]
+                    if id_a is not None and id_b is not None and id_a != id_b:
+                        self.stats['id_conflicts'] += 1
+                        continue
+                    self.stats['comparisons'] += 1
+                    if self.is_match(i, j):
+                        self.stats['matches'] += 1
+                        root, child = min(root_i, root_j), max(root_i, root_j)
+                        parent[child] = root
+                        if root_ids[root] is None:
+                            root_ids[root] = root_ids[child]
+        
+        groups = {}
+        for index in range(len(self.records)):
+            groups.setdefault(find(index), []).append(index)
+        self.stats['records'] = len(self.records)
+        self.stats['clusters'] = len(groups)
+        return list(groups.values())
+    
+    def merge(self, indexes):
+        """One record for a cluster, with the provenance of every input record
+        
+        The record with a restaurantId (the JSON path) is preferred as the
+        base, then the most complete one; empty fields are filled from the rest
+        """
+        def completeness(index):
+            record = self.records[index]
+            return (self.ids[index] is not None, sum(1 for value in record.values() if not is_empty(value)), -index)
+        
+        ordered = sorted(indexes, key=completeness, reverse=True)
+        merged = dict(self.records[ordered[0]])
+        for index in ordered[1:]:
+            for key, value in self.records[index].items():
+                if is_empty(merged.get(key)) and not is_empty(value):
+                    merged[key] = value
+        
+        merged['provenance'] = [
+            {
+                'index': index,
+                'source': self.sources[index],
+                'name': self.records[index].get('name', ''),
+                'url': self.records[index].get('url', ''),
+                'restaurant_id': self.ids[index],
+            }
+            for index in sorted(indexes)
+        ]
+        return merged
+    
+    def resolve(self):
+        """Yield one merged record per distinct restaurant, in order of first appearance"""
+        for indexes in sorted(self.clusters(), key=min):
+            yield self.merge(indexes)
+    
+    def summary(self):
+        """One-line description of the last resolution"""
+        return (f"{self.stats['records']} records -> {self.stats['clusters']} restaurants, "
+                f"{self.stats['comparisons']:,} comparisons in {self.stats['blocks']:,} blocks "
+                f"({self.stats['oversized_blocks']} oversized blocks skipped, "
+                f"{self.stats['id_conflicts']:,} merges refused on conflicting restaurantIds)")
+
+
+def read_csv(filepath):
+    """Rows of a scraper CSV file"""
+    with open(filepath, 'r', newline='', encoding='utf-8') as csvfile:
+        yield from csv.DictReader(csvfile)
+
+
+def write_csv(restaurants, filename):
+    """Write merged restaurants with their source list, returns the count written"""
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['name', 'url', 'phone', 'cuisine', 'sources'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        for restaurant in restaurants:
+            row = dict(restaurant)
+            row['sources'] = ';'.join(sorted({entry['source'] for entry in restaurant['provenance']}))
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def main():
+    """Resolve restaurants across CSV files and/or a store into one merged file"""
+    parser = argparse.ArgumentParser(description="Merge duplicate OpenTable restaurants across sources")
+    parser.add_argument('csv_files', nargs='*', help="Scraper CSV files, each one a source")
+    parser.add_argument('--db', help="Also read every restaurant in this SQLite store")
+    parser.add_argument('-o', '--output', default='restaurants_merged.csv')
+    parser.add_argument('--json', help="Write merged records with full provenance as JSON lines instead")
+    args = parser.parse_args()
+    
+    resolver = EntityResolver()
+    for filepath in args.csv_files:
+        resolver.add_many(read_csv(filepath), source=os.path.basename(filepath))
+    if args.db:
+        from opentable_storage import RestaurantStore
+        with RestaurantStore(args.db) as store:
+            resolver.add_many(store.iter_all(), source=os.path.basename(args.db))
+    
+    merged = resolver.resolve()
+    if args.json:
+        count = 0
+        with open(args.json, 'w', encoding='utf-8') as file:
+            for restaurant in merged:
+                file.write(json.dumps(restaurant) + '\n')
+                count += 1
+        print(f"Wrote {count} restaurants to {args.json}")
+    else:
+        count = write_csv(merged, args.output)
+        print(f"Wrote {count} restaurants to {args.output}")
+    print(resolver.summary())
+
+
+if __name__ == "__main__":
+    main()
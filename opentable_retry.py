@@ -0,0 +1,407 @@
+"""
+OpenTable Retry Policy
+======================
+Failure-class-aware retries and per-URL-family circuit breakers for page fetches
+Every failed attempt is classified (DNS, connect, timeout, 4xx, 429, 5xx,
+or a page that parsed to nothing) and retried according to that class's
+policy: a 404 is never retried, a 429 waits as long as Retry-After asks, a
+5xx backs off exponentially with jitter. Consecutive failures across one URL
+family (a listing URL and its pages, or every /r/<slug> profile) open that
+family's breaker, so a dead URL pattern stops being requested; after a
+cooldown one probe request is let through to see if it has recovered. A 404
+on one profile only means that restaurant is gone, so client errors don't
+count against per-resource families
+Usage: retrier = Retrier(); retrier.call(url, session.get); print(retrier.summary())
+"""
+
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+
+DNS = 'dns'
+CONNECT = 'connect'
+TIMEOUT = 'timeout'
+CLIENT_ERROR = 'client_error'
+RATE_LIMITED = 'rate_limited'
+SERVER_ERROR = 'server_error'
+EMPTY = 'empty'
+OTHER = 'other'
+
+# Failures that say the URL itself is wrong, not that the server had a bad moment
+PERMANENT = frozenset([DNS, CLIENT_ERROR])
+
+DNS_MESSAGES = re.compile(
+    r'name or service not known|nodename nor servname|failed to resolve|getaddrinfo failed|'
+    r'could not resolve host|no address associated|name resolution',
+    re.I
+)
+
+# libcurl error codes raised by curl-cffi
+CURL_DNS_CODES = frozenset([5, 6])
+CURL_CONNECT_CODES = frozenset([7, 35, 52, 55, 56])
+CURL_TIMEOUT_CODES = frozenset([28])
+
+
+def exception_names(error):
+    """Class names along the exception's MRO and its cause chain, so requests,
+    urllib3 and curl-cffi errors can be told apart without importing them"""
+    names = set()
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        names.update(cls.__name__ for cls in type(error).__mro__)
+        error = error.__cause__ or error.__context__
+    return names
+
+
+def classify_status(status):
+    """Failure class of an HTTP status, or None for a success"""
+    if status == 429:
+        return RATE_LIMITED
+    if status >= 500:
+        return SERVER_ERROR
+    if status >= 400:
+        return CLIENT_ERROR
+    return None
+
+
+def classify_exception(error):
+    """Failure class of an exception raised while fetching"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if isinstance(status, int) and classify_status(status):
+        return classify_status(status)
+    
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and 'CurlError' in exception_names(error):
+        if code in CURL_DNS_CODES:
+            return DNS
+        if code in CURL_TIMEOUT_CODES:
+            return TIMEOUT
+        if code in CURL_CONNECT_CODES:
+            return CONNECT
+    
+    names = exception_names(error)
+    if 'gaierror' in names or 'NameResolutionError' in names or 'DNSError' in names or DNS_MESSAGES.search(str(error)):
+        return DNS
+    # urllib3's NewConnectionError subclasses its ConnectTimeoutError, so refusals and resets are checked first
+    if names & {'ConnectionRefusedError', 'ConnectionResetError', 'ConnectionAbortedError', 'RemoteDisconnected'}:
+        return CONNECT
+    # requests' ConnectTimeout is both a ConnectionError and a Timeout; it is the timeout that matters
+    if names & {'Timeout', 'TimeoutError', 'timeout', 'ReadTimeoutError', 'ConnectTimeoutError'}:
+        return TIMEOUT
+    if names & {'ConnectionError', 'ProtocolError', 'NewConnectionError'}:
+        return CONNECT
+    return OTHER
+
+
+def retry_after(response, limit):
+    """Seconds a 429 or 503 response asks us to wait, capped at limit; None without the header"""
+    value = (getattr(response, 'headers', None) or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), limit)
+
+
+def url_family(url):
+    """Breaker key for a URL: host plus path pattern
+    
+    Pages of one listing URL share a family (the page parameter is dropped),
+    as do all restaurant profiles, whatever their slug or query
+    """
+    parts = urlsplit(url)
+    host = (parts.netloc or '').lower()
+    path = parts.path.rstrip('/') or '/'
+    if path.startswith('/r/'):
+        return f"{host}/r/*"
+    path = re.sub(r'/\d+(?=/|$)', '/{n}', path)
+    params = sorted((key, value) for key, value in parse_qsl(parts.query) if key != 'page')
+    return f"{host}{path}?{urlencode(params)}" if params else f"{host}{path}"
+
+
+def per_resource_family(family):
+    """Whether each URL of a family names its own resource (restaurant profiles), so one missing says nothing of the rest"""
+    return family.endswith('/r/*')
+
+
+class RetryPolicy:
+    def __init__(self, attempts=3, backoff=3.0, max_backoff=60.0, honor_retry_after=False):
+        # Total tries including the first; 1 means never retry
+        self.attempts = attempts
+        # Exponential backoff with full jitter: uniform(0, backoff * 2^(retry - 1)), capped
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.honor_retry_after = honor_retry_after
+    
+    def delay(self, retry, response=None):
+        """Seconds to wait before retry number `retry` (1 for the first retry)"""
+        if self.honor_retry_after and response is not None:
+            requested = retry_after(response, self.max_backoff)
+            if requested is not None:
+                return requested
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (retry - 1)))
+
+
+DEFAULT_POLICIES = {
+    DNS: RetryPolicy(attempts=2, backoff=1.0),
+    CONNECT: RetryPolicy(attempts=3, backoff=2.0),
+    TIMEOUT: RetryPolicy(attempts=3, backoff=3.0),
+    CLIENT_ERROR: RetryPolicy(attempts=1),
+    RATE_LIMITED: RetryPolicy(attempts=5, backoff=10.0, max_backoff=120.0, honor_retry_after=True),
+    SERVER_ERROR: RetryPolicy(attempts=3, backoff=3.0, honor_retry_after=True),
+    # A 200 that parsed to nothing is usually a bot-check interstitial; one more look is worth it
+    EMPTY: RetryPolicy(attempts=2, backoff=3.0),
+    OTHER: RetryPolicy(attempts=2, backoff=3.0),
+}
+
+
+class FetchError(Exception):
+    """A fetch that failed after its policy's attempts, carrying the failure class"""
+    
+    def __init__(self, url, failure, attempts, cause=None):
+        self.url = url
+        self.failure = failure
+        self.attempts = attempts
+        self.cause = cause
+        detail = f": {cause}" if cause is not None else ""
+        super().__init__(f"{failure} after {attempts} attempt{'s' if attempts != 1 else ''} for {url}{detail}")
+    
+    @property
+    def permanent(self):
+        return self.failure in PERMANENT
+
+
+class CircuitOpenError(FetchError):
+    """Raised without sending a request while the URL's family breaker is open"""
+    
+    def __init__(self, url, family):
+        self.family = family
+        super().__init__(url, 'circuit_open', 0)
+        self.args = (f"circuit open for {family}, not fetching {url}",)
+    
+    @property
+    def permanent(self):
+        return False
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=3, reset_timeout=60.0, max_reset_timeout=900.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        # Doubles every time a half-open probe fails, back to reset_timeout on success
+        self.timeout = reset_timeout
+        self.probing = False
+        self.opened = 0
+    
+    def allow(self):
+        """Whether a request may be sent now; in half-open state only one probe at a time"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if self.clock() - self.opened_at < self.timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.timeout = self.reset_timeout
+        self.probing = False
+    
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self.timeout = min(self.timeout * 2, self.max_reset_timeout)
+            self._open()
+            return
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+    
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self.probing = False
+        self.opened += 1
+
+
+class Retrier:
+    def __init__(self, policies=None, failure_threshold=3, reset_timeout=60.0, breakers=True,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.use_breakers = breakers
+        self.sleep = sleep
+        self.clock = clock
+        self.breakers = {}
+        self._lock = threading.Lock()
+        
+        # 'wasted' counts requests that produced nothing usable; 'short_circuited'
+        # counts requests an open breaker saved; 'backoff' is seconds spent waiting
+        self.stats = {'requests': 0, 'succeeded': 0, 'retries': 0, 'gave_up': 0, 'wasted': 0,
+                      'short_circuited': 0, 'backoff': 0.0}
+        self.failures = Counter()
+    
+    def breaker(self, url):
+        """The circuit breaker for a URL's family"""
+        family = url_family(url)
+        with self._lock:
+            breaker = self.breakers.get(family)
+            if breaker is None:
+                breaker = self.breakers[family] = CircuitBreaker(self.failure_threshold, self.reset_timeout,
+                                                                  clock=self.clock)
+            return breaker
+    
+    def allows(self, url):
+        """Whether the URL's family breaker is not open, without taking a half-open probe slot"""
+        if not self.use_breakers:
+            return True
+        breaker = self.breaker(url)
+        with self._lock:
+            return breaker.state != CircuitBreaker.OPEN or self.clock() - breaker.opened_at >= breaker.timeout
+    
+    def call(self, url, send, accept=None, attempts=None):
+        """send(url) with retries; returns the response, or accept(response) when accept is given
+        
+        send performs one request and returns the response without raising
+        on HTTP errors. accept turns a good response into the caller's result;
+        a falsy result counts as an EMPTY failure and is returned as is once
+        its attempts run out. Other failures raise FetchError, or
+        CircuitOpenError when the family breaker refuses the request.
+        attempts caps every class's policy.
+        """
+        retry = 0
+        while True:
+            self._admit(url)
+            try:
+                response, error = send(url), None
+            except Exception as e:
+                response, error = None, e
+            done, value = self._outcome(url, retry, attempts, response, error, accept)
+            if done:
+                return value
+            retry += 1
+            self.sleep(value)
+    
+    async def call_async(self, url, send, accept=None, attempts=None):
+        """call() for a coroutine send, waiting out backoff with asyncio.sleep"""
+        import asyncio
+        
+        retry = 0
+        while True:
+            self._admit(url)
+            try:
+                response, error = await send(url), None
+            except Exception as e:
+                response, error = None, e
+            done, value = self._outcome(url, retry, attempts, response, error, accept)
+            if done:
+                return value
+            retry += 1
+            await asyncio.sleep(value)
+    
+    def _admit(self, url):
+        """Count a request about to be sent, or raise CircuitOpenError"""
+        if self.use_breakers:
+            breaker = self.breaker(url)
+            with self._lock:
+                allowed = breaker.allow()
+                if not allowed:
+                    self.stats['short_circuited'] += 1
+            if not allowed:
+                raise CircuitOpenError(url, url_family(url))
+        with self._lock:
+            self.stats['requests'] += 1
+    
+    def classify(self, response, error):
+        """Failure class of one attempt, or None when it succeeded"""
+        if error is not None:
+            return classify_exception(error)
+        return classify_status(response.status_code)
+    
+    def _outcome(self, url, retry, attempts, response, error, accept):
+        """(True, result) when the call is finished, (False, delay) to try again"""
+        result = response
+        failure = self.classify(response, error)
+        if failure is None and accept is not None:
+            try:
+                result = accept(response)
+            except Exception as e:
+                failure, error = OTHER, e
+            else:
+                if not result:
+                    failure = EMPTY
+        
+        breaker = self.breaker(url) if self.use_breakers else None
+        if failure is None:
+            with self._lock:
+                self.stats['succeeded'] += 1
+                if breaker is not None:
+                    breaker.record_success()
+            return True, result
+        
+        policy = self.policies[failure]
+        limit = policy.attempts if attempts is None else min(policy.attempts, attempts)
+        with self._lock:
+            self.failures[failure] += 1
+            self.stats['wasted'] += 1
+            if breaker is not None:
+                if failure == CLIENT_ERROR and per_resource_family(url_family(url)):
+                    # The server answered; only this one resource is missing
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+            gave_up = retry + 1 >= limit or (breaker is not None and breaker.state == CircuitBreaker.OPEN)
+            if gave_up:
+                self.stats['gave_up'] += 1
+        
+        if gave_up:
+            if failure == EMPTY:
+                return True, result
+            if error is None:
+                raise FetchError(url, failure, retry + 1, f"HTTP {response.status_code}")
+            raise FetchError(url, failure, retry + 1, error) from error
+        
+        delay = policy.delay(retry + 1, response)
+        with self._lock:
+            self.stats['retries'] += 1
+            self.stats['backoff'] += delay
+        print(f"Attempt {retry + 1} for {url} failed ({failure}: {error or f'HTTP {response.status_code}'}), "
+              f"retrying in {delay:.1f}s")
+        return False, delay
+    
+    def summary(self):
+        """One-line description of requests, waste and breaker activity so far"""
+        stats = self.stats
+        failures = ', '.join(f"{name} {count}" for name, count in self.failures.most_common()) or 'none'
+        opened = sum(breaker.opened for breaker in self.breakers.values())
+        open_now = sum(1 for breaker in self.breakers.values() if breaker.state != CircuitBreaker.CLOSED)
+        return (f"{stats['requests']} requests ({stats['wasted']} wasted, {stats['retries']} retries, "
+                f"{stats['backoff']:.1f}s backoff), failures: {failures}; breakers opened {opened} times, "
+                f"{open_now} not closed, {stats['short_circuited']} requests short-circuited")
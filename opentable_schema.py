@@ -0,0 +1,151 @@
+"""
+OpenTable Field Schema
+======================
+Declarative JSON-path schema for restaurant objects, compiled once into an
+extractor function that builds the record dict
+Each field is (record key, path or tuple of fallback paths, default, transform)
+"""
+
+from opentable_phone import format_phone
+
+
+LOOKUP_ERRORS = (KeyError, TypeError, IndexError, AttributeError)
+
+
+def strip(value):
+    """Strip surrounding whitespace from string values"""
+    return value.strip() if isinstance(value, str) else value
+
+
+def absolute_url(base_url):
+    """Transform that prefixes relative links with base_url"""
+    def transform(link):
+        if not link:
+            return ''
+        return link if link.startswith('http') else base_url + link
+    return transform
+
+
+def names(items):
+    """['MICHELIN 2024', ...] from a list of objects with a name (and year)"""
+    result = []
+    for item in items or []:
+        if isinstance(item, dict) and item.get('name'):
+            year = item.get('year')
+            result.append(f"{item['name']} {year}" if year else item['name'])
+    return result
+
+
+def photo_urls(profile):
+    """{'medium': url, ...} from a photos.profile object of sized thumbnails"""
+    return {
+        size: thumbnail['url']
+        for size, thumbnail in (profile or {}).items()
+        if isinstance(thumbnail, dict) and thumbnail.get('url')
+    }
+
+
+def restaurant_fields(base_url):
+    """Schema for lolzViewAll.searchResults.restaurants entries"""
+    return [
+        ('name', 'name', '', strip),
+        ('url', 'urls.profileLink.link', '', absolute_url(base_url)),
+        ('phone', ('contactInformation.formattedPhoneNumber', 'contactInformation.phoneNumber'), '', format_phone),
+        ('cuisine', 'primaryCuisine.name', '', strip),
+        ('restaurant_id', 'restaurantId', None, None),
+        ('metro_id', 'metro.metroId', None, None),
+        ('latitude', 'coordinates.latitude', None, None),
+        ('longitude', 'coordinates.longitude', None, None),
+        ('neighborhood', 'neighborhood.name', '', strip),
+        ('price_band', 'priceBand.priceBandId', None, None),
+        ('rating', 'statistics.reviews.ratings.overall.rating', None, None),
+        ('review_count', 'statistics.reviews.allTimeTextReviewCount', None, None),
+        ('recent_reservations', 'statistics.recentReservationCount', None, None),
+        ('awards', 'awards', [], names),
+        ('premium', 'features.inPremiumMarketplace', False, bool),
+        ('has_takeout', 'hasTakeout', False, bool),
+        ('delivery_partners', 'deliveryPartners', [], names),
+        ('description', 'description', '', strip),
+        ('top_review', 'topReview.highlightedText', '', strip),
+        ('photos', 'photos.profile', {}, photo_urls),
+    ]
+
+
+def compile_schema(fields, name='extract'):
+    """Compile a field list once into a function taking a raw object and returning a record dict
+    
+    The function walks each path with plain subscripts inside a try block,
+    and path prefixes shared by several fields (statistics.reviews, say)
+    are walked once into a local, as a hand-written extractor would.
+    Later paths are fallbacks, only tried when earlier ones came up empty;
+    missing or null values take the default (a fresh copy when mutable)
+    and everything else goes through the transform, with strip inlined.
+    Paths are written into the source as repr() literals, never as code
+    """
+    fields = [(key, (paths,) if isinstance(paths, str) else tuple(paths), default, transform)
+              for key, paths, default, transform in fields]
+    
+    # Proper prefixes of more than one path are walked once, shortest first
+    prefix_uses = {}
+    for _, paths, _, _ in fields:
+        for path in paths:
+            parts = tuple(path.split('.'))
+            for depth in range(1, len(parts)):
+                prefix_uses[parts[:depth]] = prefix_uses.get(parts[:depth], 0) + 1
+    shared = sorted((prefix for prefix, uses in prefix_uses.items() if uses > 1), key=len)
+    locals_by_prefix = {}
+    
+    def walk(parts):
+        """(base variable, subscripts) for parts, starting from its longest walked prefix"""
+        for depth in range(len(parts) - 1, 0, -1):
+            if parts[:depth] in locals_by_prefix:
+                return locals_by_prefix[parts[:depth]], ''.join(f"[{part!r}]" for part in parts[depth:])
+        return 'obj', ''.join(f"[{part!r}]" for part in parts)
+    
+    def lookup(target, parts, indent="    "):
+        base, subscripts = walk(parts)
+        return [f"{indent}try:", f"{indent}    {target} = {base}{subscripts}",
+                f"{indent}except LOOKUP_ERRORS:", f"{indent}    {target} = None"]
+    
+    namespace = {'LOOKUP_ERRORS': LOOKUP_ERRORS}
+    lines = [f"def {name}(obj):"]
+    for index, prefix in enumerate(shared):
+        lines.extend(lookup(f"p{index}", prefix))
+        locals_by_prefix[prefix] = f"p{index}"
+    
+    values = []
+    for index, (key, paths, default, transform) in enumerate(fields):
+        var = f"v{index}"
+        for attempt, path in enumerate(paths):
+            if attempt:
+                lines.append(f"    if not {var}:")
+            lines.extend(lookup(var, tuple(path.split('.')), "        " if attempt else "    "))
+        
+        namespace[f"D{index}"] = default
+        default_expr = f"D{index}.copy()" if isinstance(default, (list, dict)) else f"D{index}"
+        if transform is None:
+            expr = var
+        elif transform is strip:
+            expr = f"({var}.strip() if {var}.__class__ is str else {var})"
+        else:
+            namespace[f"T{index}"] = transform
+            expr = f"T{index}({var})"
+        values.append(f"{key!r}: {default_expr} if {var} is None else {expr}")
+    
+    lines.append("    return {")
+    lines.extend(f"        {value}," for value in values)
+    lines.append("    }")
+    
+    source = '\n'.join(lines)
+    exec(compile(source, f"<schema {name}>", 'exec'), namespace)
+    extractor = namespace[name]
+    extractor.source = source
+    return extractor
+
+
+def empty_record(fields):
+    """Record with every field set to its default"""
+    return {
+        key: default.copy() if isinstance(default, (list, dict)) else default
+        for key, _, default, _ in fields
+    }
@@ -7,20 +7,52 @@ Outputs: CSV file with the restaurant data
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from opentable_memory import parsed_html
+from opentable_phone import extract_phone
+from opentable_retry import Retrier
+from opentable_singleflight import SingleFlight, canonical_url
 import csv
 import re
 import time
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 import json
 
 class OpenTableScraper:
-    def __init__(self):
+    def __init__(self, detail_workers=8, archive=None, streaming=False, watchdog=None):
         self.base_url = "https://www.opentable.ca"
         self.session = requests.Session()
         self.restaurants = []
         
+        # Optional ArchiveWriter that keeps every fetched response for re-parsing
+        self.archive = archive
+        
+        # Concurrent fetches of the same page (after URL canonicalization) share one request
+        self.singleflight = SingleFlight()
+        
+        # Retries by failure class, with circuit breakers per URL family
+        self.retrier = Retrier()
+        
+        # Optional MemoryWatchdog; listing fetches pause while memory is over its limit
+        self.watchdog = watchdog
+        
+        # Streaming mode reads listing records from the page JSON while it downloads
+        # and hangs up once the JSON has arrived; only that JSON script is archived
+        self.streaming = streaming
+        self.stream_stats = {'pages': 0, 'bytes_received': 0, 'content_length': 0}
+        
+        # Detail pages are fetched by a bounded thread pool sharing this session,
+        # so the connection pool must hold one connection per worker plus the listing fetch
+        self.detail_workers = max(1, detail_workers)
+        self.detail_delay = (1, 3)
+        self.page_delay = (2, 4)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.detail_workers + 1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
         # Headers to mimic a real browser
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
@@ -37,42 +69,54 @@ class OpenTableScraper:
         # OpenTable URL for Toronto restaurants
         return f"{self.base_url}/toronto-ontario-restaurants"
     
-    def fetch_page(self, url, retries=3):
-        """Fetch a page with retry logic"""
-        for attempt in range(retries):
-            try:
-                print(f"Fetching: {url}")
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                return response
-            except requests.RequestException as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt < retries - 1:
-                    time.sleep(random.uniform(2, 5))
-                else:
-                    raise
+    def fetch_page(self, url, retries=None):
+        """Fetch a page, sharing the request with concurrent callers for the same URL"""
+        return self.singleflight.do(canonical_url(url), self._fetch_page, url, retries)
     
-    def extract_phone_from_text(self, text):
-        """Extract phone number from text using regex"""
-        if not text:
-            return ""
+    def _fetch_page(self, url, retries=None):
+        """Fetch a page, retrying as self.retrier's policy for the failure class says"""
+        response = self.retrier.call(url, self.send_request, attempts=retries)
+        if self.archive is not None:
+            self.archive.add_response(response)
+        return response
+    
+    def fetch_streamed_listing(self, url, parser):
+        """Stream a listing page's JSON, sharing the request with concurrent callers for the same URL"""
+        return self.singleflight.do(('stream', canonical_url(url)), self._fetch_streamed_listing, url, parser)
+    
+    def _fetch_streamed_listing(self, url, parser):
+        """Stream a listing page under self.retrier's policy, returns its window-vars JSON or None
         
-        # Common phone number patterns
-        phone_patterns = [
-            r'\+?1?[-.\s]?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',
-            r'\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',
-            r'([0-9]{3})[-.]([0-9]{3})[-.]([0-9]{4})'
-        ]
+        The archive keeps the JSON script only, since the rest of the page is never downloaded
+        """
+        def send(url):
+            print(f"Streaming: {url}")
+            response = self.session.get(url, stream=True, timeout=30)
+            if response.status_code >= 400:
+                response.content  # Error bodies are read in full so the connection returns to the pool
+            return response
         
-        for pattern in phone_patterns:
-            match = re.search(pattern, text)
-            if match:
-                if len(match.groups()) == 3:
-                    return f"({match.group(1)}) {match.group(2)}-{match.group(3)}"
-                else:
-                    return match.group(0)
+        def accept(response):
+            data, scanner = parser.read_streamed_response(response)
+            self.stream_stats['pages'] += 1
+            self.stream_stats['bytes_received'] += parser.last_stream['bytes_received']
+            self.stream_stats['content_length'] += parser.last_stream['content_length']
+            if data is None:
+                return None
+            if self.archive is not None:
+                self.archive.add(response.url, scanner.document(), response.status_code, response.headers)
+            return data
         
-        return ""
+        return self.retrier.call(url, send, accept=accept)
+    
+    def send_request(self, url):
+        """One GET over the shared session, without raising on HTTP error statuses"""
+        print(f"Fetching: {url}")
+        return self.session.get(url, timeout=30)
+    
+    def extract_phone_from_text(self, text):
+        """Extract phone number from text using regex"""
+        return extract_phone(text)
     
     def clean_text(self, text):
         """Clean and normalize text"""
@@ -80,7 +124,7 @@ class OpenTableScraper:
             return ""
         return re.sub(r'\s+', ' ', text.strip())
     
-    def parse_restaurant_card(self, card):
+    def parse_restaurant_card(self, card, fetch_phone=True):
         """Parse individual restaurant card/listing"""
         restaurant = {
             'name': '',
@@ -120,7 +164,7 @@ class OpenTableScraper:
                 restaurant['phone'] = self.extract_phone_from_text(phone_elem)
             
             # If no phone found in card, try to get it from restaurant page
-            if not restaurant['phone'] and restaurant['url']:
+            if fetch_phone and not restaurant['phone'] and restaurant['url']:
                 restaurant['phone'] = self.get_restaurant_phone(restaurant['url'])
             
             return restaurant
@@ -132,62 +176,95 @@ class OpenTableScraper:
     def get_restaurant_phone(self, restaurant_url):
         """Get phone number from individual restaurant page"""
         try:
-            time.sleep(random.uniform(1, 3))  # Be respectful
+            time.sleep(random.uniform(*self.detail_delay))  # Be respectful
             response = self.fetch_page(restaurant_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Look for phone numbers in various locations
-            phone_selectors = [
-                '[data-test*="phone"]',
-                '[class*="phone"]',
-                'a[href^="tel:"]',
-                '.restaurant-info',
-                '.contact-info'
-            ]
-            
-            for selector in phone_selectors:
-                elements = soup.select(selector)
-                for elem in elements:
-                    text = elem.get_text() if hasattr(elem, 'get_text') else str(elem)
-                    phone = self.extract_phone_from_text(text)
-                    if phone:
-                        return phone
-            
-            # Search for phone in page text
-            page_text = soup.get_text()
-            phone = self.extract_phone_from_text(page_text)
-            if phone:
-                return phone
+            with parsed_html(response.content) as soup:
+                # Look for phone numbers in various locations
+                phone_selectors = [
+                    '[data-test*="phone"]',
+                    '[class*="phone"]',
+                    'a[href^="tel:"]',
+                    '.restaurant-info',
+                    '.contact-info'
+                ]
+                
+                for selector in phone_selectors:
+                    elements = soup.select(selector)
+                    for elem in elements:
+                        text = elem.get_text() if hasattr(elem, 'get_text') else str(elem)
+                        phone = self.extract_phone_from_text(text)
+                        if phone:
+                            return phone
+                
+                # Search for phone in page text
+                page_text = soup.get_text()
+                phone = self.extract_phone_from_text(page_text)
+                if phone:
+                    return phone
                 
         except Exception as e:
             print(f"Error getting phone for {restaurant_url}: {e}")
         
         return ""
     
-    def scrape_restaurants(self, max_restaurants=50):
-        """Main scraping method"""
-        print("Starting OpenTable Canada restaurant scraper...")
-        print(f"Target: {max_restaurants} restaurants from Toronto, Ontario")
-        
-        # Start with the main Toronto restaurants page
+    def enrich_restaurant(self, restaurant):
+        """Detail stage: fill in a missing phone from the restaurant page"""
+        if not restaurant['phone'] and restaurant['url']:
+            restaurant['phone'] = self.get_restaurant_phone(restaurant['url'])
+        return restaurant
+    
+    def iter_restaurants(self, max_restaurants=None):
+        """Lazily yield restaurants, enriching details on a thread pool
+
+        Parsed cards are streamed into the detail stage while the next listing
+        page is fetched. Only a bounded number of cards run ahead of the
+        consumer, so stopping iteration early stops the crawl as well.
+        """
+        with ThreadPoolExecutor(max_workers=self.detail_workers) as executor:
+            pending = deque()
+            max_pending = self.detail_workers * 2
+            
+            try:
+                listing = self.iter_streamed_listing_restaurants if self.streaming else self.iter_listing_restaurants
+                for restaurant in listing(max_restaurants):
+                    pending.append(executor.submit(self.enrich_restaurant, restaurant))
+                    # Hand back finished records in listing order once the stage is full
+                    while len(pending) >= max_pending or (pending and pending[0].done()):
+                        yield pending.popleft().result()
+                
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+    
+    def iter_listing_restaurants(self, max_restaurants=None):
+        """Yield restaurants parsed from listing pages without fetching details"""
         toronto_url = self.get_toronto_restaurants_url()
-        
-        page = 1
         restaurants_found = 0
+        page = 1
         
-        while restaurants_found < max_restaurants:
+        while max_restaurants is None or restaurants_found < max_restaurants:
             print(f"\n--- Scraping page {page} ---")
             
             # Construct URL for current page
             if page == 1:
                 current_url = toronto_url
             else:
+                # Be respectful - add delay between pages
+                time.sleep(random.uniform(*self.page_delay))
                 current_url = f"{toronto_url}?page={page}"
+            if self.watchdog is not None:
+                self.watchdog.throttle()
             
             try:
                 response = self.fetch_page(current_url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
+            except Exception as e:
+                print(f"Error on page {page}: {e}")
+                return
+            
+            # The tree is torn down once this page's cards have all been handed out
+            with parsed_html(response.content) as soup:
                 # Find restaurant cards/listings
                 # OpenTable uses various selectors, try multiple approaches
                 restaurant_cards = (
@@ -206,43 +283,86 @@ class OpenTableScraper:
                 
                 if not restaurant_cards:
                     print("No restaurants found on this page, ending scrape.")
-                    break
+                    return
                 
                 print(f"Found {len(restaurant_cards)} restaurant listings on page {page}")
                 
-                # Parse each restaurant
+                # Parse each restaurant only when the consumer asks for it
                 page_restaurants = 0
                 for card in restaurant_cards:
-                    if restaurants_found >= max_restaurants:
-                        break
+                    if max_restaurants is not None and restaurants_found >= max_restaurants:
+                        return
                     
-                    restaurant = self.parse_restaurant_card(card)
+                    restaurant = self.parse_restaurant_card(card, fetch_phone=False)
                     
-                    if restaurant['name']:  # Only add if we got a name
-                        self.restaurants.append(restaurant)
+                    if restaurant['name']:  # Only yield if we got a name
                         restaurants_found += 1
                         page_restaurants += 1
-                        
-                        print(f"  {restaurants_found}. {restaurant['name']}")
-                        if restaurant['cuisine']:
-                            print(f"     Cuisine: {restaurant['cuisine']}")
-                        if restaurant['phone']:
-                            print(f"     Phone: {restaurant['phone']}")
+                        yield restaurant
                 
                 print(f"Extracted {page_restaurants} restaurants from page {page}")
                 
                 if page_restaurants == 0:
                     print("No valid restaurants found on this page, ending scrape.")
-                    break
-                
-                page += 1
-                
-                # Be respectful - add delay between pages
-                time.sleep(random.uniform(2, 4))
-                
+                    return
+            
+            page += 1
+    
+    def iter_streamed_listing_restaurants(self, max_restaurants=None):
+        """Yield restaurants from each listing page's JSON, streaming the page and stopping early"""
+        from opentable_parser import OpenTableDocumentParser
+        
+        parser = OpenTableDocumentParser(self.base_url)
+        toronto_url = self.get_toronto_restaurants_url()
+        restaurants_found = 0
+        page = 1
+        
+        while max_restaurants is None or restaurants_found < max_restaurants:
+            print(f"\n--- Streaming page {page} ---")
+            if page == 1:
+                current_url = toronto_url
+            else:
+                time.sleep(random.uniform(*self.page_delay))
+                current_url = f"{toronto_url}?page={page}"
+            if self.watchdog is not None:
+                self.watchdog.throttle()
+            
+            page_restaurants = 0
+            try:
+                data = self.fetch_streamed_listing(current_url, parser)
             except Exception as e:
                 print(f"Error on page {page}: {e}")
-                break
+                return
+            if data is None:
+                print(f"No JSON data found in {current_url}")
+                return
+            
+            for restaurant in parser.iter_restaurants_from_json(data):
+                if max_restaurants is not None and restaurants_found >= max_restaurants:
+                    break
+                restaurants_found += 1
+                page_restaurants += 1
+                yield restaurant
+            
+            print(f"Extracted {page_restaurants} restaurants from page {page}")
+            if page_restaurants == 0:
+                print("No restaurants found on this page, ending scrape.")
+                return
+            page += 1
+    
+    def scrape_restaurants(self, max_restaurants=50):
+        """Main scraping method"""
+        print("Starting OpenTable Canada restaurant scraper...")
+        print(f"Target: {max_restaurants} restaurants from Toronto, Ontario")
+        
+        for restaurant in self.iter_restaurants(max_restaurants):
+            self.restaurants.append(restaurant)
+            
+            print(f"  {len(self.restaurants)}. {restaurant['name']}")
+            if restaurant['cuisine']:
+                print(f"     Cuisine: {restaurant['cuisine']}")
+            if restaurant['phone']:
+                print(f"     Phone: {restaurant['phone']}")
         
         print(f"\nScraping completed! Found {len(self.restaurants)} restaurants.")
         return self.restaurants
@@ -257,7 +377,8 @@ class OpenTableScraper:
         
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['name', 'url', 'phone', 'cuisine']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            # Streamed records carry every parser field; the CSV keeps the card columns
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
             
             writer.writeheader()
             for restaurant in self.restaurants:
@@ -267,6 +388,8 @@ class OpenTableScraper:
     
     def print_summary(self):
         """Print summary of scraped data"""
+        from opentable_analytics import COVERAGE_FIELDS, RestaurantColumns
+        
         if not self.restaurants:
             print("No restaurants scraped!")
             return
@@ -274,13 +397,17 @@ class OpenTableScraper:
         print(f"\n=== SCRAPING SUMMARY ===")
         print(f"Total restaurants: {len(self.restaurants)}")
         
-        with_phone = sum(1 for r in self.restaurants if r['phone'])
-        with_cuisine = sum(1 for r in self.restaurants if r['cuisine'])
-        with_url = sum(1 for r in self.restaurants if r['url'])
-        
-        print(f"With phone numbers: {with_phone} ({with_phone/len(self.restaurants)*100:.1f}%)")
-        print(f"With cuisine info: {with_cuisine} ({with_cuisine/len(self.restaurants)*100:.1f}%)")
-        print(f"With URLs: {with_url} ({with_url/len(self.restaurants)*100:.1f}%)")
+        report = RestaurantColumns.from_records(self.restaurants).report(top=10)
+        for field, label in COVERAGE_FIELDS[:3]:
+            coverage = report['coverage'][field]
+            print(f"With {label}: {coverage['count']} ({coverage['percent']:.1f}%)")
+        print(f"Page fetches: {self.singleflight.summary()}")
+        print(f"Requests: {self.retrier.summary()}")
+        if self.watchdog is not None:
+            print(f"Memory: {self.watchdog.summary()}")
+        if self.stream_stats['pages']:
+            print(f"Streamed listing pages: {self.stream_stats['pages']}, received "
+                  f"{self.stream_stats['bytes_received']:,} of {self.stream_stats['content_length']:,} bytes on the wire")
         
         print(f"\n=== SAMPLE DATA ===")
         for i, restaurant in enumerate(self.restaurants[:5]):
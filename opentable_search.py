@@ -0,0 +1,305 @@
+"""
+OpenTable Full-Text Search
+==========================
+Inverted index over restaurant names, descriptions, top reviews, cuisines and
+neighborhoods with BM25 ranking
+Postings are stored as sorted int32 document arrays with matching term
+frequencies, concatenated into flat .npy files that are loaded via mmap
+Cuisine and neighborhood filters are postings lists too, so a filtered query
+is an intersection of sorted arrays before any scoring happens
+Usage: python opentable_search.py build opentable_response.html [--archive archive/] [--index restaurants.search]
+       python opentable_search.py query "patio brunch" [--cuisine Italian] [--neighborhood Yorkville]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+
+TOKEN = re.compile(r'[0-9a-z]+')
+HTML_TAG = re.compile(r'<[^>]+>')
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or our the this to was '
+    'we were with you your'.split()
+)
+
+# Text fields that feed BM25; name and cuisine are repeated to weigh them above body text
+TEXT_FIELDS = (('name', 2), ('cuisine', 2), ('neighborhood', 1), ('description', 1), ('top_review', 1))
+
+# Filter terms live in the same vocabulary under a prefix no token can produce
+FILTER_FIELDS = ('cuisine', 'neighborhood')
+
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Lowercased word tokens of a text with HTML tags and stopwords removed"""
+    if not text:
+        return []
+    text = HTML_TAG.sub(' ', text).lower().replace('’', "'")
+    return [token for token in TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def filter_term(field, value):
+    """Vocabulary term for an exact cuisine or neighborhood filter"""
+    return f"{field}={value.strip().lower()}"
+
+
+class Vocabulary(dict):
+    """term -> id mapping that assigns the next id to unseen terms on lookup"""
+    
+    def __missing__(self, term):
+        term_id = self[term] = len(self)
+        return term_id
+
+
+class SearchIndexBuilder:
+    """Accumulates postings as records stream in; save() writes the on-disk index"""
+    
+    def __init__(self):
+        self.vocabulary = Vocabulary()
+        # One (term, doc, tf) triple per posting, in doc order; build() groups them by term
+        self.term_ids = array('i')
+        self.doc_ids = array('i')
+        self.tfs = array('H')
+        self.doc_lengths = array('i')
+        self.restaurant_ids = array('q')
+        self.names = []
+        self._seen = set()
+    
+    def __len__(self):
+        return len(self.doc_lengths)
+    
+    def add(self, restaurant):
+        """Index one restaurant record, skipping ones already indexed; returns its doc id"""
+        key = restaurant.get('restaurant_id') or restaurant.get('url') or restaurant.get('name')
+        if key in self._seen:
+            return None
+        self._seen.add(key)
+        
+        doc = len(self.doc_lengths)
+        tokens = []
+        for field, weight in TEXT_FIELDS:
+            tokens.extend(tokenize(restaurant.get(field)) * weight)
+        counts = Counter(tokens)
+        length = len(tokens)
+        if length > 65535:
+            counts = Counter({term: min(tf, 65535) for term, tf in counts.items()})
+        for field in FILTER_FIELDS:
+            if restaurant.get(field):
+                counts[filter_term(field, restaurant[field])] = 0
+        
+        self.term_ids.extend(map(self.vocabulary.__getitem__, counts))
+        self.doc_ids.extend([doc] * len(counts))
+        self.tfs.extend(counts.values())
+        
+        self.doc_lengths.append(length)
+        self.restaurant_ids.append(int(restaurant.get('restaurant_id') or -1))
+        self.names.append(restaurant.get('name') or '')
+        return doc
+    
+    def add_many(self, restaurants):
+        """Index every record of an iterable, e.g. OpenTableDocumentParser.iter_restaurants()"""
+        added = 0
+        for restaurant in restaurants:
+            if self.add(restaurant) is not None:
+                added += 1
+        return added
+    
+    def build(self):
+        """In-memory SearchIndex of everything added so far"""
+        terms = sorted(self.vocabulary)
+        # Renumber terms alphabetically, then group postings by term; the stable
+        # sort keeps each postings list in doc order, i.e. sorted
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[[self.vocabulary[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+        term_ranks = rank[np.frombuffer(self.term_ids, dtype=np.int32)]
+        order = np.argsort(term_ranks, kind='stable')
+        
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ranks, minlength=len(terms)), out=offsets[1:])
+        
+        return SearchIndex(
+            terms, offsets,
+            np.frombuffer(self.doc_ids, dtype=np.int32)[order],
+            np.frombuffer(self.tfs, dtype=np.uint16)[order],
+            np.frombuffer(self.doc_lengths, dtype=np.int32).copy(),
+            np.frombuffer(self.restaurant_ids, dtype=np.int64).copy(),
+            list(self.names),
+        )
+    
+    def save(self, path):
+        """Write the index to a directory, returns the built SearchIndex"""
+        index = self.build()
+        index.save(path)
+        return index
+
+
+class SearchIndex:
+    ARRAYS = ('offsets', 'docs', 'tfs', 'doc_lengths', 'restaurant_ids')
+    
+    def __init__(self, terms, offsets, docs, tfs, doc_lengths, restaurant_ids, names):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.restaurant_ids = restaurant_ids
+        self.names = names
+        self.doc_count = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.doc_count else 0.0
+    
+    def __len__(self):
+        return self.doc_count
+    
+    def postings(self, term):
+        """(doc ids, term frequencies) for a term, empty arrays if unknown"""
+        i = self.terms.get(term)
+        if i is None:
+            return self.docs[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+    
+    def filter_docs(self, cuisine=None, neighborhood=None):
+        """Sorted doc ids matching every given filter, or None when unfiltered"""
+        allowed = None
+        for field, value in (('cuisine', cuisine), ('neighborhood', neighborhood)):
+            if not value:
+                continue
+            docs = self.postings(filter_term(field, value))[0]
+            allowed = docs if allowed is None else np.intersect1d(allowed, docs, assume_unique=True)
+        return allowed
+    
+    def search(self, query, cuisine=None, neighborhood=None, limit=10):
+        """Top restaurants by BM25 for a text query, as (restaurant_id, name, score) tuples
+        
+        An empty query with filters returns the filtered restaurants unranked
+        """
+        allowed = self.filter_docs(cuisine, neighborhood)
+        terms = list(dict.fromkeys(tokenize(query)))
+        
+        if not terms:
+            if allowed is None:
+                return []
+            return [self._result(doc, 0.0) for doc in allowed[:limit].tolist()]
+        
+        if allowed is not None and not len(allowed):
+            return []
+        
+        doc_parts = []
+        score_parts = []
+        for term in terms:
+            docs, tfs = self.postings(term)
+            idf = math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            if allowed is not None and len(docs):
+                # Both arrays are sorted, so intersecting is a binary search of
+                # the shorter one into the longer
+                if len(allowed) < len(docs):
+                    positions = np.minimum(np.searchsorted(docs, allowed), len(docs) - 1)
+                    positions = positions[docs[positions] == allowed]
+                else:
+                    positions = np.minimum(np.searchsorted(allowed, docs), len(allowed) - 1)
+                    positions = np.flatnonzero(allowed[positions] == docs)
+                docs, tfs = docs[positions], tfs[positions]
+            if not len(docs):
+                continue
+            
+            tf = tfs.astype(np.float32)
+            norm = K1 * (1 - B + B * self.doc_lengths[docs] / self.avg_length)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (K1 + 1) / (tf + norm))
+        
+        if not doc_parts:
+            return []
+        
+        # Sum per-term scores of the same document
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        if len(doc_parts) > 1:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores, minlength=len(docs))
+        
+        if len(docs) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self._result(doc, score) for doc, score in zip(docs[top].tolist(), scores[top].tolist())]
+    
+    def _result(self, doc, score):
+        """(restaurant_id, name, score) for a doc id"""
+        return int(self.restaurant_ids[doc]), self.names[doc], score
+    
+    def save(self, path):
+        """Write the index as .npy arrays plus a JSON vocabulary and name list"""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        terms = sorted(self.terms, key=self.terms.get)
+        with open(os.path.join(path, 'terms.json'), 'w', encoding='utf-8') as file:
+            json.dump(terms, file)
+        with open(os.path.join(path, 'names.json'), 'w', encoding='utf-8') as file:
+            json.dump(self.names, file)
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved index; with mmap the postings are paged in on demand"""
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None)
+            for name in cls.ARRAYS
+        }
+        with open(os.path.join(path, 'terms.json'), 'r', encoding='utf-8') as file:
+            terms = json.load(file)
+        with open(os.path.join(path, 'names.json'), 'r', encoding='utf-8') as file:
+            names = json.load(file)
+        return cls(terms, arrays['offsets'], arrays['docs'], arrays['tfs'],
+                   arrays['doc_lengths'], arrays['restaurant_ids'], names)
+
+
+def main():
+    """Build a search index from saved pages, or query one"""
+    parser = argparse.ArgumentParser(description="OpenTable restaurant full-text search")
+    parser.add_argument('--index', default='restaurants.search', help="Index directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    build_parser = subparsers.add_parser('build', help="Index saved listing pages")
+    build_parser.add_argument('files', nargs='*', default=['opentable_response.html'])
+    build_parser.add_argument('--archive', help="Also index every page in this archive directory")
+    
+    query_parser = subparsers.add_parser('query', help="Search the index")
+    query_parser.add_argument('text', nargs='?', default='')
+    query_parser.add_argument('--cuisine')
+    query_parser.add_argument('--neighborhood')
+    query_parser.add_argument('--limit', type=int, default=10)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'build':
+        from opentable_parser import OpenTableDocumentParser
+        document_parser = OpenTableDocumentParser()
+        builder = SearchIndexBuilder()
+        for path in args.files:
+            builder.add_many(document_parser.iter_restaurants(path))
+        if args.archive:
+            builder.add_many(document_parser.iter_archived_restaurants(args.archive))
+        index = builder.save(args.index)
+        print(f"Indexed {len(index)} restaurants ({len(index.terms)} terms) into {args.index}")
+        return
+    
+    index = SearchIndex.load(args.index)
+    results = index.search(args.text, cuisine=args.cuisine, neighborhood=args.neighborhood, limit=args.limit)
+    for restaurant_id, name, score in results:
+        print(f"{score:6.2f}  {name} ({restaurant_id})")
+    print(f"\n{len(results)} restaurants found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+OpenTable Request Coalescing
+============================
+Singleflight in front of page fetches: concurrent callers asking for the same
+resource share one in-flight request and its result (or its exception)
+URLs are canonicalized first, so variants such as a trailing slash, tracking
+parameters, a fragment or reordered query strings count as the same resource
+Nothing is cached: once a request finishes, the next caller fetches again
+"""
+
+import threading
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+# Query parameters that never change the page content
+IGNORED_PARAMS = frozenset(['corrid', 'ref', 'fbclid', 'gclid', 'msclkid'])
+IGNORED_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url):
+    """Normalized form of a URL used as the coalescing key
+    
+    Scheme and host are lowercased, default ports, fragments and tracking
+    parameters are dropped, the remaining query is sorted, and a trailing
+    slash is removed. Restaurant profiles (/r/<slug>) ignore the query
+    entirely, since date, time and party size don't change the phone or cuisine.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+    
+    if path.startswith('/r/'):
+        query = ''
+    else:
+        params = [
+            (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in IGNORED_PARAMS and not key.lower().startswith(IGNORED_PREFIXES)
+        ]
+        query = urlencode(sorted(params))
+    
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'executed': 0, 'coalesced': 0}
+    
+    def do(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) unless a call for key is already running, then share its outcome"""
+        with self._lock:
+            self.stats['calls'] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+    
+    def _release(self, key):
+        """Forget a finished call so the next caller starts a fresh one"""
+        with self._lock:
+            del self._inflight[key]
+    
+    def summary(self):
+        """One-line description of the duplicate suppression so far"""
+        return (f"{self.stats['calls']} fetches requested, {self.stats['executed']} sent, "
+                f"{self.stats['coalesced']} coalesced")
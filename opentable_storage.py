@@ -0,0 +1,304 @@
+"""
+OpenTable Restaurant Storage
+============================
+SQLite storage backend for scraped restaurant records
+Upserts records keyed by canonical profile URL (falling back to restaurantId, then name),
+so parser output, scraper CSVs and crawl runs all merge into one row per restaurant
+Indexes: metro, cuisine and E.164 phone number
+Usage: python opentable_storage.py import toronto_restaurants.csv
+       python opentable_storage.py query --cuisine Italian
+"""
+
+import argparse
+import csv
+import json
+import re
+import sqlite3
+import time
+
+from opentable_phone import to_e164
+from opentable_singleflight import canonical_url
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    record_key TEXT PRIMARY KEY,
+    restaurant_id INTEGER,
+    name TEXT NOT NULL,
+    url TEXT NOT NULL DEFAULT '',
+    phone TEXT NOT NULL DEFAULT '',
+    phone_normalized TEXT NOT NULL DEFAULT '',
+    cuisine TEXT NOT NULL DEFAULT '',
+    metro_id INTEGER,
+    extra TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_restaurants_metro ON restaurants (metro_id);
+CREATE INDEX IF NOT EXISTS idx_restaurants_cuisine ON restaurants (cuisine COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_restaurants_phone ON restaurants (phone_normalized);
+CREATE INDEX IF NOT EXISTS idx_restaurants_id ON restaurants (restaurant_id);
+"""
+
+# One statement text for every upsert so sqlite3's statement cache keeps it prepared.
+# Empty incoming values never overwrite data collected by an earlier run.
+UPSERT_SQL = """
+INSERT INTO restaurants (
+    record_key, restaurant_id, name, url, phone, phone_normalized,
+    cuisine, metro_id, extra, updated_at
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (record_key) DO UPDATE SET
+    restaurant_id = COALESCE(excluded.restaurant_id, restaurants.restaurant_id),
+    name = COALESCE(NULLIF(excluded.name, ''), restaurants.name),
+    url = COALESCE(NULLIF(excluded.url, ''), restaurants.url),
+    phone = COALESCE(NULLIF(excluded.phone, ''), restaurants.phone),
+    phone_normalized = COALESCE(NULLIF(excluded.phone_normalized, ''), restaurants.phone_normalized),
+    cuisine = COALESCE(NULLIF(excluded.cuisine, ''), restaurants.cuisine),
+    metro_id = COALESCE(excluded.metro_id, restaurants.metro_id),
+    extra = COALESCE(excluded.extra, restaurants.extra),
+    updated_at = excluded.updated_at
+"""
+
+CORE_FIELDS = ('restaurant_id', 'name', 'url', 'phone', 'cuisine', 'metro_id')
+
+# Profile URLs canonical_url() would return unchanged; most records match, and urlsplit is most of a row's cost
+CANONICAL_PROFILE_URL = re.compile(r'https?://[a-z0-9.-]+/r/[^?#]*[^/?#]\Z')
+
+# PRAGMA user_version of the current key scheme; older stores are re-keyed on open
+STORE_VERSION = 1
+
+
+class RestaurantStore:
+    def __init__(self, db_path="restaurants.db", batch_size=5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(db_path, cached_statements=256)
+        
+        # WAL lets readers query while a crawl is writing; NORMAL sync is safe under WAL
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+    
+    def _migrate(self):
+        """Re-key rows from stores written before keys were canonical URLs, merging the duplicates
+        
+        Those stores keyed parser records on id:<restaurantId> and CSV rows on
+        url:<url>, so one restaurant could hold two rows. Rows are replayed
+        oldest first, so the newest non-empty values win
+        """
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= STORE_VERSION:
+            return
+        rows = self.conn.execute(
+            "SELECT record_key, restaurant_id, name, url, phone, cuisine, metro_id, extra, updated_at "
+            "FROM restaurants ORDER BY updated_at"
+        ).fetchall()
+        with self.conn:
+            for record_key, *row, updated_at in rows:
+                new_row = self.record_to_row(self._row_to_record(row), updated_at)
+                if new_row[0] != record_key:
+                    self.conn.execute("DELETE FROM restaurants WHERE record_key = ?", (record_key,))
+                    self.conn.execute(UPSERT_SQL, new_row)
+            self.conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+    
+    def close(self):
+        """Close the underlying database connection"""
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def record_to_row(self, restaurant, now=None):
+        """Convert a restaurant dict into an upsert parameter tuple"""
+        restaurant_id = restaurant.get('restaurant_id') or None
+        if restaurant_id is not None:
+            restaurant_id = int(restaurant_id)
+        
+        # Every source has the profile URL but only parser records carry the id
+        url = restaurant.get('url') or ''
+        if url:
+            record_key = f"url:{url if CANONICAL_PROFILE_URL.match(url) else canonical_url(url)}"
+        elif restaurant_id is not None:
+            record_key = f"id:{restaurant_id}"
+        else:
+            record_key = f"name:{restaurant.get('name', '')}"
+        
+        metro_id = restaurant.get('metro_id') or None
+        if metro_id is not None:
+            metro_id = int(metro_id)
+        
+        # Anything beyond the indexed columns is kept as JSON so no data is lost
+        extra = {k: v for k, v in restaurant.items() if k not in CORE_FIELDS and v not in ('', None)}
+        phone = restaurant.get('phone') or ''
+        
+        return (
+            record_key,
+            restaurant_id,
+            restaurant.get('name') or '',
+            restaurant.get('url') or '',
+            phone,
+            to_e164(phone),
+            restaurant.get('cuisine') or '',
+            metro_id,
+            json.dumps(extra, separators=(',', ':')) if extra else None,
+            now if now is not None else time.time(),
+        )
+    
+    def upsert(self, restaurant):
+        """Insert or merge a single restaurant record"""
+        return self.upsert_many([restaurant])
+    
+    def upsert_many(self, restaurants):
+        """Insert or merge records in batched transactions, returns the count written"""
+        written = 0
+        batch = []
+        now = time.time()
+        
+        for restaurant in restaurants:
+            if not restaurant.get('name'):
+                continue
+            batch.append(self.record_to_row(restaurant, now))
+            if len(batch) >= self.batch_size:
+                written += self._write_batch(batch)
+                batch = []
+        
+        if batch:
+            written += self._write_batch(batch)
+        
+        return written
+    
+    def _write_batch(self, rows):
+        """Write one batch of rows inside a single transaction"""
+        with self.conn:
+            self.conn.executemany(UPSERT_SQL, rows)
+        return len(rows)
+    
+    def import_csv(self, filepath):
+        """Bulk-import an existing scraper CSV such as toronto_restaurants.csv"""
+        print(f"Importing {filepath} into {self.db_path}")
+        
+        with open(filepath, 'r', newline='', encoding='utf-8') as csvfile:
+            count = self.upsert_many(csv.DictReader(csvfile))
+        
+        print(f"Imported {count} restaurants")
+        return count
+    
+    def find(self, phone=None, cuisine=None, metro_id=None, name=None, limit=100):
+        """Query restaurants using the indexed columns"""
+        clauses = []
+        params = []
+        
+        if phone:
+            normalized = to_e164(phone)
+            if not normalized:
+                # Rows without a phone store '', so an unparseable number would match all of them
+                return []
+            clauses.append("phone_normalized = ?")
+            params.append(normalized)
+        if cuisine:
+            clauses.append("cuisine = ? COLLATE NOCASE")
+            params.append(cuisine)
+        if metro_id is not None:
+            clauses.append("metro_id = ?")
+            params.append(int(metro_id))
+        if name:
+            clauses.append("name LIKE ?")
+            params.append(f"%{name}%")
+        
+        sql = "SELECT restaurant_id, name, url, phone, cuisine, metro_id, extra FROM restaurants"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY name LIMIT ?"
+        params.append(limit)
+        
+        return [self._row_to_record(row) for row in self.conn.execute(sql, params)]
+    
+    def get_many(self, restaurant_ids):
+        """Fetch stored restaurants by restaurantId"""
+        results = []
+        ids = [int(restaurant_id) for restaurant_id in restaurant_ids]
+        # Stay well under SQLite's host parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            sql = ("SELECT restaurant_id, name, url, phone, cuisine, metro_id, extra FROM restaurants "
+                   f"WHERE restaurant_id IN ({', '.join('?' * len(chunk))})")
+            results.extend(self._row_to_record(row) for row in self.conn.execute(sql, chunk))
+        return results
+    
+    def _row_to_record(self, row):
+        """Turn a selected row back into a restaurant dict"""
+        restaurant_id, name, url, phone, cuisine, metro_id, extra = row
+        restaurant = json.loads(extra) if extra else {}
+        restaurant.update({
+            'restaurant_id': restaurant_id,
+            'name': name,
+            'url': url,
+            'phone': phone,
+            'cuisine': cuisine,
+            'metro_id': metro_id,
+        })
+        return restaurant
+    
+    def count(self):
+        """Number of stored restaurants"""
+        return self.conn.execute("SELECT COUNT(*) FROM restaurants").fetchone()[0]
+    
+    def iter_all(self):
+        """Yield every stored restaurant"""
+        sql = "SELECT restaurant_id, name, url, phone, cuisine, metro_id, extra FROM restaurants"
+        for row in self.conn.execute(sql):
+            yield self._row_to_record(row)
+
+
+def main():
+    """Command line interface for importing and querying the store"""
+    parser = argparse.ArgumentParser(description="OpenTable restaurant SQLite store")
+    parser.add_argument('--db', default='restaurants.db', help="SQLite database path")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    import_parser = subparsers.add_parser('import', help="Bulk-import scraper CSV files")
+    import_parser.add_argument('csv_files', nargs='+')
+    
+    query_parser = subparsers.add_parser('query', help="Look up stored restaurants")
+    query_parser.add_argument('--phone')
+    query_parser.add_argument('--cuisine')
+    query_parser.add_argument('--metro', type=int)
+    query_parser.add_argument('--name')
+    query_parser.add_argument('--limit', type=int, default=50)
+    query_parser.add_argument('--json', action='store_true', help="Print results as JSON lines")
+    
+    subparsers.add_parser('count', help="Print the number of stored restaurants")
+    
+    args = parser.parse_args()
+    
+    with RestaurantStore(args.db) as store:
+        if args.command == 'import':
+            for csv_file in args.csv_files:
+                store.import_csv(csv_file)
+            print(f"Store now holds {store.count()} restaurants")
+        
+        elif args.command == 'query':
+            results = store.find(
+                phone=args.phone,
+                cuisine=args.cuisine,
+                metro_id=args.metro,
+                name=args.name,
+                limit=args.limit,
+            )
+            for restaurant in results:
+                if args.json:
+                    print(json.dumps(restaurant))
+                else:
+                    print(f"{restaurant['name']} | {restaurant['phone'] or 'N/A'} | "
+                          f"{restaurant['cuisine'] or 'N/A'} | {restaurant['url']}")
+            print(f"\n{len(results)} restaurants found")
+        
+        elif args.command == 'count':
+            print(store.count())
+
+
+if __name__ == "__main__":
+    main()
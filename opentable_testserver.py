@@ -0,0 +1,455 @@
+"""
+OpenTable Local Test Server
+===========================
+Threaded local stand-in for opentable.ca used by benchmarks and manual testing
+Serves listing pages with restaurant cards and primary-window-vars JSON,
+plus /r/<slug> profile pages, with optional latency injection, bandwidth
+throttling, fault injection (error statuses, reset connections, hangs and
+empty interstitial pages) and hit counting; ChangingSite adds pages that
+change at known rates on a simulated clock, and StaticFiles serves files
+such as photos with ETag and Last-Modified validators
+"""
+
+import bisect
+import html
+import json
+import random
+import socket
+import struct
+import threading
+import zlib
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+GRAPHQL_PATH = "/dapi/fe/gql"
+
+
+class LocalOpenTableServer:
+    def __init__(self, restaurants=None, page_size=20, latency=0.0, routes=None,
+                 max_batch_size=None, per_item_latency=0.0, bytes_per_second=None, faults=None,
+                 retry_after=None, hang_seconds=5.0):
+        # Raw restaurant objects in the same shape as lolzViewAll.searchResults.restaurants
+        if restaurants is None:
+            from opentable_benchmarks import synthetic_restaurants
+            restaurants = list(synthetic_restaurants(100))
+        self.restaurants = restaurants
+        self.page_size = page_size
+        self.latency = latency
+        self.routes = routes or {}
+        # GraphQL endpoint limits: larger batches get a 413, each item adds latency
+        self.max_batch_size = max_batch_size
+        self.per_item_latency = per_item_latency
+        # Bodies are trickled out at this rate when set, to mimic a slow link
+        self.bytes_per_second = bytes_per_second
+        self.chunk_size = 16384
+        # {request path prefix, query included: fault}, first match wins. A fault is
+        # an HTTP status, 'reset' (drop the connection unanswered), 'hang' (sleep
+        # hang_seconds, then answer normally) or 'empty' (a 200 page with no
+        # restaurants, like a bot-check interstitial). A list gives the fault for
+        # the n-th request to the same path and query, normal service past its
+        # end; a callable gets (request, parsed, n) and returns a fault or None
+        self.faults = faults or {}
+        # Retry-After seconds sent with injected 429 and 503 responses
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds
+        self.faulted = Counter()
+        self.path_hits = Counter()
+        self.hits = Counter()
+        self.aborted = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.by_slug = {self.slug_for(r): r for r in restaurants}
+    
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        """Start serving on an ephemeral localhost port"""
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                server.handle(self)
+            
+            def do_POST(self):
+                server.handle(self)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Shut the server down"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def slug_for(self, restaurant):
+        """Profile slug of a raw restaurant object"""
+        link = restaurant['urls']['profileLink']['link']
+        return link.rstrip('/').rsplit('/', 1)[-1]
+    
+    def handle(self, request):
+        """Dispatch one request to a custom route or the built-in pages"""
+        parsed = urlparse(request.path)
+        with self._lock:
+            self.hits[parsed.path] += 1
+            hit = self.path_hits[request.path]
+            self.path_hits[request.path] += 1
+        
+        if self.latency:
+            time.sleep(self.latency)
+        
+        fault = self.fault_for(request, parsed, hit)
+        if fault is not None:
+            with self._lock:
+                self.faulted[fault] += 1
+        if fault == 'reset':
+            # Zero linger turns the close into a RST, so the client sees a reset rather than a clean EOF
+            request.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            request.close_connection = True
+            return
+        if fault == 'hang':
+            time.sleep(self.hang_seconds)
+        elif fault == 'empty':
+            self.send(request, 200, {}, "<html><head><title>Just a moment...</title></head><body></body></html>")
+            return
+        elif isinstance(fault, int):
+            headers = {}
+            if fault in (429, 503) and self.retry_after is not None:
+                headers['Retry-After'] = str(self.retry_after)
+            self.send(request, fault, headers, f"<html><body>Error {fault}</body></html>")
+            return
+        
+        route = self.routes.get(parsed.path)
+        if route:
+            status, headers, body = route(request, parsed)
+        elif parsed.path == GRAPHQL_PATH:
+            status, headers, body = self.graphql_response(request)
+        elif parsed.path.startswith('/r/'):
+            status, headers, body = self.profile_page(parsed)
+        else:
+            status, headers, body = self.listing_page(parsed)
+        
+        self.send(request, status, headers, body)
+    
+    def fault_for(self, request, parsed, hit):
+        """Fault to inject for this request, or None to serve it normally"""
+        for prefix, fault in self.faults.items():
+            if not request.path.startswith(prefix):
+                continue
+            if callable(fault):
+                return fault(request, parsed, hit)
+            if isinstance(fault, (list, tuple)):
+                return fault[hit] if hit < len(fault) else None
+            return fault
+        return None
+    
+    def send(self, request, status, headers, body):
+        """Write a complete response"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        request.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        if request.command == 'HEAD':
+            return
+        
+        sent = 0
+        try:
+            if not self.bytes_per_second:
+                request.wfile.write(body)
+                sent = len(body)
+            else:
+                for start in range(0, len(body), self.chunk_size):
+                    chunk = body[start:start + self.chunk_size]
+                    request.wfile.write(chunk)
+                    request.wfile.flush()
+                    sent += len(chunk)
+                    time.sleep(len(chunk) / self.bytes_per_second)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, e.g. a streaming parser that had what it needed
+            request.close_connection = True
+            with self._lock:
+                self.aborted += 1
+        finally:
+            with self._lock:
+                self.bytes_sent += sent
+    
+    def listing_page(self, parsed):
+        """Listing page with restaurant cards and the primary-window-vars JSON"""
+        query = parse_qs(parsed.query)
+        page = int(query.get('page', ['1'])[0])
+        start = (page - 1) * self.page_size
+        page_restaurants = self.restaurants[start:start + self.page_size]
+        
+        if not page_restaurants:
+            return 404, {}, "<html><body>Not found</body></html>"
+        
+        state = {
+            'windowVariables': {
+                '__INITIAL_STATE__': {
+                    'lolzViewAll': {
+                        'searchResults': {
+                            'totalRestaurantCount': len(self.restaurants),
+                            'restaurants': page_restaurants
+                        },
+                        'pageNumber': page
+                    }
+                }
+            }
+        }
+        
+        cards = []
+        for restaurant in page_restaurants:
+            link = restaurant['urls']['profileLink']['link']
+            cards.append(
+                '<div data-test="restaurant-card">'
+                f'<a data-test="restaurant-card-title" href="{link}">{html.escape(restaurant["name"])}</a>'
+                f'<span class="cuisine">{html.escape(restaurant["primaryCuisine"]["name"])}</span>'
+                '</div>'
+            )
+        
+        body = (
+            '<!DOCTYPE html><html><head><title>Restaurants</title>'
+            '<script id="primary-window-vars" type="application/json">'
+            f'{html.escape(json.dumps(state), quote=False)}</script></head>'
+            f'<body><main>{"".join(cards)}</main></body></html>'
+        )
+        return 200, {}, body
+    
+    def profile_page(self, parsed):
+        """Restaurant profile page with a tel: link"""
+        slug = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        restaurant = self.by_slug.get(slug)
+        if not restaurant:
+            return 404, {}, "<html><body>Not found</body></html>"
+        
+        phone = restaurant['contactInformation']['phoneNumber']
+        cuisine = restaurant['primaryCuisine']['name']
+        body = (
+            f'<!DOCTYPE html><html><head><title>{html.escape(restaurant["name"])}</title></head><body>'
+            f'<h1>{html.escape(restaurant["name"])}</h1>'
+            f'<a href="tel:{phone}" data-test="phone">{phone}</a>'
+            f'<p class="cuisine">{html.escape(cuisine)}</p>'
+            f'<p>{html.escape(restaurant["description"])}</p>'
+            '</body></html>'
+        )
+        return 200, {}, body
+    
+    def graphql_response(self, request):
+        """GraphQL-style JSON endpoint dispatched on operationName"""
+        length = int(request.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(request.rfile.read(length) or b'{}')
+        except ValueError:
+            return 400, {'Content-Type': 'application/json'}, '{"errors": [{"message": "bad json"}]}'
+        
+        operation = payload.get('operationName')
+        variables = payload.get('variables') or {}
+        
+        if operation == 'RestaurantsAvailability':
+            ids = variables.get('restaurantIds') or []
+            if self.max_batch_size and len(ids) > self.max_batch_size:
+                return 413, {'Content-Type': 'application/json'}, '{"errors": [{"message": "batch too large"}]}'
+            if self.per_item_latency:
+                time.sleep(self.per_item_latency * len(ids))
+            data = {'availability': [self.availability_for(restaurant_id) for restaurant_id in ids]}
+        elif operation == 'RestaurantsDetails':
+            ids = set(variables.get('restaurantIds') or [])
+            wanted = [r for r in self.restaurants if r['restaurantId'] in ids]
+            slugs = variables.get('slugs') or []
+            wanted += [self.by_slug[slug] for slug in slugs if slug in self.by_slug]
+            data = {'restaurants': [self.details_for(restaurant) for restaurant in wanted]}
+        else:
+            return 400, {'Content-Type': 'application/json'}, '{"errors": [{"message": "unknown operation"}]}'
+        
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'data': data})
+    
+    def availability_for(self, restaurant_id):
+        """Deterministic slots around the requested time for a restaurant"""
+        seed = zlib.crc32(str(restaurant_id).encode())
+        slots = [
+            {'isAvailable': (seed >> (index % 16)) & 1 == 1, 'timeOffsetMinutes': offset}
+            for index, offset in enumerate(range(-60, 75, 15))
+        ]
+        return {
+            'restaurantId': restaurant_id,
+            'availabilityDays': [{'dayOffset': 0, 'slots': slots}]
+        }
+    
+    def details_for(self, restaurant):
+        """Detail fields in the same JSON shape as the saved listing page"""
+        return {
+            'restaurantId': restaurant['restaurantId'],
+            'urls': restaurant['urls'],
+            'contactInformation': restaurant['contactInformation'],
+            'primaryCuisine': restaurant['primaryCuisine'],
+            '__typename': 'Restaurant'
+        }
+
+
+class SimulatedClock:
+    """Virtual time for simulations; sleep() advances it instantly"""
+    
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += max(seconds, 0.0)
+
+
+class ChangingSite:
+    """Pages whose content changes as Poisson processes with known rates
+    
+    Change times are drawn up front, so the version a page shows at any
+    moment on the shared clock is known exactly and a crawler's freshness
+    can be measured against it. Like the real site, pages also carry
+    content that moves on every request without the restaurant changing:
+    a per-request token, live booking and review counts, and ratings.
+    """
+    
+    def __init__(self, pages, clock, horizon, seed=0):
+        # pages: {path: (kind, changes per second)}
+        rng = random.Random(seed)
+        self.pages = pages
+        self.clock = clock
+        self.change_times = {}
+        start = clock()
+        for path, (kind, rate) in pages.items():
+            times = []
+            t = start
+            while rate > 0:
+                t += rng.expovariate(rate)
+                if t > start + horizon:
+                    break
+                times.append(t)
+            self.change_times[path] = times
+        self.profiles = [path for path, (kind, _) in pages.items() if kind == 'profile']
+        self.noise = random.Random(seed + 1)
+    
+    def version(self, path, at=None):
+        """Number of changes a page has gone through by a given time"""
+        return bisect.bisect_right(self.change_times[path], self.clock() if at is None else at)
+    
+    def routes(self):
+        """Routes for LocalOpenTableServer serving every page"""
+        return {path: self.respond for path in self.pages}
+    
+    def respond(self, request, parsed):
+        path = parsed.path
+        kind, _ = self.pages[path]
+        version = self.version(path)
+        nonce = time.perf_counter_ns()
+        if kind == 'profile':
+            # The hours are the changing content; the token and booking count are noise
+            body = (
+                f'<html><head><meta name="csrf-token" content="{nonce}"></head><body>'
+                f'<h1>Restaurant {path.rsplit("/", 1)[-1]}</h1>'
+                f'<p data-test="hours">Open daily 11:00-22:00, schedule {version}</p>'
+                f'<p>Booked {self.noise.randint(0, 200)} times today</p>'
+                '</body></html>'
+            )
+            return 200, {}, body
+        
+        # Each listing page links a few profiles, and which ones is its changing content
+        index = sum(map(ord, path))
+        count = len(self.profiles)
+        linked = [self.profiles[(index + version + i) % count] for i in range(3)] if count else []
+        state = {'windowVariables': {'__INITIAL_STATE__': {'lolzViewAll': {'searchResults': {'restaurants': [
+            {
+                'restaurantId': zlib.crc32(link.encode()),
+                'name': f"Restaurant {link.rsplit('/', 1)[-1]}",
+                'urls': {'profileLink': {'link': link}},
+                'statistics': {
+                    'recentReservationCount': self.noise.randint(0, 200),
+                    'reviews': {
+                        'allTimeTextReviewCount': self.noise.randint(100, 3000),
+                        'ratings': {'overall': {'rating': round(self.noise.uniform(3.5, 5.0), 1)}},
+                    },
+                },
+            }
+            for link in linked
+        ]}}}}}
+        body = (
+            '<!DOCTYPE html><html><head>'
+            '<script id="primary-window-vars" type="application/json">'
+            f'{html.escape(json.dumps(state), quote=False)}</script></head>'
+            f'<body data-request="{nonce}"></body></html>'
+        )
+        return 200, {}, body
+
+
+class StaticFiles:
+    """Files served with ETag and Last-Modified, answering conditional requests with 304"""
+    
+    def __init__(self, files, content_type='image/jpeg', modified=None):
+        # {path: bytes}; replacing a body changes its ETag
+        self.files = files
+        self.content_type = content_type
+        self.modified = modified or time.time()
+        self.not_modified = 0
+        self._lock = threading.Lock()
+    
+    def routes(self):
+        """Routes for LocalOpenTableServer serving every file"""
+        return {path: self.respond for path in self.files}
+    
+    def etag(self, body):
+        return f'"{zlib.crc32(body):08x}-{len(body)}"'
+    
+    def respond(self, request, parsed):
+        body = self.files[parsed.path]
+        etag = self.etag(body)
+        headers = {
+            'Content-Type': self.content_type,
+            'ETag': etag,
+            'Last-Modified': formatdate(self.modified, usegmt=True),
+        }
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_none_match is not None:
+            unchanged = etag in [tag.strip() for tag in if_none_match.split(',')]
+        elif if_modified_since:
+            try:
+                unchanged = parsedate_to_datetime(if_modified_since).timestamp() >= int(self.modified)
+            except (TypeError, ValueError):
+                unchanged = False
+        else:
+            unchanged = False
+        
+        if unchanged:
+            with self._lock:
+                self.not_modified += 1
+            return 304, headers, b''
+        return 200, headers, body
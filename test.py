@@ -53,3 +53,9 @@ with requests.Session() as s:
         print("Saved HTML to opentable_response.html")
     else:
         print("Non-HTML response; saved raw bytes to opentable_response.bin")
+
+    # Also keep a compressed copy of every capture in the response archive
+    from opentable_archive import ArchiveWriter
+    with ArchiveWriter("archive") as archive:
+        entry = archive.add_response(r)
+    print(f"Archived {entry['size']:,} bytes as {entry['length']:,} in archive/")